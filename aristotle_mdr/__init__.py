@@ -1 +1,3 @@
-default_app_config = 'aristotle_mdr.apps.AristotleMDRConfig'
\ No newline at end of file
+from aristotle_mdr.bulk import bulk_mode
+
+default_app_config = 'aristotle_mdr.apps.AristotleMDRConfig'
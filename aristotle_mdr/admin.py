@@ -27,7 +27,7 @@ class StatusInline(admin.TabularInline):
     def get_queryset(self, request):
         qs = super(StatusInline, self).get_queryset(request)
         if not request.user.is_superuser:
-            qs = qs.filter(registrationAuthority__in=request.user.registrar_in.all())
+            qs = qs.filter(registrationAuthority__in=perms.get_principal(request.user).registrar_authority_ids)
         return qs
 
     def has_change_permission(self, request,obj=None):
@@ -6,4 +6,7 @@ class AristotleExtensionBaseConfig(AppConfig):
 class AristotleMDRConfig(AristotleExtensionBaseConfig):
     name = 'aristotle_mdr'
     verbose_name = "Aristotle Metadata Registry"
-    
+
+    def ready(self):
+        from aristotle_mdr import concept_types
+        concept_types.build()
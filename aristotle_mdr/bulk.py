@@ -0,0 +1,121 @@
+"""
+Batching the work done after saves
+==================================
+
+Saving an item or a status sends signals that notify watchers, recompute the
+cached states of the item, update the visibility table and reindex the item for
+search. That is fine for a single edit, but imports and other bulk changes end up
+doing all of it once per save. Inside ``bulk_mode`` those handlers only record which
+items were affected, and the work is done once for each item, in batches, at the end::
+
+    import aristotle_mdr
+
+    with aristotle_mdr.bulk_mode():
+        for row in rows:
+            ObjectClass.objects.create(...)
+
+    @aristotle_mdr.bulk_mode()
+    def import_items(rows):
+        ...
+
+The block is run in a transaction, and the deferred work is done just before it is
+committed. If the block raises an exception the transaction is rolled back and the
+deferred work is thrown away. Nested blocks are merged into the outermost one.
+Deletions are still handled straight away, as the items are gone by the end.
+"""
+import functools
+import sys
+import threading
+
+_state = threading.local()
+
+def active():
+    return getattr(_state,'pending',None) is not None
+
+def defer(kind,concept_id,created=False):
+    """
+    Records that the handler for ``kind`` needs to run for an item, returning ``True``
+    if it was deferred, or ``False`` if the caller should carry on as normal because
+    no ``bulk_mode`` block is running. ``kind`` is one of ``'changed'``, ``'recache'``,
+    ``'visibility'`` or ``'reindex'``.
+    """
+    pending = getattr(_state,'pending',None)
+    if pending is None:
+        return False
+    if kind == 'changed':
+        pending['changed'][concept_id] = pending['changed'].get(concept_id,False) or created
+    else:
+        pending[kind].add(concept_id)
+    return True
+
+def replay(pending):
+    """
+    Does the deferred work for a finished ``bulk_mode`` block. Cached states are
+    recomputed first, so the visibility table and search index see the new values.
+    """
+    from aristotle_mdr.models import (
+        _batches, _concept, ConceptChange, rebuild_concept_visibility, visibility_table_enabled
+    )
+    from aristotle_mdr.signals import update_search_index
+
+    for batch in _batches(sorted(pending['recache'])):
+        concepts = _concept.objects.filter(pk__in=batch)
+        concepts.recache_states()
+        concepts.recache_registration_summary()
+    if visibility_table_enabled():
+        for batch in _batches(sorted(pending['visibility'])):
+            rebuild_concept_visibility(_concept.objects.filter(pk__in=batch))
+    if pending['reindex']:
+        update_search_index(sorted(pending['reindex']))
+
+    # Items created and deleted inside the block have nobody left to notify.
+    changed = pending['changed']
+    existing = set()
+    for batch in _batches(sorted(changed)):
+        existing.update(_concept.objects.filter(pk__in=batch).values_list('pk',flat=True))
+    ConceptChange.objects.bulk_create(
+        [ConceptChange(concept_id=pk,created=changed[pk]) for pk in sorted(existing)],
+        batch_size=500
+    )
+    return bool(existing)
+
+class bulk_mode(object):
+    """
+    A context manager, or decorator, that defers the handlers run after each save
+    until the end of the block. See the module documentation for details.
+    """
+    def __enter__(self):
+        from django.db import transaction
+        self.outermost = not active()
+        if self.outermost:
+            _state.pending = {'changed':{},'recache':set(),'visibility':set(),'reindex':set()}
+        self.atomic = transaction.atomic()
+        self.atomic.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        from aristotle_mdr import fanout
+        if not self.outermost:
+            return self.atomic.__exit__(exc_type, exc_value, traceback)
+        pending = _state.pending
+        # Stop deferring first, so saves made while replaying are handled normally.
+        _state.pending = None
+        notify = False
+        if exc_type is None:
+            try:
+                notify = replay(pending)
+            except Exception:
+                self.atomic.__exit__(*sys.exc_info())
+                raise
+        result = self.atomic.__exit__(exc_type, exc_value, traceback)
+        if notify:
+            # Only started once committed, so a background worker can see the changes.
+            fanout.start()
+        return result
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with bulk_mode():
+                return func(*args, **kwargs)
+        return inner
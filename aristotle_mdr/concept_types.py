@@ -0,0 +1,95 @@
+"""
+Registry of item types
+======================
+
+The types of item provided by Aristotle and the apps listed in ``CONTENT_EXTENSIONS``
+are collected once, when the apps are ready, into a ``ConceptTypes`` registry. Pages
+that list every type of item, and ``type:`` tokens in searches, look types up in the
+registry instead of querying ``ContentType`` and building the lookups on each request::
+
+    from aristotle_mdr.concept_types import get_concept_types
+
+    get_concept_types().find('dec')  # (DataElementConcept,)
+
+A ``type:`` token matches a type by its model name, its verbose name without spaces,
+or its short code, the first letter of each word of its verbose name. Underscores and
+hyphens in the token are ignored, so ``type:data_element`` finds data elements.
+"""
+from collections import OrderedDict
+
+_registry = None
+
+def normalise_token(token):
+    return token.lower().replace('_','').replace('-','').replace(' ','')
+
+def short_code(model):
+    return "".join(word[0] for word in model._meta.verbose_name.split()).lower()
+
+class ConceptTypes(object):
+    """
+    The models of a list of apps, in app order. ``models`` are all the models whose names
+    don't start with an underscore, and ``concepts`` the ones that are types of item.
+    The registry isn't changed once built, so it can be shared between threads.
+    """
+    def __init__(self,app_labels):
+        from django.apps import apps
+        from aristotle_mdr.models import _concept
+
+        self.app_labels = tuple(app_labels)
+        self._app_names = {}
+        self._models_by_app = OrderedDict()
+        self._concepts_by_app = OrderedDict()
+        for app_label in self.app_labels:
+            app_config = apps.get_app_config(app_label)
+            self._app_names[app_label] = getattr(app_config,'verbose_name',None) or "No name"
+            models = tuple(
+                model for model in app_config.get_models()
+                if not model._meta.model_name.startswith("_")
+            )
+            self._models_by_app[app_label] = models
+            self._concepts_by_app[app_label] = tuple(model for model in models if issubclass(model,_concept))
+
+        self.models = tuple(model for models in self._models_by_app.values() for model in models)
+        self.concepts = tuple(model for models in self._concepts_by_app.values() for model in models)
+        self._labels = dict(("%s.%s"%(model._meta.app_label,model._meta.model_name),model) for model in self.concepts)
+        tokens = {}
+        for model in self.concepts:
+            for token in set([model._meta.model_name,normalise_token(model._meta.verbose_name),short_code(model)]):
+                tokens.setdefault(token,[]).append(model)
+        self._tokens = dict((token,tuple(models)) for token,models in tokens.items())
+
+    def find(self,token):
+        """
+        Returns the item types matching a ``type:`` token from a search.
+        """
+        return self._tokens.get(normalise_token(token),())
+
+    def get(self,label):
+        """
+        Returns the item type for an ``app_label.model_name`` label, or ``None``.
+        """
+        return self._labels.get(label.lower())
+
+    def app_name(self,app_label):
+        return self._app_names[app_label]
+
+    def by_app(self,concepts_only=True):
+        """
+        Returns a list of ``(app_label, models)`` for each app with any models, with
+        only the item types unless ``concepts_only`` is ``False``.
+        """
+        by_app = self._concepts_by_app if concepts_only else self._models_by_app
+        return [(app_label,models) for app_label,models in by_app.items() if models]
+
+def build():
+    """
+    Builds the registry from ``CONTENT_EXTENSIONS``, called once the apps are ready.
+    """
+    global _registry
+    from django.conf import settings
+    extensions = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('CONTENT_EXTENSIONS',[])
+    _registry = ConceptTypes(list(extensions) + ["aristotle_mdr"])
+    return _registry
+
+def get_concept_types():
+    return _registry or build()
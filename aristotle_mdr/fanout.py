@@ -0,0 +1,326 @@
+"""
+Deferred notification of item changes
+=====================================
+
+When an item is saved, everyone who has favourited it and every viewer of its
+workgroup is notified, and a comment is added to each discussion about the item.
+For a large workgroup that is hundreds of rows, so rather than creating them while
+the item is being saved, ``concept_saved`` queues a ``ConceptChange`` and the
+notifications are created afterwards in batches, with one bulk insert per batch
+regardless of how many people are notified.
+
+How changes are processed is controlled by ``NOTIFICATION_MODE`` in ``ARISTOTLE_SETTINGS``,
+which takes the same values as ``RECACHE_MODE`` along with ``digest``:
+
+``thread``
+    (The default) Changes are processed by a background thread in the current process.
+    As the thread uses its own database connection, it only sees changes once the
+    save that queued them has been committed, so like the recache worker it waits up
+    to ``WORKER_IDLE_SECONDS`` for more changes before stopping.
+``immediate``
+    Changes are processed as soon as they are queued, before the triggering save returns.
+``manual``
+    Changes are only processed by the ``process_notifications`` management command.
+``digest``
+    As for ``manual``, except that when the command is run everything each person would
+    be told about items in a workgroup is merged into a single notification, so the
+    command can be scheduled to send periodic digests.
+
+Repeated saves of an item don't fill inboxes with copies of the same notification.
+If someone already has an unread notification with the same item and verb from within
+``NOTIFICATION_COALESCE_SECONDS`` (an hour by default, ``0`` turns this off), it is
+brought up to date instead of another being created.
+
+Changes may be processed by more than one worker at once, for example the background
+thread and the ``process_notifications`` command, so a worker claims each batch with a
+conditional update before sending it and only one worker sends each change. The claim
+of a worker that has died lapses after ``NOTIFICATION_CLAIM_SECONDS``.
+"""
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.six import text_type
+from django.utils.translation import ugettext as _
+
+from aristotle_mdr.recache import WORKER_IDLE_SECONDS, WORKER_POLL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 200
+NOTIFICATION_COALESCE_SECONDS = 60*60
+NOTIFICATION_CLAIM_SECONDS = 60*10
+DIGEST_VERB = "changed items in workgroup"
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def notification_mode():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('NOTIFICATION_MODE','thread')
+
+def coalesce_seconds():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('NOTIFICATION_COALESCE_SECONDS',NOTIFICATION_COALESCE_SECONDS)
+
+def queue_concept_change(concept,created=False):
+    """
+    Queues notification of a saved item, and starts processing according to ``NOTIFICATION_MODE``.
+    """
+    from aristotle_mdr.models import ConceptChange
+    ConceptChange.objects.create(concept_id=concept.pk,created=created)
+    start()
+
+def start():
+    mode = notification_mode()
+    if mode == 'immediate':
+        process_concept_changes()
+    elif mode == 'thread':
+        start_worker()
+
+def claimable_changes():
+    """
+    The queued changes that no worker is sending, including those whose worker has stopped
+    without finishing them.
+    """
+    from aristotle_mdr.models import ConceptChange
+    lapsed = timezone.now() - datetime.timedelta(seconds=NOTIFICATION_CLAIM_SECONDS)
+    return ConceptChange.objects.filter(Q(claimed__isnull=True)|Q(claimed__lt=lapsed))
+
+def claim_changes(worker,batch_size):
+    """
+    Claims up to ``batch_size`` of the oldest changes no other worker is sending for
+    ``worker``, returning them, or an empty list if there are none. The claim is taken
+    with a conditional update, so only one worker can win each change.
+    """
+    from aristotle_mdr.models import ConceptChange
+    while True:
+        pks = list(claimable_changes().order_by('pk').values_list('pk',flat=True)[:batch_size])
+        if not pks:
+            return []
+        # Only matches changes that are still claimable, so losing a race just moves on to the next batch.
+        claimable_changes().filter(pk__in=pks).update(claimed_by=worker,claimed=timezone.now())
+        changes = list(ConceptChange.objects.filter(pk__in=pks,claimed_by=worker).order_by('pk'))
+        if changes:
+            return changes
+
+def process_concept_changes(batch_size=None,progress=None):
+    """
+    Sends the notifications for every queued ``ConceptChange`` that no other worker is
+    sending, oldest first. If ``progress`` is given, it is called with the number of
+    changes processed after each batch.
+    """
+    from aristotle_mdr.models import ConceptChange
+    worker = uuid.uuid4().hex
+    while True:
+        changes = claim_changes(worker,batch_size or NOTIFICATION_BATCH_SIZE)
+        if not changes:
+            return
+        claimed = ConceptChange.objects.filter(pk__in=[c.pk for c in changes],claimed_by=worker)
+        try:
+            with transaction.atomic():
+                notify_concept_changes(changes,digest=notification_mode() == 'digest')
+                claimed.delete()
+        finally:
+            # Only left if sending failed, so the changes are retried rather than waiting for the claim to lapse.
+            claimed.update(claimed_by="",claimed=None)
+        if progress:
+            progress(len(changes))
+
+def notify_concept_changes(changes,digest=False):
+    """
+    Creates the notifications and discussion comments for a batch of ``ConceptChange``
+    rows, with a fixed number of queries for the whole batch. If ``digest`` is set, the
+    notifications each person would get about items in a workgroup are merged into one.
+    """
+    from django.contrib.auth.models import User
+    from aristotle_mdr.models import (
+        _concept, DiscussionComment, DiscussionPost, PossumProfile, Workgroup, resolve_subclasses
+    )
+
+    ids = set(c.concept_id for c in changes)
+    items = dict((item.pk,item) for item in resolve_subclasses(_concept.objects.filter(pk__in=ids)))
+
+    favourited_by = {}
+    favourites = PossumProfile.favourites.through.objects.filter(_concept__in=ids)
+    for concept_id,user_id in favourites.values_list('_concept_id','possumprofile__user_id'):
+        favourited_by.setdefault(concept_id,[]).append(user_id)
+    viewers = {}
+    workgroups = Workgroup.objects.in_bulk(set(item.workgroup_id for item in items.values()))
+    for wg,user_id in Workgroup.viewers.through.objects.filter(workgroup__in=workgroups.keys()).values_list('workgroup_id','user_id'):
+        viewers.setdefault(wg,[]).append(user_id)
+
+    # Keyed by recipient, actor and verb, so repeated saves of an item in a batch only notify each person once.
+    pending = {}
+    def add(recipient_id,actor,verb,comment,timestamp,target=None):
+        key = (recipient_id,actor,verb)
+        if key not in pending or pending[key]['timestamp'] < timestamp:
+            pending[key] = {'comment':comment,'timestamp':timestamp,'target':target}
+
+    for change in changes:
+        item = items.get(change.concept_id)
+        if item is None:
+            continue
+        workgroup = workgroups[item.workgroup_id]
+        for user_id in favourited_by.get(item.pk,[]):
+            add(user_id,item,"changed a favourited item",
+                _('A favourite item (%(item)s) has been changed.') % {'item': item},
+                change.timestamp)
+        for user_id in viewers.get(item.workgroup_id,[]):
+            if change.created:
+                add(user_id,item,"new item in workgroup",
+                    _('An new item (%(item)s) is in the workgroup "%(workgroup)s"') % {'item':item, 'workgroup': workgroup},
+                    change.timestamp,target=workgroup)
+            else:
+                add(user_id,item,"motified item in workgroup",
+                    _('An item (%(item)s) has been updated in the workgroup "%(workgroup)s"') % {'item':item, 'workgroup': workgroup},
+                    change.timestamp,target=workgroup)
+    if digest:
+        pending = digest_notifications(pending,workgroups)
+    send_notifications(pending)
+
+    # This will fail during first load, and if admins delete aristotle.
+    system = User.objects.filter(username="aristotle").first()
+    if system is None:
+        return
+    posts = DiscussionPost.relatedItems.through.objects.filter(_concept__in=ids)
+    for post_id,concept_id in posts.values_list('discussionpost_id','_concept_id'):
+        item = items.get(concept_id)
+        if item is None:
+            continue
+        # One comment per item however often it was saved in the batch. These are created
+        # one at a time, so the authors of the posts are notified.
+        DiscussionComment.objects.create(
+            post_id = post_id,
+            body = 'The item "{name}" (id:{iid}) has been changed.\n\n\
+                <a href="{url}">View it on the main site.</a>.'.format(
+                name=item.name,
+                iid = item.id,
+                url = reverse("aristotle:item",args=[item.id])
+            ),
+            author = system,
+        )
+
+def digest_notifications(pending,workgroups):
+    """
+    Merges the pending notifications for each recipient about more than one item in
+    the same workgroup into a single notification from that workgroup.
+    """
+    by_workgroup = {}
+    for key,notice in pending.items():
+        recipient_id,item,verb = key
+        by_workgroup.setdefault((recipient_id,item.workgroup_id),[]).append((key,notice))
+    merged = {}
+    for (recipient_id,workgroup_id),notices in by_workgroup.items():
+        if len(notices) == 1:
+            key,notice = notices[0]
+            merged[key] = notice
+            continue
+        merged[(recipient_id,workgroups[workgroup_id],DIGEST_VERB)] = {
+            'comment': "\n".join(sorted(notice['comment'] for key,notice in notices)),
+            'timestamp': max(notice['timestamp'] for key,notice in notices),
+            'target': None,
+            'digest': True,
+        }
+    return merged
+
+def send_notifications(pending):
+    """
+    Creates the notifications built by ``notify_concept_changes``, with one bulk insert.
+
+    A notification is not repeated if the recipient has an unread one with the same actor
+    and verb from within the last ``NOTIFICATION_COALESCE_SECONDS``. Instead, the existing
+    notification is moved up to the time of the latest change, and digests gain any new lines.
+    """
+    from notifications.models import Notification, EXTRA_DATA
+    from aristotle_mdr.models import _batches
+
+    existing = {}
+    window = coalesce_seconds()
+    if window:
+        cutoff = timezone.now() - datetime.timedelta(seconds=window)
+        actors = {}
+        for recipient_id,actor,verb in pending:
+            actors.setdefault(ContentType.objects.get_for_model(actor).pk,set()).add(text_type(actor.pk))
+        verbs = set(verb for recipient_id,actor,verb in pending)
+        for type_id,actor_ids in actors.items():
+            for batch in _batches(sorted(actor_ids)):
+                recent = Notification.objects.filter(
+                    unread=True, timestamp__gte=cutoff, verb__in=verbs,
+                    actor_content_type=type_id, actor_object_id__in=batch
+                ).order_by('timestamp')
+                for notice in recent:
+                    existing[(notice.recipient_id,type_id,notice.actor_object_id,notice.verb)] = notice
+
+    notifications = []
+    refreshed = {}
+    for (recipient_id,actor,verb),notice in pending.items():
+        actor_type = ContentType.objects.get_for_model(actor)
+        match = existing.get((recipient_id,actor_type.pk,text_type(actor.pk),verb))
+        if match is None:
+            target = notice['target']
+            notifications.append(Notification(
+                recipient_id=recipient_id,
+                actor_content_type=actor_type,
+                actor_object_id=actor.pk,
+                verb=verb,
+                timestamp=notice['timestamp'],
+                description=notice['comment'] if notice.get('digest') else None,
+                target_content_type=ContentType.objects.get_for_model(target) if target else None,
+                target_object_id=target.pk if target else None,
+                data={'comment':notice['comment']} if EXTRA_DATA else None,
+            ))
+        elif notice.get('digest'):
+            lines = (match.description or "").splitlines()
+            lines += [line for line in notice['comment'].splitlines() if line not in lines]
+            Notification.objects.filter(pk=match.pk).update(timestamp=notice['timestamp'],description="\n".join(lines))
+        else:
+            # Grouped by time, so there is one update per change rather than per recipient.
+            refreshed.setdefault(notice['timestamp'],[]).append(match.pk)
+    for timestamp,pks in refreshed.items():
+        for batch in _batches(pks):
+            Notification.objects.filter(pk__in=batch).update(timestamp=timestamp)
+    Notification.objects.bulk_create(notifications,batch_size=500)
+
+def _work():
+    global _worker
+    try:
+        idle = 0
+        while True:
+            process_concept_changes()
+            with _worker_lock:
+                # Keep checking for a while before stopping, so changes queued inside a
+                # transaction that hadn't been committed yet aren't left waiting.
+                if claimable_changes().exists():
+                    idle = 0
+                    continue
+                if idle >= WORKER_IDLE_SECONDS:
+                    _worker = None
+                    return
+            time.sleep(WORKER_POLL_SECONDS)
+            idle += WORKER_POLL_SECONDS
+    except Exception:
+        with _worker_lock:
+            _worker = None
+        logger.exception("Sending notifications of changed items failed, they will be retried next time")
+    finally:
+        connection.close()
+
+def start_worker():
+    """
+    Starts the background notification thread, unless it is already running. The thread
+    stops once there have been no changes to process for ``WORKER_IDLE_SECONDS``.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            return
+        _worker = threading.Thread(target=_work,name="aristotle-notifications")
+        _worker.daemon = True
+        _worker.start()
@@ -7,7 +7,7 @@ from django.utils.translation import ugettext_lazy as _
 
 import aristotle_mdr.models as MDR
 import aristotle_mdr.widgets as widgets
-from aristotle_mdr.perms import user_can_edit
+from aristotle_mdr.perms import user_can_edit, clear_principal
 from aristotle_mdr.utils import concept_to_clone_dict
 
 def MembershipField(model,name):
@@ -58,6 +58,7 @@ class AristotleProfileForm(forms.ModelForm):
             user.registrationauthority_manager_in = self.cleaned_data['registrationauthority_manager_in']
         if "registrar_in" in self.cleaned_data.keys():
             user.registrar_in = self.cleaned_data['registrar_in']
+        clear_principal(user)
 
 class AdminConceptForm(autocomplete_light.ModelForm):
     # Thanks: http://stackoverflow.com/questions/6034047/one-to-many-inline-select-with-django-admin
@@ -7,7 +7,7 @@ from django.utils import timezone
 
 import aristotle_mdr.models as MDR
 from aristotle_mdr.forms import ChangeStatusForm
-from aristotle_mdr.perms import user_can_view
+from aristotle_mdr.perms import user_can_view_many
 
 class BulkActionForm(forms.Form):
     confirm_page = None
@@ -23,7 +23,8 @@ class BulkActionForm(forms.Form):
 class FavouriteForm(BulkActionForm):
     def make_changes(self):
         items = self.cleaned_data.get('items')
-        items = [i for i in items if user_can_view(self.user,i)]
+        visible = user_can_view_many(self.user,items)
+        items = [i for i in items if i.pk in visible]
         self.user.profile.favourites.add(*items)
         return '%d items favourited'%(len(items))
 
@@ -41,6 +42,16 @@ class ChangeStateForm(ChangeStatusForm):
         )
         self.add_registration_authority_field()
 
+    def preview_changes(self):
+        """
+        Returns the ``RegistrationResult`` for every item that would be considered,
+        including those reached by cascading, without registering anything.
+        """
+        ras = self.cleaned_data['registrationAuthorities']
+        items = self.cleaned_data['items']
+        cascade = self.cleaned_data['cascadeRegistration']
+        return MDR.registration_plan(ras,items,self.user,cascade)
+
     def make_changes(self):
         if not self.user.profile.is_registrar:
             raise PermissionDenied
@@ -52,7 +63,5 @@ class ChangeStateForm(ChangeStatusForm):
         changeDetails = self.cleaned_data['changeDetails']
         if regDate is None:
             regDate = timezone.now().date()
-        for item in items:
-            for ra in ras:
-                ra.register(item,state,self.user,regDate,cascade,changeDetails)
+        MDR.register_items(ras,items,state,self.user,regDate,cascade,changeDetails)
         return '%d items registered in %d registration authorities'%(len(items),len(ras))
@@ -1,6 +1,11 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 import datetime
+import time
 from django import forms
+from django.core.cache import cache
 from django.db import models
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
 from model_utils import Choices
@@ -13,6 +18,9 @@ from haystack.query import EmptySearchQuerySet, SearchQuerySet, SQ
 from bootstrap3_datetime.widgets import DateTimePicker
 
 import aristotle_mdr.models as MDR
+from aristotle_mdr import search_cache
+from aristotle_mdr.concept_types import get_concept_types
+from aristotle_mdr.perms import get_principal
 from aristotle_mdr.widgets import BootstrapDropdownSelectMultiple, BootstrapDropdownIntelligentDate, BootstrapDropdownSelect
 
 QUICK_DATES = Choices (
@@ -112,20 +120,23 @@ class PermissionSearchQuerySet(SearchQuerySet):
             sqs = sqs.filter(q)
             return sqs
 
+        principal = get_principal(user)
         if not user.is_superuser:
             # Non-registrars can only see public things or things in their workgroup
             # if they have no workgroups they won't see anything extra
-            if user.profile.workgroups.count() > 0:
-                #for w in user.profile.workgroups.all():
-                #    q |= SQ(workgroup=str(w.id))
-                q |= SQ(workgroup__in=[int(w.id) for w in user.profile.workgroups.all()])
-            if user.profile.is_registrar:
+            if principal.workgroup_ids:
+                q |= SQ(workgroup__in=sorted(principal.workgroup_ids))
+            if principal.registrar_authority_ids:
                 # if registrar, also filter through items in the registered in their authorities
-                q |= SQ(registrationAuthorities__in=[str(r.id) for r in user.profile.registrarAuthorities])
+                q |= SQ(registrationAuthorities__in=[str(r) for r in sorted(principal.registrar_authority_ids)])
         if public_only:
             q &= SQ(is_public=True)
         if user_workgroups_only:
-            q &= SQ(workgroup__in=[str(w.id) for w in user.profile.workgroups.all()])
+            if user.is_superuser:
+                workgroup_ids = MDR.Workgroup.objects.values_list('pk',flat=True)
+            else:
+                workgroup_ids = principal.workgroup_ids
+            q &= SQ(workgroup__in=[str(w) for w in sorted(workgroup_ids)])
         sqs = sqs.filter(q)
         return sqs
 
@@ -146,21 +157,7 @@ class TokenSearchForm(SearchForm):
                     kwargs[str(opt)]=arg
                 elif opt == "type":
                     # we'll allow these through and assume they meant content type
-                    from django.conf import settings
-                    aristotle_apps = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('CONTENT_EXTENSIONS',[])
-                    aristotle_apps += ["aristotle_mdr"]
-
-                    from django.contrib.contenttypes.models import ContentType
-                    arg = arg.lower().replace('_','').replace('-','')
-                    mods = ContentType.objects.filter(app_label__in=aristotle_apps).all()
-                    for i in mods:
-                        first_letter = lambda j: j[0]
-                        if hasattr(i.model_class(),'get_verbose_name'):
-                            model_short_code = "".join(map(first_letter,i.model_class()._meta.verbose_name.split(" "))).lower()
-                            if arg == model_short_code:
-                                token_models.append(i.model_class())
-                        if arg == i.model:
-                            token_models.append(i.model_class())
+                    token_models.extend(get_concept_types().find(arg))
 
             else:
                 query_text.append(word)
@@ -255,23 +252,112 @@ class PermissionSearchForm(TokenSearchForm):
 
         if self.is_valid():
             for model in self.cleaned_data['models']:
-                search_models.append(models.get_model(*model.split('.')))
+                search_models.append(get_concept_types().get(model) or models.get_model(*model.split('.')))
 
         return search_models
 
 
-    def search(self,repeat_search=False):
-        # First, store the SearchQuerySet received from other processing.
-        sqs = super(PermissionSearchForm, self).search()
-        sqs = sqs.models(*self.get_models())
-        self.repeat_search = repeat_search
+    # What searching tells the search page about how the results were found,
+    # which is cached along with the results.
+    search_state_attributes = [
+        'query_text', 'kwargs', 'filter_search', 'attempted_filter_search',
+        'auto_broaden_search', 'auto_correct_spell_search', 'has_spelling_suggestions',
+        'spelling_suggestions', 'original_query', 'suggested_query', 'facets',
+    ]
+    # Fields that the number of results for each value are counted for.
+    facet_fields = ['django_ct', 'statuses', 'registrationAuthorities', 'workgroup']
+    filters = "mq cq cds cde mds mde state ra".split()
+    # Searches that find fewer results than this offer spelling suggestions.
+    spelling_threshold = 5
 
+    def search(self):
+        """
+        Returns the results of the search, from the search result cache if the same
+        search has been run recently by someone with the same permissions.
+        The time taken by each stage is recorded in ``search_timings``, and the
+        number of results for each value of the ``facet_fields`` in ``facets``.
+        """
+        self.search_timings = OrderedDict()
         if not self.is_valid():
             return self.no_query_found()
 
-        filters = "mq cq cds cde mds mde state ra".split()
-        has_filter = any([self.cleaned_data.get(f,False) for f in filters])
-        if has_filter and not self.query_text and not self.kwargs:
+        key = None
+        if search_cache.result_cache_timeout():
+            with self.timed('cache'):
+                filters = {}
+                for name in self.fields:
+                    value = self.cleaned_data.get(name)
+                    filters[name] = sorted(value) if isinstance(value,list) else value
+                query = filters.pop('q')
+                key = search_cache.result_cache_key(query,filters,self.request.user)
+                cached = cache.get(key)
+            if cached is not None:
+                self.__dict__.update(cached['state']['attributes'])
+                self.cleaned_data = dict(cached['state']['cleaned_data'])
+                self.show_facet_counts()
+                return search_cache.CachedSearchResults(cached['results'],cached['count'],self.build_search)
+
+        sqs,results,count = self.run_search()
+        if isinstance(sqs,EmptySearchQuerySet):
+            return sqs
+        self.show_facet_counts()
+        if key:
+            search_cache.cache_results(key,results,count,{
+                'attributes': dict(
+                    (name,getattr(self,name)) for name in self.search_state_attributes
+                    if hasattr(self,name)
+                ),
+                'cleaned_data': dict(self.cleaned_data),
+            })
+        return search_cache.CachedSearchResults(results,count,lambda: sqs)
+
+    def run_search(self):
+        """
+        Runs the search with one query to the search backend, which also brings back the
+        number of results, the facet counts and a spelling suggestion. If nothing is found
+        the search is run once more, either without the filters or with the suggested spelling.
+
+        Returns the queryset for the search, the first results and the number found.
+        """
+        with self.timed('build'):
+            sqs = self.build_search()
+        with self.timed('execute'):
+            results,count,self.facets,suggestion = self.execute(sqs)
+        with self.timed('spelling'):
+            if count >= self.spelling_threshold:
+                suggestion = None
+            elif suggestion is None:
+                suggestion = self.suggest_spelling(sqs)
+            self.check_spelling(suggestion)
+
+        if count == 0:
+            if self.has_filter() and self.cleaned_data['q']:
+                # If there are 0 results with a search term, and filters applied
+                # lets be nice and remove the filters and try again.
+                # There will be a big message on the search page that says what we did.
+                for f in self.filters:
+                    self.cleaned_data[f] = None
+                self.auto_broaden_search = True
+                stage = 'broaden'
+            elif self.has_spelling_suggestions:
+                self.auto_correct_spell_search = True
+                self.cleaned_data['q'] = self.corrected_query
+                stage = 'correct'
+            else:
+                return sqs,results,count
+            with self.timed(stage):
+                sqs = self.build_search()
+                results,count,self.facets,suggestion = self.execute(sqs,spelling=False)
+        return sqs,results,count
+
+    def build_search(self):
+        """
+        Builds the queryset for the search from the cleaned data, without running it.
+        """
+        sqs = super(PermissionSearchForm, self).search()
+        sqs = sqs.models(*self.get_models())
+
+        if self.has_filter() and not self.query_text and not self.kwargs:
             # If there is a filter, but no query then we'll force some results.
             sqs = self.searchqueryset.order_by('-modified')
             self.filter_search = True
@@ -283,50 +369,100 @@ class PermissionSearchForm(TokenSearchForm):
                                             public_only=self.cleaned_data['public_only'],
                                             user_workgroups_only=self.cleaned_data['myWorkgroups_only']
                                         )
+        # Facets are counted after the permission checks, so they only count what the user can see.
+        for field in self.facet_fields:
+            sqs = sqs.facet(field)
+        return self.apply_sorting(sqs)
 
-        self.has_spelling_suggestions = False
-        if not self.repeat_search:
-
-            if sqs.count() < 5:
-                self.check_spelling(sqs)
-
-            if sqs.count() == 0:
-                if has_filter and self.cleaned_data['q']:
-                    # If there are 0 results with a search term, and filters applied
-                    # lets be nice and remove the filters and try again.
-                    # There will be a big message on the search page that says what we did.
-                    for f in filters:
-                        self.cleaned_data[f] = None
-                    self.auto_broaden_search = True
-                elif sqs.count() == 0 and self.has_spelling_suggestions:
-                    self.auto_correct_spell_search = True
-                    self.cleaned_data['q'] = self.suggested_query
-                # Re run the query with the updated details
-                sqs = self.search(repeat_search=True)
-            # Only apply sorting on the first pass through
-            sqs = self.apply_sorting(sqs)
+    def execute(self,sqs,spelling=True):
+        """
+        Runs a search with a single query to the backend, and returns the first
+        results as ``(app_label, model_name, pk, score)``, the number of results, the
+        ``(value, count)`` pairs for each facet field, and the backend's spelling
+        suggestion for the query text if ``spelling`` is set. The queryset itself is left unrun.
+        """
+        if isinstance(sqs,EmptySearchQuerySet):
+            return [],0,{},None
+        query = sqs.query._clone()
+        query.set_limits(0,search_cache.SEARCH_RESULT_CACHE_SIZE)
+        query.run(spelling_query=self.query_text if spelling and self.query_text else None)
+        results = [(r.app_label,r.model_name,r.pk,r.score) for r in query.get_results()]
+        facets = query.get_facet_counts().get('fields',{})
+        # Haystack's getter for the suggestion runs the query again when there isn't one.
+        return results,query.get_count(),facets,query._spelling_suggestion
+
+    def show_facet_counts(self):
+        """
+        Adds the number of results to the labels of the item type, status and
+        registration authority filters.
+        """
+        facets = getattr(self,'facets',None)
+        if not facets:
+            return
+        for name,field,value_of in [
+                ('models','django_ct',lambda choice,label: choice),
+                ('state','statuses',lambda choice,label: force_text(label)),
+                ('ra','registrationAuthorities',lambda choice,label: str(choice)),
+            ]:
+            counts = dict((force_text(value),count) for value,count in facets.get(field,[]))
+            self.fields[name].choices = [
+                (choice,"%s (%s)"%(label,counts.get(value_of(choice,label),0)))
+                for choice,label in self.fields[name].choices
+            ]
+
+    def suggest_spelling(self,sqs):
+        """
+        Some backends, such as Whoosh, don't send a spelling suggestion back when nothing
+        is found, so this asks for one for the whole query text directly, without searching.
+        """
+        backend = sqs.query.backend
+        if self.query_text and backend.include_spelling and hasattr(backend,'create_spelling_suggestion'):
+            return backend.create_spelling_suggestion(self.query_text)
 
-        return sqs
+    def has_filter(self):
+        return any([self.cleaned_data.get(f,False) for f in self.filters])
+
+    @contextmanager
+    def timed(self,stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.search_timings[stage] = time.time() - start
 
-    def check_spelling(self,sqs):
-        if self.query_text:
-            from urllib import quote_plus
-            suggestions = []
-            has_suggestions = False
-            suggested_query = []
-            for token in self.cleaned_data.get('q',"").split(" "):
-                if token: # remove blanks
-                    suggestion = self.searchqueryset.spelling_suggestion(token)
-                    if suggestion:
-                        suggested_query.append(suggestion)
-                        has_suggestions = True
-                    else:
-                        suggested_query.append(token)
-                    suggestions.append((token,suggestion))
-            self.spelling_suggestions = suggestions
-            self.has_spelling_suggestions = has_suggestions
-            self.original_query = self.cleaned_data.get('q')
-            self.suggested_query = quote_plus(' '.join(suggested_query),safe="")
+    def check_spelling(self,suggestion):
+        """
+        Splits the backend's spelling suggestion for the query text into suggestions
+        for each word of the query.
+        """
+        self.has_spelling_suggestions = False
+        if not self.query_text or not suggestion:
+            return
+        from urllib import quote_plus
+        words = [token for token in self.cleaned_data.get('q',"").split(" ") if token] # remove blanks
+        text = [word for word in words if ":" not in word]
+        suggested = suggestion.split()
+        suggestions = []
+        if len(suggested) == len(text):
+            suggested = iter(suggested)
+            for word in words:
+                alternative = None if ":" in word else next(suggested)
+                if alternative and alternative.lower() == word.lower():
+                    alternative = None
+                suggestions.append((word,alternative))
+        else:
+            # Some backends leave out words they have no suggestion for, so if the
+            # suggestion doesn't line up with the words it replaces all of them.
+            suggestions = [(word,None) for word in words if ":" in word]
+            alternative = " ".join(suggested)
+            if alternative.lower() == " ".join(text).lower():
+                alternative = None
+            suggestions.append((" ".join(text),alternative))
+        self.spelling_suggestions = suggestions
+        self.has_spelling_suggestions = any(alternative for word,alternative in suggestions)
+        self.original_query = self.cleaned_data.get('q')
+        self.corrected_query = ' '.join(alternative or word for word,alternative in suggestions)
+        self.suggested_query = quote_plus(self.corrected_query,safe="")
 
     def apply_registration_status_filters(self,sqs):
         states = self.cleaned_data['state']
@@ -23,9 +23,8 @@ signals.post_syncdb.connect(loadDefaultData, sender=aristotle_mdr.models)
 # These are not used during testing.
 def loadExampleData(**kwargs): # pragma: no cover
     print("Loading Aristotle-MDR test data because DEBUG is set to True.")
-    # Disable notification signals disabled as not everything will be setup yet.
-    signals.post_save.disconnect(aristotle_mdr.models.concept_saved)
-    aristotle_mdr.models.exampleData()
-    signals.post_save.connect(aristotle_mdr.models.concept_saved)
+    # Notifications, recaching and indexing are done once per item when it finishes.
+    with aristotle_mdr.bulk_mode():
+        aristotle_mdr.models.exampleData()
 if 'test' not in sys.argv and getattr(settings, 'DEBUG', "") == True:  # pragma: no cover
     signals.post_syncdb.connect(loadExampleData, sender=aristotle_mdr.models)
@@ -0,0 +1,134 @@
+from optparse import make_option
+import random
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+import haystack
+from aristotle_mdr.forms.search import PermissionSearchForm, PermissionSearchQuerySet
+from aristotle_mdr.models import ObjectClass, Property, RegistrationAuthority, Workgroup, STATES
+from aristotle_mdr.reindex import REINDEX_BATCH_SIZE, get_index, indexed_models
+
+BACKENDS = [
+    ('whoosh', 'aristotle_mdr.search_backends.whoosh_backend.FacetedWhooshEngine', 'whoosh_index'),
+    ('sqlite', 'aristotle_mdr.search_backends.sqlite_fts.SQLiteFTSEngine', 'index.sqlite3'),
+]
+WORDS = (
+    "person address vehicle height weight date birth country code name identifier "
+    "organisation service episode admission diagnosis procedure income employment "
+    "education language marital status family household dwelling tenure region"
+).split()
+
+def misspell(word):
+    i = random.randrange(len(word) - 1)
+    return word[:i] + word[i+1] + word[i] + word[i+2:]
+
+class Command(BaseCommand):
+    help = ('Generates a registry and compares how long the Whoosh and SQLite FTS5 search backends '
+            'take to index it, run searches with the permission checks and facets used by the search '
+            'page, and suggest spellings. Each backend writes to a temporary index that is deleted '
+            'afterwards, and the items are created inside a transaction that is rolled back.')
+    option_list = BaseCommand.option_list + (
+        make_option('--items', dest='items', type='int', default=5000,
+            help='The number of items to generate.'),
+        make_option('--workgroups', dest='workgroups', type='int', default=20,
+            help='The number of workgroups to spread the items across.'),
+        make_option('--queries', dest='queries', type='int', default=100,
+            help='The number of searches to time for each user.'),
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        # Items are only indexed by the backends being compared, not the site's own index.
+        haystack.signal_processor.teardown()
+        try:
+            with transaction.atomic():
+                users = self.make_registry(options)
+                queries = [" ".join(random.sample(WORDS,random.randint(1,2))) for i in range(options['queries'])]
+                for name,engine,path in BACKENDS:
+                    alias = 'benchmark_%s' % name
+                    haystack.connections.connections_info[alias] = {
+                        'ENGINE': engine, 'PATH': '%s/%s' % (directory,path), 'INCLUDE_SPELLING': True,
+                    }
+                    try:
+                        self.stdout.write('%s:' % name)
+                        self.benchmark(alias,users,queries)
+                    finally:
+                        del haystack.connections.connections_info[alias]
+                        haystack.connections._connections.pop(alias,None)
+                transaction.set_rollback(True)
+        finally:
+            haystack.signal_processor.setup()
+            shutil.rmtree(directory)
+
+    def make_registry(self, options):
+        random.seed(0)
+        ra = RegistrationAuthority.objects.create(name="Benchmark RA")
+        workgroups = []
+        for i in range(options['workgroups']):
+            wg = Workgroup.objects.create(name="Benchmark WG %s"%i)
+            wg.registrationAuthorities.add(ra)
+            workgroups.append(wg)
+        registrar = User.objects.create_user('benchmark_registrar','','benchmark')
+        ra.registrars.add(registrar)
+        viewer = User.objects.create_user('benchmark_viewer','','benchmark')
+        for wg in workgroups[:3]:
+            wg.viewers.add(viewer)
+
+        self.stdout.write('Generating %s items...'%options['items'])
+        for i in range(options['items']):
+            item = random.choice([ObjectClass,Property]).objects.create(
+                name=" ".join(random.sample(WORDS,3)),
+                description=" ".join(random.choice(WORDS) for j in range(20)),
+                workgroup=random.choice(workgroups),
+                readyToReview=random.random() < 0.5,
+            )
+            if random.random() < 0.3:
+                ra.register(item,random.choice([STATES.recorded,STATES.standard]),registrar)
+        return [('Anonymous',AnonymousUser()),('Workgroup viewer',viewer),('Registrar',registrar)]
+
+    def benchmark(self, alias, users, queries):
+        backend = haystack.connections[alias].get_backend()
+        start = time.time()
+        indexed = 0
+        for model in indexed_models(alias):
+            index = get_index(model,alias)
+            queryset = index.index_queryset(using=alias).order_by('pk')
+            for first in range(0,queryset.count(),REINDEX_BATCH_SIZE):
+                objects = list(queryset[first:first+REINDEX_BATCH_SIZE])
+                backend.update(index,objects)
+                indexed += len(objects)
+        taken = time.time() - start
+        self.stdout.write('  indexing  %d items in %.2fs (%.0f items/s)' % (indexed, taken, indexed/max(taken,0.001)))
+
+        for name,user in users:
+            timings = []
+            found = 0
+            for query in queries:
+                sqs = PermissionSearchQuerySet(using=alias).auto_query(query).apply_permission_checks(user)
+                for field in PermissionSearchForm.facet_fields:
+                    sqs = sqs.facet(field)
+                start = time.time()
+                search = sqs.query._clone()
+                search.set_limits(0,20)
+                search.run()
+                timings.append(time.time() - start)
+                found += search.get_count()
+            self.report('search (%s, %.0f found)' % (name.lower(),found/float(len(queries))),timings)
+
+        timings = []
+        for query in queries:
+            start = time.time()
+            backend.create_spelling_suggestion(" ".join(misspell(word) for word in query.split()))
+            timings.append(time.time() - start)
+        self.report('spelling',timings)
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        self.stdout.write('  %-40s median %6.1fms, 95th percentile %6.1fms' % (
+            name, 1000*timings[len(timings)//2], 1000*timings[int(len(timings)*0.95)]
+        ))
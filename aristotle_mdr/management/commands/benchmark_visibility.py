@@ -0,0 +1,107 @@
+from optparse import make_option
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from aristotle_mdr import perms
+from aristotle_mdr.models import RegistrationAuthority, Status, Workgroup, _concept, STATES
+
+def visible_with_joins(queryset,user):
+    """
+    The original join based implementation of ``ConceptQuerySet.visible``, kept
+    so it can be compared against the current one.
+    """
+    principal = perms.get_principal(user)
+    q = Q(_is_public=True)
+    if principal.workgroup_ids:
+        q |= Q(workgroup__in=principal.workgroup_ids)
+    if principal.registrar_authority_ids:
+        ras = principal.registrar_authority_ids
+        q |= Q(workgroup__registrationAuthorities__in=ras,readyToReview=True)
+        q |= Q(workgroup__registrationAuthorities__in=ras,
+                statuses__registrationAuthority__in=ras)
+    return queryset.filter(q)
+
+class Command(BaseCommand):
+    help = ('Generates a large registry and compares the query count, rows returned and time taken '
+            'by ConceptQuerySet.visible against the original join based implementation. '
+            'Everything is created inside a transaction that is rolled back afterwards.')
+    option_list = BaseCommand.option_list + (
+        make_option('--items', dest='items', type='int', default=100000,
+            help='The number of items to generate.'),
+        make_option('--workgroups', dest='workgroups', type='int', default=100,
+            help='The number of workgroups to spread the items across.'),
+        make_option('--ras', dest='ras', type='int', default=10,
+            help='The number of registration authorities to generate.'),
+        make_option('--repeat', dest='repeat', type='int', default=3,
+            help='The number of times to time each query, the fastest time is reported.'),
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = self.make_registry(options)
+            for name,user in users:
+                self.stdout.write('%s:'%name)
+                self.compare(user,options['repeat'])
+            transaction.set_rollback(True)
+
+    def make_registry(self, options):
+        random.seed(0)
+        ras = [RegistrationAuthority.objects.create(name="Benchmark RA %s"%i) for i in range(options['ras'])]
+        workgroups = []
+        for i in range(options['workgroups']):
+            wg = Workgroup.objects.create(name="Benchmark WG %s"%i)
+            wg.registrationAuthorities.add(*random.sample(ras,min(3,len(ras))))
+            workgroups.append(wg)
+
+        self.stdout.write('Generating %s items...'%options['items'])
+        _concept.objects.bulk_create([
+            _concept(
+                name="Benchmark item %s"%i, description="",
+                workgroup=random.choice(workgroups),
+                readyToReview=random.random() < 0.3,
+                _is_public=random.random() < 0.1,
+            ) for i in range(options['items'])
+        ],batch_size=500)
+        statuses = []
+        today = timezone.now().date()
+        for pk in _concept.objects.filter(name__startswith="Benchmark item").values_list('pk',flat=True):
+            # Give most items several statuses, so the joins fan out.
+            for ra in random.sample(ras,random.randint(0,min(4,len(ras)))):
+                statuses.append(Status(concept_id=pk,registrationAuthority=ra,state=STATES.recorded,registrationDate=today))
+        Status.objects.bulk_create(statuses,batch_size=500)
+
+        viewer = User.objects.create_user('benchmark_viewer','','benchmark')
+        for wg in workgroups[:5]:
+            wg.viewers.add(viewer)
+        registrar = User.objects.create_user('benchmark_registrar','','benchmark')
+        for ra in ras[:3]:
+            ra.registrars.add(registrar)
+        both = User.objects.create_user('benchmark_both','','benchmark')
+        for wg in workgroups[:5]:
+            wg.stewards.add(both)
+        for ra in ras[:3]:
+            ra.registrars.add(both)
+        return [('Workgroup viewer',viewer),('Registrar',registrar),('Steward and registrar',both)]
+
+    def compare(self, user, repeat):
+        base = _concept.objects.filter(name__startswith="Benchmark item")
+        for name,build in [('joins',visible_with_joins),('subqueries',lambda qs,u: qs.visible(u))]:
+            # A fresh user object each time, so the principal isn't reused between runs.
+            best = None
+            for i in range(repeat):
+                fresh_user = User.objects.get(pk=user.pk)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.time()
+                    rows = list(build(base,fresh_user).values_list('pk',flat=True))
+                    taken = time.time() - start
+                best = taken if best is None else min(best,taken)
+            self.stdout.write('  %-10s %3d queries, %7d rows (%7d distinct), %.3fs' % (
+                name, len(queries), len(rows), len(set(rows)), best
+            ))
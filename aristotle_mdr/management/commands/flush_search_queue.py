@@ -0,0 +1,21 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from aristotle_mdr.models import SearchQueueEntry
+from aristotle_mdr.signals import SEARCH_QUEUE_BATCH_SIZE, flush_search_queue
+
+class Command(BaseCommand):
+    help = 'Reindexes everything queued by the QueuedSignalProcessor. Run this regularly so nothing waits in the queue for long.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            dest='batch_size', type='int', default=SEARCH_QUEUE_BATCH_SIZE,
+            help='The number of queued objects to reindex in each batch.'),
+        )
+
+    def handle(self, *args, **options):
+        pending = SearchQueueEntry.objects.count()
+        self.stdout.write('%s objects queued for reindexing' % pending)
+        def progress(done):
+            self.stdout.write('%s of %s queued objects reindexed' % (done,pending))
+        flush_search_queue(batch_size=options.get('batch_size'),progress=progress)
+        self.stdout.write('Finished reindexing the search queue')
@@ -0,0 +1,23 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from aristotle_mdr.models import ConceptChange
+from aristotle_mdr.fanout import NOTIFICATION_BATCH_SIZE, process_concept_changes
+
+class Command(BaseCommand):
+    help = 'Sends the notifications and discussion comments for any items saved since this was last run.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            dest='batch_size', type='int', default=NOTIFICATION_BATCH_SIZE,
+            help='The number of changed items to process in each transaction.'),
+        )
+
+    def handle(self, *args, **options):
+        pending = ConceptChange.objects.count()
+        self.stdout.write('%s changed items to notify' % pending)
+        done = [0]
+        def progress(count):
+            done[0] += count
+            self.stdout.write('%s of %s changed items processed' % (done[0],pending))
+        process_concept_changes(batch_size=options.get('batch_size'),progress=progress)
+        self.stdout.write('Finished sending notifications')
@@ -0,0 +1,22 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils.encoding import force_text
+from aristotle_mdr.models import RecacheJob
+from aristotle_mdr.recache import RECACHE_CHUNK_SIZE, process_recache_jobs
+
+class Command(BaseCommand):
+    help = 'Runs any queued or interrupted recomputations of item visibility states, reporting progress as it goes.'
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+            dest='chunk_size', type='int', default=RECACHE_CHUNK_SIZE,
+            help='The number of items to recompute in each transaction.'),
+        )
+
+    def handle(self, *args, **options):
+        pending = RecacheJob.objects.filter(finished__isnull=True).count()
+        self.stdout.write('%s recache jobs to run' % pending)
+        def progress(job):
+            self.stdout.write(force_text(job))
+        process_recache_jobs(chunk_size=options.get('chunk_size'),progress=progress)
+        self.stdout.write('Finished all recache jobs')
@@ -0,0 +1,24 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from aristotle_mdr.models import ConceptVisibility,_concept,rebuild_concept_visibility
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialised item visibility table from scratch. Run this after enabling USE_VISIBILITY_TABLE, or if the table is suspected to be out of date.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            dest='batch_size', type='int', default=5000,
+            help='The number of items to rebuild at a time.'),
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size') or 5000
+        # Rebuilt in one transaction, so the table is never seen empty or half built.
+        with transaction.atomic():
+            ConceptVisibility.objects.all().delete()
+            ids = list(_concept.objects.order_by('pk').values_list('pk',flat=True))
+            for start in range(0,len(ids),batch_size):
+                batch = ids[start:start+batch_size]
+                rebuild_concept_visibility(_concept.objects.filter(pk__gte=batch[0],pk__lte=batch[-1]))
+        self.stdout.write('Rebuilt visibility for %s items' % len(ids))
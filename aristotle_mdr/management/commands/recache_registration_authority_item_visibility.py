@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand, CommandError
 from aristotle_mdr.models import RegistrationAuthority,_concept
+from aristotle_mdr.signals import update_search_index
 
 class Command(BaseCommand):
     args = '<workgroup_id workgroup_id ...>'
@@ -13,6 +14,6 @@ class Command(BaseCommand):
                 raise CommandError('Registration Authority "%s" does not exist' % ra_id)
             self.stdout.write('Beginning update for items in Registration Authority "%s" (id:%s)' % (ra.name,ra_id,))
 
-            for item in _concept.objects.filter(statuses__registrationAuthority=ra):
-                item.recache_states()
+            changed = _concept.objects.filter(statuses__registrationAuthority=ra).recache_states()
+            update_search_index(changed)
             self.stdout.write('Successfully updated items in Registration Authority "%s" (id:%s)' % (ra.name,ra_id,))
@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from aristotle_mdr.models import _concept
+from aristotle_mdr.signals import update_search_index
+
+class Command(BaseCommand):
+    help = 'Recomputes the cached registration summary of every item from its statuses, and reindexes the items whose summary changed. Run this if statuses have been changed without sending signals.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            dest='batch_size', type='int', default=5000,
+            help='The number of items to recompute in each transaction.'),
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size') or 5000
+        ids = list(_concept.objects.order_by('pk').values_list('pk',flat=True))
+        changed = set()
+        for start in range(0,len(ids),batch_size):
+            batch = ids[start:start+batch_size]
+            with transaction.atomic():
+                changed |= _concept.objects.filter(pk__gte=batch[0],pk__lte=batch[-1]).recache_registration_summary()
+        update_search_index(sorted(changed))
+        self.stdout.write('Recomputed registration summaries for %s items, %s had changed' % (len(ids),len(changed)))
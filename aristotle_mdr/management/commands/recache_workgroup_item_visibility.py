@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand, CommandError
-from aristotle_mdr.models import Workgroup
+from aristotle_mdr.models import Workgroup,_concept
+from aristotle_mdr.signals import update_search_index
 
 class Command(BaseCommand):
     args = '<workgroup_id workgroup_id ...>'
@@ -13,6 +14,8 @@ class Command(BaseCommand):
                 raise CommandError('Workgroup "%s" does not exist' % wg_id)
             self.stdout.write('Beginning update for items in Workgroup "%s" (id:%s)' % (wg.name,wg_id,))
 
-            for item in wg.items.all():
-                item.recache_states()
+            items = _concept.objects.filter(workgroup=wg)
+            items.recache_states()
+            # The authorities of the workgroup are indexed too, so reindex everything not just what changed.
+            update_search_index(items.values_list('pk',flat=True))
             self.stdout.write('Successfully updated items in Workgroup "%s" (id:%s)' % (wg.name,wg_id,))
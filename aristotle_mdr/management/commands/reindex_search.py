@@ -0,0 +1,52 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from aristotle_mdr import reindex
+
+class Command(BaseCommand):
+    help = ('Reindexes every searchable model, preparing the search documents in parallel. '
+            'If a previous run was interrupted, it carries on from the last range of items written. '
+            'With --incremental, only the changes made since the last run are indexed.')
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=0,
+            help='The number of worker processes to prepare documents with. By default, documents are prepared in this process.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=reindex.REINDEX_BATCH_SIZE,
+            help='The number of items in each range of ids.'),
+        make_option('--using', dest='using', default='default',
+            help='The search connection to reindex.'),
+        make_option('--restart', dest='restart', action='store_true', default=False,
+            help='Start again from the beginning, instead of carrying on from an interrupted run.'),
+        make_option('--clear', dest='clear', action='store_true', default=False,
+            help='Remove each model from the index before a fresh run starts.'),
+        make_option('--incremental', dest='incremental', action='store_true', default=False,
+            help='Only index items changed or deleted since the last run. Models that have never been fully indexed are reindexed.'),
+        )
+
+    def handle(self, *args, **options):
+        using = options['using']
+        pool = reindex.make_pool(options['workers']) if options['workers'] else None
+        try:
+            for model in reindex.indexed_models(using):
+                name = "%s.%s" % (model._meta.app_label,model._meta.object_name)
+                def progress(written):
+                    if int(options.get('verbosity',1)) > 1:
+                        self.stdout.write('  %s: %s written' % (name,written))
+                if options['incremental']:
+                    written,removed,taken = reindex.update_model(
+                        model,using,batch_size=options['batch_size'],progress=progress
+                    )
+                    self.stdout.write('%s: %s items updated and %s removed in %.1fs' % (
+                        name, written, removed, taken
+                    ))
+                    continue
+                written,taken = reindex.reindex_model(
+                    model,using,batch_size=options['batch_size'],pool=pool,
+                    restart=options['restart'],clear=options['clear'],progress=progress
+                )
+                self.stdout.write('%s: %s items in %.1fs (%.0f items/s)' % (
+                    name, written, taken, written/taken if taken else 0
+                ))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
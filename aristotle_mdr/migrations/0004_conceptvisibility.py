@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0003_auto_20150416_0024'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConceptVisibility',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('concept', models.ForeignKey(related_name='visibility_grants', to='aristotle_mdr._concept')),
+                ('registrationAuthority', models.ForeignKey(related_name='+', to='aristotle_mdr.RegistrationAuthority', null=True)),
+                ('workgroup', models.ForeignKey(related_name='+', to='aristotle_mdr.Workgroup', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='conceptvisibility',
+            index_together=set([('registrationAuthority', 'concept'), ('workgroup', 'concept')]),
+        ),
+    ]
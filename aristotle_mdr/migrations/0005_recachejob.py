@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0004_conceptvisibility'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecacheJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('reindex_all', models.BooleanField(default=False, help_text='Reindex every affected item for search, not just those whose state changed.')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(null=True, blank=True)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('restarts', models.IntegerField(default=0)),
+                ('last_item', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('total', models.IntegerField(null=True, blank=True)),
+                ('registrationAuthority', models.ForeignKey(related_name='+', blank=True, to='aristotle_mdr.RegistrationAuthority', null=True)),
+                ('workgroup', models.ForeignKey(related_name='+', blank=True, to='aristotle_mdr.Workgroup', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
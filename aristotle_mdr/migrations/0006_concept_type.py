@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def set_concept_types(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Concept = apps.get_model('aristotle_mdr', '_concept')
+    subclasses = [
+        m for m in apps.get_models()
+        if m is not Concept and issubclass(m, Concept) and not m._meta.proxy
+    ]
+    # Handle the deepest subclasses last, so items end up with their most specific type.
+    for model in sorted(subclasses, key=lambda m: len(m.__mro__)):
+        ids = list(model._default_manager.values_list('pk', flat=True))
+        if not ids:
+            continue
+        defaults = {}
+        # ContentType.name is only a column before Django 1.8.
+        if 'name' in [f.name for f in ContentType._meta.fields]:
+            defaults['name'] = model._meta.verbose_name_raw
+        ct, created = ContentType.objects.get_or_create(
+            app_label=model._meta.app_label, model=model._meta.model_name,
+            defaults=defaults
+        )
+        for start in range(0, len(ids), 500):
+            Concept.objects.filter(pk__in=ids[start:start+500]).update(_type=ct)
+
+
+def unset_concept_types(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('aristotle_mdr', '0005_recachejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='_concept',
+            name='_type',
+            field=models.ForeignKey(related_name='+', blank=True, editable=False, to='contenttypes.ContentType', null=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(set_concept_types, unset_concept_types),
+    ]
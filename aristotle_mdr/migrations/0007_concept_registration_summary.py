@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+RETIRED = 8
+
+
+def backfill_registration_summary(apps, schema_editor):
+    Concept = apps.get_model('aristotle_mdr', '_concept')
+    Status = apps.get_model('aristotle_mdr', 'Status')
+    states = {}
+    for concept, ra, state in Status.objects.values_list('concept', 'registrationAuthority', 'state'):
+        states.setdefault(concept, []).append((ra, state))
+    # Group items with the same summary, so they can be updated together.
+    updates = {}
+    for concept, statuses in states.items():
+        statuses = sorted(statuses)
+        values = [state for ra, state in statuses]
+        summary = (
+            all(state == RETIRED for state in values),
+            max(values),
+            ",".join("%s:%s" % (ra, state) for ra, state in statuses),
+        )
+        updates.setdefault(summary, []).append(concept)
+    for (is_retired, highest_state, registration_states), ids in updates.items():
+        for start in range(0, len(ids), 500):
+            Concept.objects.filter(pk__in=ids[start:start+500]).update(
+                _is_registered=True, _is_retired=is_retired,
+                _highest_state=highest_state, _registration_states=registration_states
+            )
+
+
+def clear_registration_summary(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0006_concept_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='_concept',
+            name='_highest_state',
+            field=models.IntegerField(null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='_concept',
+            name='_is_registered',
+            field=models.BooleanField(default=False, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='_concept',
+            name='_is_retired',
+            field=models.BooleanField(default=False, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='_concept',
+            name='_registration_states',
+            field=models.TextField(editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(backfill_registration_summary, clear_registration_summary),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+ROLE_BITS = (
+    ('viewers', 1),
+    ('submitters', 2),
+    ('stewards', 4),
+    ('managers', 8),
+)
+
+
+def backfill_memberships(apps, schema_editor):
+    Workgroup = apps.get_model('aristotle_mdr', 'Workgroup')
+    WorkgroupMembership = apps.get_model('aristotle_mdr', 'WorkgroupMembership')
+    roles = {}
+    for field_name, bit in ROLE_BITS:
+        field = Workgroup._meta.get_field(field_name)
+        through = field.rel.through
+        for key in through.objects.values_list(field.m2m_column_name(), field.m2m_reverse_name()):
+            roles[key] = roles.get(key, 0) | bit
+    WorkgroupMembership.objects.bulk_create(
+        [WorkgroupMembership(workgroup_id=wg, user_id=user, roles=bits) for (wg, user), bits in roles.items()],
+        batch_size=500
+    )
+
+
+def clear_memberships(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('aristotle_mdr', '0007_concept_registration_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkgroupMembership',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('roles', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(related_name='workgroup_memberships', to=settings.AUTH_USER_MODEL)),
+                ('workgroup', models.ForeignKey(related_name='memberships', to='aristotle_mdr.Workgroup')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='workgroupmembership',
+            unique_together=set([('workgroup', 'user')]),
+        ),
+        migrations.RunPython(backfill_memberships, clear_memberships),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0008_workgroupmembership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConceptChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.BooleanField(default=False, help_text='The item was new, rather than an edit of an existing item.')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('concept', models.ForeignKey(related_name='+', to='aristotle_mdr._concept')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
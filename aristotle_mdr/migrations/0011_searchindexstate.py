@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('aristotle_mdr', '0010_searchqueueentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexState',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('using', models.CharField(max_length=100)),
+                ('rebuild_started', models.DateTimeField(null=True, blank=True)),
+                ('rebuild_finished', models.DateTimeField(null=True, blank=True)),
+                ('rebuild_last_pk', models.IntegerField(default=0, help_text='The highest id in the last range of objects that was written to the index.')),
+                ('content_type', models.ForeignKey(related_name='+', to='contenttypes.ContentType')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchindexstate',
+            unique_together=set([('using', 'content_type')]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('aristotle_mdr', '0011_searchindexstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexRemoval',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.IntegerField()),
+                ('removed', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('content_type', models.ForeignKey(related_name='+', to='contenttypes.ContentType')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='searchindexstate',
+            name='indexed_until',
+            field=models.DateTimeField(help_text='Every change to the model before this time is in the index.', null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
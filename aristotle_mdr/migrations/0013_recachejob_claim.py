@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0012_searchindexremoval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recachejob',
+            name='claimed',
+            field=models.DateTimeField(help_text='When the worker running this job last recorded its progress.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='recachejob',
+            name='claimed_by',
+            field=models.CharField(help_text='The worker running this job, if any.', max_length=32, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0013_recachejob_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conceptchange',
+            name='claimed',
+            field=models.DateTimeField(help_text='When the worker sending the notifications for this change claimed it.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='conceptchange',
+            name='claimed_by',
+            field=models.CharField(help_text='The worker sending the notifications for this change, if any.', max_length=32, blank=True),
+            preserve_default=True,
+        ),
+    ]
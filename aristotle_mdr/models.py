@@ -2,25 +2,28 @@ from __future__ import unicode_literals
 from __future__ import print_function
 from __future__ import absolute_import
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Q
-from django.db.models.signals import post_save,m2m_changed
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save,post_delete,m2m_changed
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from model_utils.managers import InheritanceManager, InheritanceQuerySet
 from model_utils.models import TimeStampedModel
 from model_utils import Choices, FieldTracker
 from notifications import notify
+import reversion
 from django.dispatch import receiver
 
 import datetime
+from collections import namedtuple
 from ckeditor.fields import RichTextField
-from aristotle_mdr import perms
+from aristotle_mdr import bulk, fanout, perms, recache
 from aristotle_mdr.utils import url_slugify_concept, url_slugify_workgroup
 
 import logging
@@ -40,6 +43,7 @@ STATES = Choices (
            (8,'retired',_('Retired')),
          )
 VERY_RECENTLY_SECONDS = 15
+RECACHE_BATCH_SIZE = 500 # Number of ids updated in each bulk UPDATE when recaching states
 
 class baseAristotleObject(TimeStampedModel):
     name = models.TextField(help_text=_("The primary name used for human identification purposes."))
@@ -194,6 +198,14 @@ class RegistrationAuthority(registryGroup):
         if not perms.user_can_change_status(user,item):
             # Should raise something here instead of quietly failing
             return None
+        reg = self._register(item,state,registrationDate,changeDetails)
+        if cascade:
+            # Work out the whole cascade first, so shared components are only registered once.
+            for result in registration_plan([self],[item],user,cascade=True):
+                if result.cascaded and result.permitted:
+                    self._register(result.item,state,registrationDate,changeDetails)
+        return reg
+    def _register(self,item,state,registrationDate,changeDetails):
         reg,created = Status.objects.get_or_create(
                 concept=item,
                 registrationAuthority=self,
@@ -208,31 +220,34 @@ class RegistrationAuthority(registryGroup):
             reg.state = state
             reg.registrationDate = registrationDate
             reg.save()
-        if cascade:
-            for i in item.registry_cascade_items:
-                if i is not None and perms.user_can_change_status(user,i):
-                   self.register(i,state,user,registrationDate=registrationDate,cascade=cascade,changeDetails=changeDetails)
         return reg
+    def register_many(self,items,state,user,registrationDate=None,cascade=False,changeDetails=""):
+        """
+        Registers many items in this authority at once, see ``register_items``.
+        """
+        return register_items([self],items,state,user,registrationDate,cascade,changeDetails)
     def giveRoleToUser(self,role,user):
         if role == 'registrar':
             self.registrars.add(user)
         if role == "manager":
             self.managers.add(user)
+        perms.clear_principal(user)
     def removeRoleFromUser(self,role,user):
         if role == 'registrar':
             self.registrars.remove(user)
         if role == "manager":
             self.managers.remove(user)
+        perms.clear_principal(user)
 
 @receiver(post_save,sender=RegistrationAuthority)
 def update_registration_authority_states(sender, instance, created, **kwargs):
     if not created:
         if instance.tracker.has_changed('public_state') or instance.tracker.has_changed('locked_state'):
             message = ("Registration '{ra}' changed its public or locked status level, "
-                        "items registered by this authority may have stale visiblity states "
-                        "and need to be manually updated."
+                        "queuing an update of the visiblity states of items registered by this authority."
                         ).format(ra = instance.name)
-            logger.critical(message)
+            logger.info(message)
+            recache.queue_recache(registrationAuthority=instance)
 
 WORKGROUP_OWNERSHIP = Choices (
            (0,'registry',_('Registry')),
@@ -278,10 +293,10 @@ class Workgroup(registryGroup):
 
     @property
     def members(self):
-        return self.viewers.all() | self.submitters.all() | self.stewards.all() | self.managers.all()
+        return User.objects.filter(workgroup_memberships__workgroup=self)
 
     def can_view(self,user):
-        return self.members.filter(pk=user.pk).exists()
+        return self.pk in perms.get_principal(user).workgroup_ids
 
     @property
     def classedItems(self):
@@ -297,6 +312,7 @@ class Workgroup(registryGroup):
             self.submitters.add(user)
         if role == "steward":
             self.stewards.add(user)
+        perms.clear_principal(user)
         self.save()
 
     def removeRoleFromUser(self,role,user):
@@ -308,6 +324,7 @@ class Workgroup(registryGroup):
             self.submitters.remove(user)
         if role == "steward":
             self.stewards.remove(user)
+        perms.clear_principal(user)
         self.save()
 
     def removeUser(self,user):
@@ -315,35 +332,111 @@ class Workgroup(registryGroup):
         self.submitters.remove(user)
         self.stewards.remove(user)
         self.managers.remove(user)
+        perms.clear_principal(user)
 
 @receiver(post_save,sender=Workgroup)
 def update_ownership(sender, instance, created, **kwargs):
     # only log if its an edit, not a newly created workgroup
     if not created and instance.tracker.has_changed('ownership'):
         message = ("Workgroup '{wg}' changed ownership, "
-                    "cached public states for items in this workgroup are now "
-                    "stale and need to be manually updated."
+                    "queuing an update of the cached public states for items in this workgroup."
                     ).format(wg = instance.name)
-        logger.critical(message)
-# This would be like the below, but again, a better solution is needed.
-
-def update_registation_authorities(sender, instance, action, **kwargs):
-    # this will be slow, but necessary... perhaps this will encourage people to not
-    # change or add registration authorities to workgroups willy-nilly.
-    if action in ['post_add','post_remove','post_clear']:
-        created = instance.created >= timezone.now() - datetime.timedelta(seconds=VERY_RECENTLY_SECONDS)
+        logger.info(message)
+        recache.queue_recache(workgroup=instance)
+
+def update_registation_authorities(sender, instance, action, reverse, pk_set, **kwargs):
+    # The items and their search index entries are updated in a background job,
+    # as a workgroup can have far too many items to do this while saving.
+    if reverse and action == 'pre_clear':
+        # Changed from the authorities side, so find the workgroups before they are cleared.
+        instance._cleared_workgroups = list(instance.workgroups.all())
+        return
+    if action not in ['post_add','post_remove','post_clear']:
+        return
+    if not reverse:
+        workgroups = [instance]
+    elif action == 'post_clear':
+        workgroups = instance.__dict__.pop('_cleared_workgroups',[])
+    else:
+        workgroups = Workgroup.objects.filter(pk__in=pk_set)
+    for wg in workgroups:
+        created = wg.created >= timezone.now() - datetime.timedelta(seconds=VERY_RECENTLY_SECONDS)
         # Dont fire this off if the object was created very recently within about the last 15 seconds.
         if not created:
             message = ("Workgroup '{wg}' has altered registration authorities, "
-                        "cached public states for items in this workgroup are now "
-                        "stale and need to be manually updated."
-                        ).format(wg = instance.name)
-            logger.critical(message)
-    # In practice it seems the below is far too slow, so a better alternative is needed.
-    #    for item in instance.items.all():
-    #        item.recache_states()
+                        "queuing an update of the cached public states for items in this workgroup."
+                        ).format(wg = wg.name)
+            logger.info(message)
+            recache.queue_recache(workgroup=wg,reindex_all=True)
 m2m_changed.connect(update_registation_authorities, sender=Workgroup.registrationAuthorities.through)
 
+class WorkgroupMembership(models.Model):
+    """
+    Every role a user holds in a workgroup, as a bitmask of ``perms.WORKGROUP_ROLE_BITS``.
+
+    The ``viewers``, ``submitters``, ``stewards`` and ``managers`` relations of a
+    workgroup are still the way roles are given and taken away, and this table is kept
+    in step with them by ``sync_workgroup_membership``. It lets the members of a
+    workgroup, or the workgroups of a user, be found with a single indexed query
+    instead of a union of all four relations.
+    """
+    workgroup = models.ForeignKey(Workgroup,related_name="memberships")
+    user = models.ForeignKey(User,related_name="workgroup_memberships")
+    roles = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('workgroup','user')
+
+    def __unicode__(self):
+        return "{user} in {wg}: {roles}".format(user=self.user,wg=self.workgroup,roles=", ".join(self.role_names))
+
+    @property
+    def role_names(self):
+        return [role for role,field_name in perms.WORKGROUP_ROLE_FIELDS if self.has_role(role)]
+
+    def has_role(self,role):
+        return bool(self.roles & perms.WORKGROUP_ROLE_BITS[role])
+
+def rebuild_workgroup_memberships(workgroups=None,users=None):
+    """
+    Recomputes the ``WorkgroupMembership`` rows from the workgroup role relations.
+    ``workgroups`` and ``users`` are lists of instances or ids that limit which rows are
+    rebuilt, if neither is given every membership is rebuilt.
+    """
+    memberships = WorkgroupMembership.objects.all()
+    if workgroups is not None:
+        memberships = memberships.filter(workgroup__in=workgroups)
+    if users is not None:
+        memberships = memberships.filter(user__in=users)
+
+    roles = {}
+    for role,field_name in perms.WORKGROUP_ROLE_FIELDS:
+        field = Workgroup._meta.get_field(field_name)
+        wg_name,user_name = field.m2m_field_name(),field.m2m_reverse_field_name()
+        links = field.rel.through.objects.all()
+        if workgroups is not None:
+            links = links.filter(**{wg_name+'__in':workgroups})
+        if users is not None:
+            links = links.filter(**{user_name+'__in':users})
+        for key in links.values_list(wg_name+'_id',user_name+'_id'):
+            roles[key] = roles.get(key,0) | perms.WORKGROUP_ROLE_BITS[role]
+
+    memberships.delete()
+    WorkgroupMembership.objects.bulk_create(
+        [WorkgroupMembership(workgroup_id=wg,user_id=user,roles=bits) for (wg,user),bits in roles.items()],
+        batch_size=500
+    )
+
+def sync_workgroup_membership(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ['post_add','post_remove','post_clear']:
+        return
+    # After a clear pk_set is empty, so everything for the instance is rebuilt.
+    others = None if action == 'post_clear' else list(pk_set)
+    if reverse:
+        rebuild_workgroup_memberships(workgroups=others,users=[instance.pk])
+    else:
+        rebuild_workgroup_memberships(workgroups=[instance.pk],users=others)
+
 class discussionAbstract(TimeStampedModel):
     body = models.TextField()
     author = models.ForeignKey(User)
@@ -378,6 +471,23 @@ class DiscussionComment(discussionAbstract):
 #    description = models.TextField()
 #    object = models.ForeignKey(managedObject)
 
+def _registration_summary(statuses):
+    """
+    Works out the cached registration summary fields of an item from the
+    ``(registration authority id, state)`` of each of its statuses.
+    """
+    statuses = sorted((int(ra),int(state)) for ra,state in statuses)
+    states = [state for ra,state in statuses]
+    return {
+        '_is_registered': len(states) > 0,
+        '_is_retired': len(states) > 0 and all(state == STATES.retired for state in states),
+        '_highest_state': max(states) if states else None,
+        '_registration_states': ",".join("%s:%s"%(ra,state) for ra,state in statuses),
+    }
+
+def _parse_registration_states(value):
+    return [tuple(int(x) for x in pair.split(":")) for pair in value.split(",") if pair]
+
 class ConceptQuerySet(InheritanceQuerySet):
     def visible(self,user):
         """
@@ -394,16 +504,26 @@ class ConceptQuerySet(InheritanceQuerySet):
             return self.all()
         if user.is_anonymous():
             return self.public()
+        principal = perms.get_principal(user)
         q = Q(_is_public=True)
-        if user.profile.workgroups:
+        if visibility_table_enabled():
+            grants = Q(workgroup__in=principal.workgroup_ids)
+            if principal.registrar_authority_ids:
+                grants |= Q(registrationAuthority__in=principal.registrar_authority_ids)
+            q |= Q(pk__in=ConceptVisibility.objects.filter(grants).values('concept'))
+            return self.filter(q)
+        if principal.workgroup_ids:
             # User can see everything in their workgroups.
-            q |= Q(workgroup__in=user.profile.workgroups)
-            # q |= Q(workgroup__user__profile=user)
-        if user.profile.is_registrar:
-            # User can see everything that is "readyToReview" or registered in their workgroup
-            q |= Q(workgroup__registrationAuthorities__in=user.profile.registrarAuthorities.all(),readyToReview=True)
-            q |= Q(workgroup__registrationAuthorities__in=user.profile.registrarAuthorities.all(),
-                    statuses__registrationAuthority__in=user.profile.registrarAuthorities.all())
+            q |= Q(workgroup__in=principal.workgroup_ids)
+        if principal.registrar_authority_ids:
+            ras = principal.registrar_authority_ids
+            # User can see everything that is "readyToReview" or registered in a workgroup
+            # of one of their authorities. These are subqueries rather than joins, so
+            # items with many statuses or authorities don't come back more than once.
+            ra_workgroups = Workgroup.registrationAuthorities.through.objects.filter(
+                registrationauthority__in=ras).values('workgroup')
+            registered = Status.objects.filter(registrationAuthority__in=ras).values('concept')
+            q |= Q(workgroup__in=ra_workgroups) & (Q(readyToReview=True) | Q(pk__in=registered))
         return self.filter(q)
     def editable(self,user):
         """
@@ -420,15 +540,15 @@ class ConceptQuerySet(InheritanceQuerySet):
             return self.all()
         if user.is_anonymous():
             return self.none()
-        q = Q()
-        if user.submitter_in.exists() or user.steward_in.exists():
-            if user.submitter_in.exists():
-                q |= Q(_is_locked=False,workgroup__in=user.submitter_in.all())
-            if user.steward_in.exists():
-                q |= Q(workgroup__in=user.steward_in.all())
-            return self.filter(q)
-        else:
+        principal = perms.get_principal(user)
+        if not principal.editor_workgroup_ids:
             return self.none()
+        q = Q()
+        if principal.submitter_workgroup_ids:
+            q |= Q(_is_locked=False,workgroup__in=principal.submitter_workgroup_ids)
+        if principal.steward_workgroup_ids:
+            q |= Q(workgroup__in=principal.steward_workgroup_ids)
+        return self.filter(q)
     def public(self):
         """
         Returns a list of public items from the queryset.
@@ -442,6 +562,70 @@ class ConceptQuerySet(InheritanceQuerySet):
             ObjectClass.objects.public().filter(name__contains="Person")
         """
         return self.filter(_is_public=True)
+    def recache_states(self):
+        """
+        Recomputes the cached public and locked flags for every item in the queryset.
+
+        Unlike ``_concept.recache_states`` this doesn't save each item. The new states are
+        worked out with two aggregate queries and written with bulk updates, so no signals
+        are sent and the search index is not updated. Returns the set of ids of items
+        whose flags changed, so they can be reindexed afterwards.
+        """
+        statuses = Status.objects.filter(concept__in=self.values('pk'))
+        # Statuses only count if they are from one of the workgroups authorities,
+        # unless the workgroup is owned by the whole registry.
+        statuses = statuses.filter(
+            Q(concept__workgroup__ownership=WORKGROUP_OWNERSHIP.registry) |
+            Q(concept__workgroup__ownership=WORKGROUP_OWNERSHIP.authority,
+                registrationAuthority__workgroups=F('concept__workgroup'))
+        )
+        public = set(statuses.filter(state__gte=F('registrationAuthority__public_state')).values_list('concept',flat=True))
+        locked = set(statuses.filter(state__gte=F('registrationAuthority__locked_state')).values_list('concept',flat=True))
+
+        updates = {}
+        for pk,is_public,is_locked in self.values_list('pk','_is_public','_is_locked'):
+            if is_public != (pk in public):
+                updates.setdefault(('_is_public',not is_public),[]).append(pk)
+            if is_locked != (pk in locked):
+                updates.setdefault(('_is_locked',not is_locked),[]).append(pk)
+
+        changed = set()
+        for (field,value),ids in updates.items():
+            for start in range(0,len(ids),RECACHE_BATCH_SIZE):
+                batch = ids[start:start+RECACHE_BATCH_SIZE]
+                _concept.objects.filter(pk__in=batch).update(**{field:value})
+            changed.update(ids)
+        for pk in changed:
+            # update() skips the signals, so cached permissions need to be told directly.
+            perms.bump_generation('concept',pk)
+        return changed
+
+    def recache_registration_summary(self):
+        """
+        Recomputes the cached registration summary of every item in the queryset from its
+        statuses, with bulk updates so no signals are sent. Returns the set of ids of items
+        whose summary changed.
+        """
+        states = {}
+        statuses = Status.objects.filter(concept__in=self.values('pk'))
+        for concept,ra,state in statuses.values_list('concept','registrationAuthority','state'):
+            states.setdefault(concept,[]).append((ra,state))
+
+        fields = ['_is_registered','_is_retired','_highest_state','_registration_states']
+        updates = {}
+        for row in self.values_list('pk',*fields):
+            summary = _registration_summary(states.get(row[0],[]))
+            new = tuple(summary[f] for f in fields)
+            if new != tuple(row[1:]):
+                updates.setdefault(new,[]).append(row[0])
+
+        changed = set()
+        for values,ids in updates.items():
+            for start in range(0,len(ids),RECACHE_BATCH_SIZE):
+                batch = ids[start:start+RECACHE_BATCH_SIZE]
+                _concept.objects.filter(pk__in=batch).update(**dict(zip(fields,values)))
+            changed.update(ids)
+        return changed
 
 class ConceptManager(InheritanceManager):
     """The ``ConceptManager`` is the default object manager for ``concept`` and
@@ -456,7 +640,7 @@ class ConceptManager(InheritanceManager):
         return ConceptQuerySet(self.model)
     def __getattr__(self, attr, *args):
         # Only let the slow ones through to the queryset
-        if attr in ['editable','visible','public']:
+        if attr in ['editable','visible','public','recache_states','recache_registration_summary']:
             return getattr(self.get_queryset(), attr, *args)
         else:
             return getattr(self.__class__, attr, *args)
@@ -476,49 +660,72 @@ class _concept(baseAristotleObject):
     # To be usable these must be updated when statuses are changed
     _is_public =  models.BooleanField(default=False)
     _is_locked =  models.BooleanField(default=False)
+    # A summary of the items statuses, so lists and search indexes don't need to query them.
+    # Like the states above, these must be updated when statuses are changed
+    _is_registered = models.BooleanField(default=False,editable=False)
+    _is_retired = models.BooleanField(default=False,editable=False)
+    _highest_state = models.IntegerField(blank=True,null=True,editable=False)
+    _registration_states = models.TextField(blank=True,editable=False)
+    # The concrete subclass of this item, so it can be fetched without searching every subclass table.
+    _type = models.ForeignKey(ContentType,blank=True,null=True,editable=False,related_name="+")
 
     class Meta:
         verbose_name = "item" # So the url_name works for items we can't determine
 
+    def save(self, *args, **kwargs):
+        if type(self) is not _concept or (self._type_id is None and self.pk is None):
+            self._type = ContentType.objects.get_for_model(self)
+        super(_concept, self).save(*args, **kwargs)
+
     def can_edit(self,user):
-        if self.is_public():
-            return self.workgroup.stewards.filter(pk=user.pk).exists()
-        elif self.is_locked():
-            return self.workgroup.stewards.filter(pk=user.pk).exists()
-        elif self.is_registered:
-            return self.workgroup.submitters.filter(pk=user.pk).exists() \
-                or self.workgroup.stewards.filter(pk=user.pk).exists()
-        else:
-            return self.workgroup.submitters.filter(pk=user.pk).exists() or self.workgroup.stewards.filter(pk=user.pk).exists()
+        principal = perms.get_principal(user)
+        if self.workgroup_id in principal.steward_workgroup_ids:
+            return True
+        if self.is_public() or self.is_locked():
+            # Only stewards can edit public or locked items
+            return False
+        return self.workgroup_id in principal.submitter_workgroup_ids
 
     def can_view(self,user):
         if self.is_public():
             return True
         elif user.is_anonymous():
             return False
+        principal = perms.get_principal(user)
         # If the user can view objects in this workgroup
-        if self.workgroup.members.filter(pk=user.pk).exists():
+        if self.workgroup_id in principal.workgroup_ids:
             return True
+        ras = principal.registrar_authority_ids
+        if not ras:
+            return False
         # if the item is registered and the user is a registrar view view permissions in that authority.
-        if self.is_registered:
-            for s in self.statuses.all():
-                ra = s.registrationAuthority
-                if ra.registrars.filter(pk=user.pk).exists():
-                    return True
+        if self.statuses.filter(registrationAuthority__in=ras).exists():
+            return True
         if self.readyToReview:
-            for ra in self.workgroup.registrationAuthorities.all():
-                if ra.registrars.filter(pk=user.pk).exists():
-                    return True
+            return RegistrationAuthority.objects.filter(workgroups=self.workgroup_id,pk__in=ras).exists()
         return False
 
 
     @property
     def item(self):
         """
-        Performs a lookup using ``model_utils.managers.InheritanceManager`` to find the
-        subclassed item
+        Returns the subclassed item. This uses the stored content type of the item to
+        fetch it from its own table with one query, falling back to a lookup using
+        ``model_utils.managers.InheritanceManager`` for items without one. The result is
+        remembered, so repeated calls on the same instance don't query again.
         """
-        return _concept.objects.get_subclass(pk=self.pk)
+        if not hasattr(self,'_item_cache'):
+            model = self._type_id and ContentType.objects.get_for_id(self._type_id).model_class()
+            item = None
+            if model is _concept:
+                item = self
+            elif model:
+                # The subclass row can already be gone while an item is being deleted.
+                item = model._default_manager.filter(pk=self.pk).first()
+            if item is None:
+                item = _concept.objects.get_subclass(pk=self.pk)
+            self._item_cache = item
+        return self._item_cache
 
     def relatedItems(self,user=None):
         return []
@@ -532,6 +739,14 @@ class _concept(baseAristotleObject):
     def get_absolute_url(self):
         return url_slugify_concept(self)
 
+    # The names of the foreign keys to items that are registered along with this item.
+    registry_cascade_fields = []
+
+    # The related data shown on the page for this item, which ``load_concept_page``
+    # fetches along with the item so the page can be rendered in a fixed number of queries.
+    page_select_related = ['workgroup']
+    page_prefetch_related = ['statuses__registrationAuthority']
+
     @property
     def registry_cascade_items(self):
         """
@@ -540,20 +755,38 @@ class _concept(baseAristotleObject):
         of class X is registered with `cascade=True` then that item, and item
         with returned by this method will all recieve the same registration.
         Reimplementations of this MUST return lists
+
+        Subclasses that cascade along foreign keys should list them in
+        ``registry_cascade_fields`` instead, so cascades can be worked out
+        without fetching each related item.
         """
-        return []
+        return [getattr(self,f) for f in self.registry_cascade_fields]
+
+    @property
+    def registration_states(self):
+        """
+        The ``(registration authority id, state)`` of each status of this item,
+        read from the cached registration summary.
+        """
+        return _parse_registration_states(self._registration_states)
+
+    @property
+    def registration_authority_ids(self):
+        return [ra for ra,state in self.registration_states]
 
     @property
     def is_registered(self):
-        return self.statuses.count() > 0
+        # Read from the stored summary, so an instance loaded before its statuses
+        # changed elsewhere needs to be fetched again.
+        return self._is_registered
 
     @property
     def is_superseded(self):
-        return all(STATES.superseded == status.state for status in self.statuses.all()) and self.superseded_by
+        return all(STATES.superseded == state for ra,state in self.registration_states) and self.superseded_by
 
     @property
     def is_retired(self):
-        return all(STATES.retired == status.state for status in self.statuses.all())and self.statuses.count() > 0
+        return self._is_retired
 
     def check_is_public(self):
         """
@@ -591,6 +824,9 @@ class _concept(baseAristotleObject):
     def recache_states(self):
         self._is_public = self.check_is_public()
         self._is_locked = self.check_is_locked()
+        summary = _registration_summary(self.statuses.values_list('registrationAuthority','state'))
+        for field,value in summary.items():
+            setattr(self,field,value)
         self.save()
 
 class concept(_concept):
@@ -613,6 +849,8 @@ class concept(_concept):
 
     objects = ConceptManager()
 
+    page_select_related = _concept.page_select_related + ['superseded_by']
+
     class Meta:
         abstract = True
 
@@ -661,14 +899,409 @@ class Status(TimeStampedModel):
                 ra=self.registrationAuthority
             )
 
+RegistrationResult = namedtuple('RegistrationResult',['item','permitted','created','updated','cascaded'])
+
+def _batches(seq,size=RECACHE_BATCH_SIZE):
+    seq = list(seq)
+    for start in range(0,len(seq),size):
+        yield seq[start:start+size]
+
+def resolve_subclasses(items):
+    """
+    Returns the subclassed versions of a queryset or list of ``_concept`` items, in the
+    same order. The ids are grouped by the stored content type of each item and each type
+    is fetched with one query, rather than joining every subclass table or fetching each
+    item on its own. Items without a stored type are looked up with ``select_subclasses``.
+    """
+    items = list(items)
+    by_type = {}
+    for item in items:
+        if isinstance(item,_concept) and type(item) is not _concept:
+            continue
+        by_type.setdefault(item._type_id,[]).append(item.pk)
+    resolved = {}
+    for type_id,ids in by_type.items():
+        model = type_id and ContentType.objects.get_for_id(type_id).model_class()
+        if model is _concept:
+            continue
+        elif model:
+            query = model._default_manager.all()
+        else:
+            query = _concept.objects.select_subclasses()
+        for batch in _batches(ids):
+            for obj in query.filter(pk__in=batch):
+                resolved[obj.pk] = obj
+    for item in items:
+        if type(item) is _concept and item.pk in resolved:
+            item._item_cache = resolved[item.pk]
+    return [resolved.get(item.pk,item) for item in items]
+
+REGISTRATION_AUTHORITY_NAMES_KEY = 'aristotle_mdr_registration_authority_names'
+
+def registration_authority_names():
+    """
+    Returns a dictionary of the names of every registration authority by id. The names are
+    kept in the cache, so showing the statuses of many items on a page doesn't query them.
+    """
+    names = cache.get(REGISTRATION_AUTHORITY_NAMES_KEY)
+    if names is None:
+        names = dict(RegistrationAuthority.objects.values_list('pk','name'))
+        cache.set(REGISTRATION_AUTHORITY_NAMES_KEY,names,None)
+    return names
+
+def load_concept_page(pk,model=None):
+    """
+    Fetches an item and the related data shown on its page, as declared by the
+    ``page_select_related`` and ``page_prefetch_related`` attributes of its class.
+
+    The item is fetched with:
+
+    * one query to find its type (skipped if ``model`` is a concrete item type),
+    * one query for the item and everything in ``page_select_related``,
+    * one query for each relation in ``page_prefetch_related`` not already covered by
+      ``page_select_related``, so two for ``statuses__registrationAuthority`` and one
+      for ``valueDomain__permissiblevalue_set`` on a data element.
+
+    For example, an object class takes 5 queries: its type, the item, its statuses,
+    their registration authorities and its data element concepts. The number of queries
+    doesn't depend on how many statuses, values or related items the item has.
+    Returns ``None`` if there is no item with the given id.
+    """
+    if model is None or model is _concept:
+        type_id = _concept.objects.filter(pk=pk).values_list('_type',flat=True).first()
+        model = type_id and ContentType.objects.get_for_id(type_id).model_class()
+        if not model:
+            # Items without a stored type can only be found by searching every subclass.
+            return _concept.objects.filter(pk=pk).select_subclasses().first()
+    return model._default_manager.filter(pk=pk).select_related(
+        *model.page_select_related
+    ).prefetch_related(
+        *model.page_prefetch_related
+    ).first()
+
+def _registrable_items(user,items):
+    """
+    Returns the items the user is allowed to change the status of,
+    following the same rules as ``perms.user_can_change_status``.
+    """
+    if user.is_superuser:
+        return items
+    ras = perms.get_principal(user).registrar_authority_ids
+    if not ras:
+        return []
+    ra_workgroups = set(Workgroup.registrationAuthorities.through.objects.filter(
+        registrationauthority__in=ras).values_list('workgroup',flat=True))
+    candidates = [i for i in items if i.workgroup_id in ra_workgroups]
+    visible = set()
+    for batch in _batches(candidates):
+        visible |= perms.user_can_view_many(user,batch)
+    return [i for i in candidates if i.pk in visible]
+
+def _cascade_ids(item):
+    if item.registry_cascade_fields:
+        # Read the foreign key ids directly so the related items aren't fetched one by one.
+        return [getattr(item,item._meta.get_field(f).attname) for f in item.registry_cascade_fields]
+    return [i.pk for i in item.registry_cascade_items if i is not None]
+
+def registration_plan(registrationAuthorities,items,user,cascade=False):
+    """
+    Works out what ``register_items`` would do, without changing anything.
+
+    If ``cascade`` is ``True`` the full cascade closure is computed up front, one level at a
+    time, fetching each level of items and checking permissions for it in batches. Every
+    item is only visited once, no matter how many items cascade to it, and items the user
+    can't change the status of aren't cascaded through.
+
+    Returns a list of ``RegistrationResult`` tuples, one per distinct item, giving the item,
+    whether the user can register it, the authorities it would be newly registered in, the
+    authorities whose existing status would be updated and whether it was reached by cascading.
+    """
+    ras = list(registrationAuthorities)
+    results = []
+    seen = set()
+    frontier = [getattr(i,'pk',i) for i in items]
+    cascaded = False
+    while frontier:
+        frontier = [pk for pk in frontier if pk is not None and pk not in seen]
+        seen.update(frontier)
+        level = []
+        for batch in _batches(frontier):
+            query = _concept.objects.filter(pk__in=batch)
+            level.extend(query.select_subclasses() if cascade else query)
+        permitted = set(i.pk for i in _registrable_items(user,level))
+        frontier = []
+        for item in level:
+            results.append(RegistrationResult(item,item.pk in permitted,[],[],cascaded))
+            if cascade and item.pk in permitted:
+                frontier.extend(_cascade_ids(item))
+        cascaded = True
+
+    existing = set()
+    for batch in _batches([r.item.pk for r in results if r.permitted]):
+        existing.update(Status.objects.filter(concept__in=batch,registrationAuthority__in=ras
+            ).values_list('concept','registrationAuthority'))
+    for result in results:
+        if result.permitted:
+            for ra in ras:
+                if (result.item.pk,ra.pk) in existing:
+                    result.updated.append(ra)
+                else:
+                    result.created.append(ra)
+    return results
+
+def register_items(registrationAuthorities,items,state,user,registrationDate=None,cascade=False,changeDetails=""):
+    """
+    Registers every item in every one of the given registration authorities, creating or
+    updating their ``Status`` records in bulk within a single transaction.
+
+    Permissions are checked for the whole set of items at once, and items the user can't
+    change the status of are skipped. The items to register, including the cascade closure
+    if ``cascade`` is ``True``, are worked out by ``registration_plan`` and each one is
+    registered, recached, reindexed and announced to its watchers exactly once.
+
+    The cached states and registration summary of the given items, and of the items in
+    the results, are refreshed so they can be used straight away.
+
+    Returns the list of ``RegistrationResult`` tuples from ``registration_plan``.
+    """
+    from aristotle_mdr.signals import update_search_index
+    if registrationDate is None:
+        registrationDate = timezone.now().date()
+    ras = list(registrationAuthorities)
+    items = list(items)
+
+    with transaction.atomic():
+        results = registration_plan(ras,items,user,cascade)
+        registered = [r for r in results if r.permitted]
+        touched = [r.item.pk for r in registered]
+        now = timezone.now()
+        for batch in _batches(touched):
+            Status.objects.filter(concept__in=batch,registrationAuthority__in=ras).update(
+                state=state, registrationDate=registrationDate,
+                changeDetails=changeDetails, modified=now
+            )
+        new_statuses = [
+            Status(
+                concept_id=result.item.pk, registrationAuthority=ra,
+                state=state, registrationDate=registrationDate,
+                changeDetails=changeDetails
+            )
+            for result in registered for ra in result.created
+        ]
+        Status.objects.bulk_create(new_statuses,batch_size=RECACHE_BATCH_SIZE)
+
+        revision = reversion.revision_context_manager
+        if revision.is_active() and not revision.is_managing_manually() and reversion.is_registered(Status):
+            # Bulk changes don't send signals, so add the statuses to the revision by hand
+            # so they still show in the registration history.
+            adapter = reversion.get_adapter(Status)
+            for batch in _batches(touched):
+                for status in Status.objects.filter(concept__in=batch,registrationAuthority__in=ras):
+                    revision.add_to_context(
+                        reversion.default_revision_manager, status, adapter.get_version_data(status)
+                    )
+
+        for batch in _batches(touched):
+            concepts = _concept.objects.filter(pk__in=batch)
+            concepts.update(modified=now)
+            concepts.recache_states()
+            concepts.recache_registration_summary()
+            if visibility_table_enabled():
+                rebuild_concept_visibility(concepts)
+        for pk in touched:
+            perms.bump_generation('concept',pk)
+        # The items aren't saved one by one, so queue the notifications concept_saved would have.
+        if bulk.active():
+            for pk in touched:
+                bulk.defer('changed',pk)
+        else:
+            ConceptChange.objects.bulk_create(
+                [ConceptChange(concept_id=pk) for pk in touched], batch_size=500
+            )
+    update_search_index(touched)
+    if touched and not bulk.active():
+        fanout.start()
+
+    # The items weren't saved one by one, so bring the instances the caller holds up to date.
+    fields = ['_is_public','_is_locked','_is_registered','_is_retired','_highest_state','_registration_states']
+    instances = [i for i in items if isinstance(i,_concept)] + [r.item for r in registered]
+    summaries = {}
+    for batch in _batches(touched):
+        for row in _concept.objects.filter(pk__in=batch).values_list('pk',*fields):
+            summaries[row[0]] = row[1:]
+    for item in instances:
+        if item.pk in summaries:
+            for field,value in zip(fields,summaries[item.pk]):
+                setattr(item,field,value)
+    return results
+
+def visibility_table_enabled():
+    """Is the materialized ``ConceptVisibility`` table being used and maintained?"""
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('USE_VISIBILITY_TABLE',False)
+
+class ConceptVisibility(models.Model):
+    """
+    A denormalised record of who can see an item, other than the public.
+
+    Each row grants visibility of a concept to either the members of a workgroup or
+    the registrars of a registration authority, so ``ConceptQuerySet.visible`` can check
+    a users groups against a single indexed table instead of joining through workgroups
+    and statuses. Rows are only maintained when ``USE_VISIBILITY_TABLE`` is set in
+    ``ARISTOTLE_SETTINGS``, and can be rebuilt with the ``rebuild_visibility`` command.
+    """
+    concept = models.ForeignKey(_concept,related_name="visibility_grants")
+    workgroup = models.ForeignKey(Workgroup,null=True,related_name="+")
+    registrationAuthority = models.ForeignKey(RegistrationAuthority,null=True,related_name="+")
+
+    class Meta:
+        index_together = [
+            ('workgroup','concept'),
+            ('registrationAuthority','concept'),
+        ]
+
+def rebuild_concept_visibility(concepts):
+    """
+    Recomputes the ``ConceptVisibility`` rows for every concept in the ``concepts``
+    queryset, using a fixed number of queries regardless of how many items there are.
+    """
+    ids = concepts.values('pk')
+    ConceptVisibility.objects.filter(concept__in=ids).delete()
+
+    workgroup_ras = {}
+    wg_ra_through = Workgroup.registrationAuthorities.through
+    for wg,ra in wg_ra_through.objects.filter(workgroup__in=concepts.values('workgroup')).values_list('workgroup_id','registrationauthority_id'):
+        workgroup_ras.setdefault(wg,set()).add(ra)
+
+    grants = set()
+    concept_workgroups = {}
+    for pk,wg,ready in concepts.values_list('pk','workgroup_id','readyToReview'):
+        concept_workgroups[pk] = wg
+        grants.add((pk,wg,None))
+        if ready:
+            # Registrars can see items that are ready for review in their workgroups
+            grants.update((pk,None,ra) for ra in workgroup_ras.get(wg,[]))
+    for pk,ra in Status.objects.filter(concept__in=ids).values_list('concept_id','registrationAuthority_id'):
+        # Registrars can see items their authority has registered, from their workgroups
+        if ra in workgroup_ras.get(concept_workgroups.get(pk),[]):
+            grants.add((pk,None,ra))
+
+    ConceptVisibility.objects.bulk_create(
+        [ConceptVisibility(concept_id=pk,workgroup_id=wg,registrationAuthority_id=ra) for pk,wg,ra in grants],
+        batch_size=500
+    )
+
+class RecacheJob(models.Model):
+    """
+    A queued recomputation of the public and locked states of the items affected by
+    a change to a workgroup or registration authority. See ``aristotle_mdr.recache``.
+
+    Items are processed in order of id, and ``last_item`` records how far the job has
+    got so an interrupted job carries on from where it stopped. Triggering the same job
+    again while it is still pending restarts it instead of queuing another. A worker
+    claims a job before running it, so it is only run by one worker at a time.
+    """
+    workgroup = models.ForeignKey(Workgroup,null=True,blank=True,related_name="+")
+    registrationAuthority = models.ForeignKey(RegistrationAuthority,null=True,blank=True,related_name="+")
+    reindex_all = models.BooleanField(default=False,
+            help_text=_("Reindex every affected item for search, not just those whose state changed."))
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True,blank=True)
+    finished = models.DateTimeField(null=True,blank=True)
+    restarts = models.IntegerField(default=0)
+    last_item = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(null=True,blank=True)
+    claimed_by = models.CharField(max_length=32,blank=True,
+            help_text=_("The worker running this job, if any."))
+    claimed = models.DateTimeField(null=True,blank=True,
+            help_text=_("When the worker running this job last recorded its progress."))
+
+    def __unicode__(self):
+        target = self.workgroup or self.registrationAuthority
+        if self.finished:
+            return "Recache of {target}: finished".format(target=target)
+        return "Recache of {target}: {done} of {total} items".format(
+            target=target, done=self.processed, total=self.total if self.total is not None else "?"
+        )
+
+    def items(self):
+        """The items this job recomputes, in the order they are processed."""
+        if self.workgroup_id is not None:
+            items = _concept.objects.filter(workgroup=self.workgroup_id)
+        else:
+            items = _concept.objects.filter(statuses__registrationAuthority=self.registrationAuthority_id)
+        return items.order_by('pk')
+
+class ConceptChange(models.Model):
+    """
+    A saved item whose watchers haven't been notified yet. These are queued by
+    ``concept_saved`` and removed once processed, see ``aristotle_mdr.fanout``.
+    A worker claims a change before sending its notifications, so they are only sent once.
+    """
+    concept = models.ForeignKey(_concept,related_name="+")
+    created = models.BooleanField(default=False,
+            help_text=_("The item was new, rather than an edit of an existing item."))
+    timestamp = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32,blank=True,
+            help_text=_("The worker sending the notifications for this change, if any."))
+    claimed = models.DateTimeField(null=True,blank=True,
+            help_text=_("When the worker sending the notifications for this change claimed it."))
+
+class SearchQueueEntry(models.Model):
+    """
+    An object whose search index entry is out of date, queued by ``QueuedSignalProcessor``.
+    There is only ever one entry per object, however often it changes before the queue
+    is flushed. Items are queued as ``_concept`` and resolved to their subclass when indexed.
+    """
+    content_type = models.ForeignKey(ContentType,related_name="+")
+    object_id = models.IntegerField()
+    remove = models.BooleanField(default=False,
+            help_text=_("The object was deleted, so should be removed from the index."))
+    queued = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('content_type','object_id')
+
+class SearchIndexState(models.Model):
+    """
+    How far the ``reindex_search`` command has got through reindexing one model in
+    one search connection, so an interrupted reindex can carry on where it stopped.
+    """
+    using = models.CharField(max_length=100)
+    content_type = models.ForeignKey(ContentType,related_name="+")
+    rebuild_started = models.DateTimeField(null=True,blank=True)
+    rebuild_finished = models.DateTimeField(null=True,blank=True)
+    rebuild_last_pk = models.IntegerField(default=0,
+            help_text=_("The highest id in the last range of objects that was written to the index."))
+    indexed_until = models.DateTimeField(null=True,blank=True,
+            help_text=_("Every change to the model before this time is in the index."))
+
+    class Meta:
+        unique_together = ('using','content_type')
+
+    def __unicode__(self):
+        return "{model} in {using}".format(model=self.content_type,using=self.using)
+
+class SearchIndexRemoval(models.Model):
+    """
+    A deleted item, kept so incremental reindexing can remove it from the index.
+    These are only recorded for models ``reindex_search`` has started indexing, and are
+    pruned once every search connection has caught up past them.
+    """
+    content_type = models.ForeignKey(ContentType,related_name="+")
+    object_id = models.IntegerField()
+    removed = models.DateTimeField(default=timezone.now,db_index=True)
+
 class ObjectClass(concept):
     template = "aristotle_mdr/concepts/objectClass.html"
+    page_prefetch_related = concept.page_prefetch_related + ['dataelementconcept_set']
 
     class Meta:
         verbose_name_plural = "Object Classes"
 
 class Property(concept):
     template = "aristotle_mdr/concepts/property.html"
+    page_prefetch_related = concept.page_prefetch_related + ['dataelementconcept_set']
     class Meta:
         verbose_name_plural = "Properties"
 
@@ -679,11 +1312,14 @@ class UnitOfMeasure(concept):
         verbose_name_plural = "Units Of Measure"
 
     template="aristotle_mdr/concepts/unitOfMeasure.html"
+    page_select_related = concept.page_select_related + ['measure']
+    page_prefetch_related = concept.page_prefetch_related + ['valuedomain_set']
     measure = models.ForeignKey(Measure, blank=True, null=True)
     symbol =  models.CharField(max_length=20,blank=True)
 
 class DataType(concept):
     template = "aristotle_mdr/concepts/dataType.html"
+    page_prefetch_related = concept.page_prefetch_related + ['valuedomain_set']
 
 class ConceptualDomain(concept):
     """
@@ -693,6 +1329,7 @@ class ConceptualDomain(concept):
     """
 
     template = "aristotle_mdr/concepts/conceptualDomain.html"
+    page_prefetch_related = concept.page_prefetch_related + ['dataelementconcept_set','valuedomain_set']
     #TODO: This needs to be changed to just 'description'
     value_description = models.TextField(_('description'),blank=True,
             help_text='Description or specification of a rule, reference, or range for a set of all value meanings for a Conceptual Domain')
@@ -723,6 +1360,10 @@ class ValueDomain(concept):
     """
 
     template = "aristotle_mdr/concepts/valueDomain.html"
+    page_select_related = concept.page_select_related + ['data_type','unit_of_measure']
+    page_prefetch_related = concept.page_prefetch_related + [
+        'permissiblevalue_set','supplementaryvalue_set','dataelement_set'
+    ]
 
     data_type = models.ForeignKey(DataType,blank=True,null=True)
     format = models.CharField(max_length=100,blank=True,null=True)
@@ -775,25 +1416,30 @@ class SupplementaryValue(AbstractValue):
 
 
 class DataElementConcept(concept):
-    property_ = property #redefine in this context as we need 'property' for the 11179 terminology
     template = "aristotle_mdr/concepts/dataElementConcept.html"
+    page_select_related = concept.page_select_related + ['objectClass','property']
+    page_prefetch_related = concept.page_prefetch_related + ['dataelement_set']
     objectClass = models.ForeignKey(ObjectClass,blank=True,null=True)
     property = models.ForeignKey(Property,blank=True,null=True)
     conceptualDomain = models.ForeignKey(ConceptualDomain,blank=True,null=True)
 
-    @property_
-    def registry_cascade_items(self):
-        return [self.objectClass,self.property]
+    registry_cascade_fields = ['objectClass','property']
 
 # Yes this name looks bad - blame 11179:3:2013 for renaming "administered item" to "concept"
 class DataElement(concept):
     template = "aristotle_mdr/concepts/dataElement.html"
+    page_select_related = concept.page_select_related + [
+        'dataElementConcept__objectClass','dataElementConcept__property',
+        'valueDomain__data_type','valueDomain__unit_of_measure'
+    ]
+    page_prefetch_related = concept.page_prefetch_related + [
+        'valueDomain__permissiblevalue_set','valueDomain__supplementaryvalue_set',
+        'input_to_derivation','derived_from'
+    ]
     dataElementConcept = models.ForeignKey(DataElementConcept,verbose_name = "Data Element Concept",blank=True,null=True)
     valueDomain = models.ForeignKey(ValueDomain,verbose_name = "Value Domain",blank=True,null=True)
 
-    @property
-    def registry_cascade_items(self):
-        return [self.dataElementConcept,self.valueDomain]
+    registry_cascade_fields = ['dataElementConcept','valueDomain']
 
 
 class DataElementDerivation(concept):
@@ -804,10 +1450,14 @@ class DataElementDerivation(concept):
                 blank=True,null=True)
     derivation_rule = models.TextField(blank=True)
 
+    page_select_related = concept.page_select_related + ['derives']
+    page_prefetch_related = concept.page_prefetch_related + ['inputs']
+
 
 class Package(concept):
     items = models.ManyToManyField(_concept,related_name="packages",blank=True,null=True)
     template = "aristotle_mdr/concepts/package.html"
+    page_prefetch_related = concept.page_prefetch_related + ['items']
 
     @property
     def classedItems(self):
@@ -839,10 +1489,7 @@ class PossumProfile(models.Model):
         if self.user.is_superuser:
             return Workgroup.objects.all()
         else:
-            return (self.user.viewer_in.all()    |\
-                    self.user.submitter_in.all() |\
-                    self.user.steward_in.all()   |\
-                    self.user.workgroup_manager_in.all()).distinct()
+            return Workgroup.objects.filter(memberships__user=self.user)
 
     @property
     def myWorkgroups(self):
@@ -882,9 +1529,110 @@ def create_user_profile(sender, instance, created, **kwargs):
 post_save.connect(create_user_profile, sender=User)
 
 def recache_concept_states(sender, instance, created, **kwargs):
+    if bulk.defer('recache',instance.concept_id):
+        return
     instance.concept.recache_states()
 post_save.connect(recache_concept_states, sender=Status)
 
+@receiver(post_delete,sender=Status)
+def recache_deleted_status_concept(sender, instance, **kwargs):
+    # Saving a status saves the item, so mark the item as changed here too
+    # for incremental reindexing to pick it up.
+    _concept.objects.filter(pk=instance.concept_id).update(modified=timezone.now())
+    if bulk.defer('recache',instance.concept_id):
+        return
+    _concept.objects.filter(pk=instance.concept_id).recache_registration_summary()
+
+@receiver(post_delete)
+def record_search_index_removal(sender, instance, **kwargs):
+    # Only the concrete item types are indexed, not the _concept row deleted along with them.
+    if issubclass(sender, _concept) and sender is not _concept:
+        content_type = ContentType.objects.get_for_model(sender)
+        # Removals are only needed by incremental reindexing, which needs a reindex_search run
+        # to have started first, and are only pruned once it has. Otherwise they'd never be removed.
+        if SearchIndexState.objects.filter(content_type=content_type).exists():
+            SearchIndexRemoval.objects.create(content_type=content_type,object_id=instance.pk)
+
+# Cached permission decisions are keyed on generation counters for the item,
+# its workgroup and the users registration authorities. These receivers move the
+# counters on whenever something a decision depends on changes.
+PERMISSION_GENERATION_KINDS = {Workgroup:'workgroup', RegistrationAuthority:'ra'}
+
+@receiver(post_save)
+def bump_concept_generation(sender, instance, **kwargs):
+    if issubclass(sender, _concept):
+        perms.bump_generation('concept',instance.pk)
+
+@receiver(post_save,sender=Status)
+@receiver(post_delete,sender=Status)
+def bump_status_concept_generation(sender, instance, **kwargs):
+    perms.bump_generation('concept',instance.concept_id)
+
+@receiver(post_save,sender=Workgroup)
+@receiver(post_save,sender=RegistrationAuthority)
+def bump_group_generation(sender, instance, **kwargs):
+    perms.bump_generation(PERMISSION_GENERATION_KINDS[sender],instance.pk)
+
+def bump_group_membership_generation(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ['post_add','post_remove','post_clear']:
+            perms.bump_generation(PERMISSION_GENERATION_KINDS[instance.__class__],instance.pk)
+        return
+    # The relation was changed from the users side, so every group in pk_set changed.
+    kind = PERMISSION_GENERATION_KINDS[model]
+    if action == 'pre_clear':
+        group_field = [f for f in sender._meta.fields if f.rel and f.rel.to == model][0]
+        user_field = [f for f in sender._meta.fields if f.rel and f.rel.to == instance.__class__][0]
+        pk_set = sender.objects.filter(**{user_field.name:instance.pk}).values_list(group_field.attname,flat=True)
+    elif action not in ['post_add','post_remove']:
+        return
+    for pk in pk_set:
+        perms.bump_generation(kind,pk)
+    perms.clear_principal(instance)
+
+@receiver(post_save,sender=RegistrationAuthority)
+@receiver(post_delete,sender=RegistrationAuthority)
+def clear_registration_authority_names(sender, instance, **kwargs):
+    cache.delete(REGISTRATION_AUTHORITY_NAMES_KEY)
+
+@receiver(post_save)
+def update_concept_visibility(sender, instance, **kwargs):
+    if not issubclass(sender, _concept) or kwargs.get('raw') or not visibility_table_enabled():
+        return
+    if bulk.defer('visibility',instance.pk):
+        return
+    rebuild_concept_visibility(_concept.objects.filter(pk=instance.pk))
+
+@receiver(post_save,sender=Status)
+@receiver(post_delete,sender=Status)
+def update_status_concept_visibility(sender, instance, **kwargs):
+    if kwargs.get('raw') or not visibility_table_enabled():
+        return
+    if bulk.defer('visibility',instance.concept_id):
+        return
+    rebuild_concept_visibility(_concept.objects.filter(pk=instance.concept_id))
+
+def update_workgroup_visibility(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add','post_remove','post_clear'] or not visibility_table_enabled():
+        return
+    if not reverse:
+        concepts = _concept.objects.filter(workgroup=instance)
+    elif pk_set is not None:
+        concepts = _concept.objects.filter(workgroup__in=pk_set)
+    else:
+        # All workgroups were removed from an authority, so only its own grants can be stale.
+        stale = ConceptVisibility.objects.filter(registrationAuthority=instance).values_list('concept',flat=True)
+        concepts = _concept.objects.filter(pk__in=list(stale))
+    rebuild_concept_visibility(concepts)
+m2m_changed.connect(update_workgroup_visibility, sender=Workgroup.registrationAuthorities.through)
+
+for field_name in ['viewers','submitters','stewards','managers','registrationAuthorities']:
+    m2m_changed.connect(bump_group_membership_generation, sender=getattr(Workgroup,field_name).through)
+for field_name in ['viewers','submitters','stewards','managers']:
+    m2m_changed.connect(sync_workgroup_membership, sender=getattr(Workgroup,field_name).through)
+for field_name in ['registrars','managers']:
+    m2m_changed.connect(bump_group_membership_generation, sender=getattr(RegistrationAuthority,field_name).through)
+
 
 #"""
 #A collection is a user specified sharable collections of content.
@@ -953,16 +1701,6 @@ def defaultData():
             print("{name}".format(name=name),end="")
         print("")
 
-def favourite_updated(recipient,obj):
-    notify.send(obj, recipient=recipient, verb="changed a favourited item",
-                comment=_('A favourite item (%(item)s) has been changed.') % {'item': obj})
-def workgroup_item_updated(recipient,obj):
-    notify.send(obj, recipient=recipient, verb="motified item in workgroup", target=obj.workgroup,
-                comment=_('An item (%(item)s) has been updated in the workgroup "%(workgroup)s"') % {'item':obj, 'workgroup': obj.workgroup})
-def workgroup_item_new(recipient,obj):
-    notify.send(obj, recipient=recipient, verb="new item in workgroup", target=obj.workgroup,
-                comment=_('An new item (%(item)s) is in the workgroup "%(workgroup)s"') % {'item':obj, 'workgroup': obj.workgroup})
-
 @receiver(post_save)
 def concept_saved(sender, instance, created, **kwargs):
     if not issubclass(sender, _concept):
@@ -970,29 +1708,11 @@ def concept_saved(sender, instance, created, **kwargs):
     if kwargs.get('raw'):
         # Don't run during loaddata
         return
-    for p in instance.favourited_by.all():
-        favourite_updated(recipient=p.user,obj=instance)
-    for user in instance.workgroup.viewers.all():
-        if created:
-            workgroup_item_new(recipient=user,obj=instance)
-        else:
-            workgroup_item_updated(recipient=user,obj=instance)
-    try:
-        # This will fail during first load, and if admins delete aristotle.
-        system = User.objects.get(username="aristotle")
-        for post in instance.relatedDiscussions.all():
-            DiscussionComment.objects.create(
-                post = post,
-                body = 'The item "{name}" (id:{iid}) has been changed.\n\n\
-                    <a href="{url}">View it on the main site.</a>.'.format(
-                    name=instance.name,
-                    iid = instance.id,
-                    url = reverse("aristotle:item",args=[instance.id])
-                ),
-                author = system,
-            )
-    except:
-        pass
+    if bulk.defer('changed',instance.pk,created=created):
+        return
+    # Notifying watchers can mean hundreds of rows, so it is done after the save in batches.
+    fanout.queue_concept_change(instance,created=created)
+
 @receiver(post_save,sender=DiscussionComment)
 def new_comment_created(sender, **kwargs):
     comment = kwargs['instance']
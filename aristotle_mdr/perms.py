@@ -1,37 +1,193 @@
 from django.contrib.auth.models import User
 from django.core.cache import cache
+import hashlib
+import time
+
+WORKGROUP_ROLE_FIELDS = (
+    ('viewer','viewers'),
+    ('submitter','submitters'),
+    ('steward','stewards'),
+    ('manager','managers'),
+)
+# The bit each role sets in WorkgroupMembership.roles
+WORKGROUP_ROLE_BITS = {
+    'viewer':1,
+    'submitter':2,
+    'steward':4,
+    'manager':8,
+}
+
+class UserPrincipal(object):
+    """
+    A snapshot of the workgroups and registration authorities a user belongs to.
+
+    The ids are fetched the first time they are needed and never change afterwards,
+    so a principal should only live as long as a request. Use ``get_principal``
+    rather than creating these directly.
+    """
+    def __init__(self,user):
+        self.user_id = user.pk
+        self.is_superuser = user.is_superuser
+        self.is_anonymous = user.is_anonymous()
+        self._workgroup_roles = None
+        self._registrar_authority_ids = None
+
+    def _fetch_workgroup_roles(self):
+        # One indexed query on the membership table, rather than one query per relation.
+        from aristotle_mdr.models import WorkgroupMembership
+        roles = dict((role,set()) for role,field_name in WORKGROUP_ROLE_FIELDS)
+        for workgroup_id,bits in WorkgroupMembership.objects.filter(user_id=self.user_id).values_list('workgroup_id','roles'):
+            for role,bit in WORKGROUP_ROLE_BITS.items():
+                if bits & bit:
+                    roles[role].add(workgroup_id)
+        return dict((role,frozenset(ids)) for role,ids in roles.items())
+
+    @property
+    def workgroup_roles(self):
+        if self._workgroup_roles is None:
+            if self.is_anonymous:
+                self._workgroup_roles = dict((role,frozenset()) for role,field_name in WORKGROUP_ROLE_FIELDS)
+            else:
+                self._workgroup_roles = self._fetch_workgroup_roles()
+        return self._workgroup_roles
+
+    @property
+    def registrar_authority_ids(self):
+        if self._registrar_authority_ids is None:
+            if self.is_anonymous:
+                self._registrar_authority_ids = frozenset()
+            else:
+                from aristotle_mdr.models import RegistrationAuthority
+                field = RegistrationAuthority._meta.get_field('registrars')
+                self._registrar_authority_ids = frozenset(
+                    field.rel.through.objects.filter(
+                        **{field.m2m_reverse_field_name():self.user_id}
+                    ).values_list(field.m2m_column_name(),flat=True)
+                )
+        return self._registrar_authority_ids
+
+    @property
+    def workgroup_ids(self):
+        """All workgroups the user holds any role in."""
+        return frozenset().union(*self.workgroup_roles.values())
+    @property
+    def viewer_workgroup_ids(self):
+        return self.workgroup_roles['viewer']
+    @property
+    def submitter_workgroup_ids(self):
+        return self.workgroup_roles['submitter']
+    @property
+    def steward_workgroup_ids(self):
+        return self.workgroup_roles['steward']
+    @property
+    def manager_workgroup_ids(self):
+        return self.workgroup_roles['manager']
+    @property
+    def editor_workgroup_ids(self):
+        return self.submitter_workgroup_ids | self.steward_workgroup_ids
+
+def get_principal(user):
+    """
+    Returns the ``UserPrincipal`` for the user, building it the first time it is asked for.
+    The principal is stored on the user object, so it is shared by everything that
+    handles the same ``request.user``.
+    """
+    principal = getattr(user,'_aristotle_principal',None)
+    if principal is None:
+        principal = UserPrincipal(user)
+        user._aristotle_principal = principal
+    return principal
+
+def clear_principal(user):
+    """Forget the cached principal for a user, for use after their roles change."""
+    user.__dict__.pop('_aristotle_principal',None)
 
 def user_can_alter_comment(user,comment):
     return user.is_superuser or user == comment.author or user_is_workgroup_manager(user,comment.post.workgroup)
 def user_can_alter_post(user,post):
     return user.is_superuser or user == post.author or user_is_workgroup_manager(user,post.workgroup)
 
-def user_can_view(user,item):
-    """Can the user view the item?"""
-    if user.is_superuser: return True
-    if item.__class__ == User:              # -- Sometimes duck-typing fails --
-        return user == item                 # A user can edit their own details
+PERMISSION_CACHE_TIMEOUT = 60*60*6
+
+def _permission_cache_timeout():
+    from django.conf import settings
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('PERMISSION_CACHE_TIMEOUT',PERMISSION_CACHE_TIMEOUT)
+
+def _generation_key(kind,pk):
+    return 'aristotle_perms_gen|%s|%s'%(kind,pk)
 
+def _new_generation():
+    # Counters start from the current time, so a counter that has been evicted
+    # from the cache never comes back with a value it has already handed out.
+    return int(time.time()*1000)
+
+def get_generations(keys):
+    """
+    Returns a dict of the current generation for each ``(kind,pk)`` in ``keys``,
+    starting a counter for any that aren't in the cache yet.
+    """
+    cache_keys = dict((_generation_key(kind,pk),(kind,pk)) for kind,pk in keys)
+    found = cache.get_many(list(cache_keys.keys()))
+    generations = {}
+    for cache_key,key in cache_keys.items():
+        gen = found.get(cache_key)
+        if gen is None:
+            gen = _new_generation()
+            if not cache.add(cache_key,gen,None):
+                gen = cache.get(cache_key,gen)
+        generations[key] = gen
+    return generations
+
+def bump_generation(kind,pk):
+    """
+    Invalidates every cached permission decision that depends on the given object,
+    by moving its generation counter on.
+    """
+    if pk is None:
+        return
+    cache_key = _generation_key(kind,pk)
+    try:
+        cache.incr(cache_key)
+    except ValueError:
+        cache.set(cache_key,_new_generation(),None)
+
+def _decision_key(action,user,item):
+    """
+    Builds a cache key for a permission decision on a concept that is only valid
+    while the item, its workgroup and the users registration authorities are unchanged.
+    The key has the same length however many authorities the user is a registrar in.
+    """
     if user.is_anonymous():
         user_key = "anonymous"
+        ra_ids = []
     else:
         user_key = str(user.id)
+        ra_ids = sorted(get_principal(user).registrar_authority_ids)
+    keys = [('concept',item.pk),('workgroup',item.workgroup_id)]+[('ra',ra) for ra in ra_ids]
+    generations = get_generations(keys)
+    # Hashed, as a registrar can be in any number of authorities and memcached limits keys to 250 characters.
+    description = "|".join("%s:%s:%s"%(kind,pk,generations[(kind,pk)]) for kind,pk in keys)
+    return 'user_can_%s|%s|%s|%s'%(
+        action, user_key, item.pk, hashlib.md5(description.encode('utf-8')).hexdigest()
+    )
 
-    # If the item was modified in the last 15 seconds, don't use cache
-    if hasattr(item, "was_modified_very_recently") and item.was_modified_very_recently() :
-        can_use_cache = False
-    else:
-        can_use_cache = True
-
-    cached_can_view = cache.get('user_can_view_%s|%s'%(user_key,str(item.id)))
-    if can_use_cache and cached_can_view is not None:
-        return cached_can_view
+def _cached_decision(action,user,item,check):
+    from aristotle_mdr.models import _concept
+    if not isinstance(item,_concept):
+        return check(user)
+    key = _decision_key(action,user,item)
+    decision = cache.get(key)
+    if decision is None:
+        decision = check(user)
+        cache.set(key,decision,_permission_cache_timeout())
+    return decision
 
-    _can_view = False
-    # A user can view their own details
-    _can_view = item.can_view(user)
-    cache.set('user_can_view_%s|%s'%(str(user.id),str(item.id)),_can_view,120)
-    return _can_view
+def user_can_view(user,item):
+    """Can the user view the item?"""
+    if user.is_superuser: return True
+    if item.__class__ == User:              # -- Sometimes duck-typing fails --
+        return user == item                 # A user can edit their own details
+    return _cached_decision('view',user,item,item.can_view)
 
 def user_can_edit(user,item):
     """Can the user edit the item?"""
@@ -39,52 +195,68 @@ def user_can_edit(user,item):
     if user.is_anonymous(): return False    # Anonymous users can edit nothing
     if item.__class__ == User:              # -- Sometimes duck-typing fails --
         return user == item                 # A user can edit their own details
+    return _cached_decision('edit',user,item,item.can_edit)
 
-    # If the item was modified in the last 15 seconds, don't use cache
-    if hasattr(item, "was_modified_very_recently") and item.was_modified_very_recently :
-        can_use_cache = False
-    else:
-        can_use_cache = True
-
-    cached_can_edit = cache.get('user_can_edit_%s|%s'%(str(user.id),str(item.id)))
-    if can_use_cache and cached_can_edit is not None:
-        return cached_can_edit
+def _concept_ids(items):
+    # Querysets are kept as a subquery, anything else is reduced to a list of ids.
+    from django.db.models.query import QuerySet
+    if isinstance(items,QuerySet):
+        return items.values('pk')
+    return [getattr(i,'pk',i) for i in items]
 
-    _can_edit = False
+def user_can_view_many(user,items):
+    """
+    Returns the set of ids for the concepts in ``items`` that the user can view.
+    ``items`` can be a queryset or any iterable of concepts (or concept ids), and the
+    check takes a single query regardless of how many items are given.
+    """
+    from aristotle_mdr.models import _concept
+    ids = _concept_ids(items)
+    if user.is_superuser and isinstance(ids,list):
+        return set(ids)
+    return set(_concept.objects.filter(pk__in=ids).visible(user).values_list('pk',flat=True))
 
-    if not user_can_view(user,item):
-        _can_edit = False
-
-    _can_edit = item.can_edit(user)
-    cache.set('user_can_edit_%s|%s'%(str(user.id),str(item.id)),_can_edit,60)
-
-    return _can_edit
+def user_can_edit_many(user,items):
+    """
+    Returns the set of ids for the concepts in ``items`` that the user can edit.
+    ``items`` can be a queryset or any iterable of concepts (or concept ids), and the
+    check takes a single query regardless of how many items are given.
+    """
+    from aristotle_mdr.models import _concept
+    if user.is_anonymous():
+        return set()
+    ids = _concept_ids(items)
+    if user.is_superuser and isinstance(ids,list):
+        return set(ids)
+    return set(_concept.objects.filter(pk__in=ids).editable(user).values_list('pk',flat=True))
 
 def user_is_editor(user,workgroup=None):
     if user.is_superuser:
         return True
-    elif workgroup is None:
-        return user.submitter_in.count() > 0 or user.steward_in.count() > 0
+    editor_workgroups = get_principal(user).editor_workgroup_ids
+    if workgroup is None:
+        return len(editor_workgroups) > 0
     else:
-        return user.submitter_in.filter(workgroup=workgroup).exists() or \
-                user.steward_in.filter(workgroup=workgroup).exists()
+        return workgroup.pk in editor_workgroups
 
 def user_is_registrar(user,ra=None):
     if user.is_superuser:
         return True
-    elif ra is None:
-        return user.registrar_in.count() > 0
+    registrar_authorities = get_principal(user).registrar_authority_ids
+    if ra is None:
+        return len(registrar_authorities) > 0
     else:
-        return user in ra.registrars.all()
+        return ra.pk in registrar_authorities
 
 
 def user_is_workgroup_manager(user,workgroup=None):
     if user.is_superuser:
         return True
-    elif workgroup is None:
-        return user.workgroup_manager_in.count() > 0
+    managed_workgroups = get_principal(user).manager_workgroup_ids
+    if workgroup is None:
+        return len(managed_workgroups) > 0
     else:
-        return user in workgroup.managers.all()
+        return workgroup.pk in managed_workgroups
 
 def user_can_change_status(user,item):
     """Can the user change the status of the item?"""
@@ -96,15 +268,17 @@ def user_can_change_status(user,item):
     if user.is_superuser:
         return True
     # TODO: restrict to only those registration authorities of that items based on the items workgroup, unless the item is visible to the user.
-    if can_view or item.readyToReview:
-        return user.registrar_in.count() > 0 and \
-                True in (user in ra.registrars.all()
-                        for ra in item.workgroup.registrationAuthorities.all())
+    registrar_authorities = get_principal(user).registrar_authority_ids
+    if registrar_authorities and (can_view or item.readyToReview):
+        from aristotle_mdr.models import RegistrationAuthority
+        return RegistrationAuthority.objects.filter(
+            workgroups=item.workgroup_id,pk__in=registrar_authorities
+        ).exists()
     return False
 
 def user_in_workgroup(user,wg):
     if user.is_superuser:
         return True
-    return user in wg.members
+    return wg.pk in get_principal(user).workgroup_ids
 
 
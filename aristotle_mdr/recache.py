@@ -0,0 +1,198 @@
+"""
+Background recomputation of cached item states
+==============================================
+
+Changing the public or locked thresholds of a registration authority, or the
+ownership or authorities of a workgroup, can change whether thousands of items are
+public or locked. Rather than recomputing these while the change is being saved,
+the signal handlers in ``aristotle_mdr.models`` queue a ``RecacheJob`` which is
+worked through in chunks.
+
+How jobs are run is controlled by ``RECACHE_MODE`` in ``ARISTOTLE_SETTINGS``:
+
+``thread``
+    (The default) Jobs are run by a background thread in the current process. As the
+    thread uses its own database connection, it only sees a job once the save that
+    queued it has been committed, so it waits up to ``WORKER_IDLE_SECONDS`` for more
+    jobs before stopping.
+``immediate``
+    Jobs are run as soon as they are queued, before the triggering save returns.
+``manual``
+    Jobs are only run by the ``process_recache_jobs`` management command, for
+    sites that would rather run them from a scheduler or separate worker.
+
+Interrupted jobs carry on from the last completed chunk the next time jobs are run.
+A worker claims each job before running it and renews the claim after every chunk, so
+workers in several processes never run the same job at once. The claim on a job whose
+worker has died lapses after ``RECACHE_CLAIM_SECONDS``, and another worker takes it over.
+"""
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RECACHE_CHUNK_SIZE = 1000
+RECACHE_CLAIM_SECONDS = 60*10
+WORKER_IDLE_SECONDS = 30
+WORKER_POLL_SECONDS = 1
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def recache_mode():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('RECACHE_MODE','thread')
+
+def queue_recache(workgroup=None,registrationAuthority=None,reindex_all=False):
+    """
+    Queues a recomputation of the states of the items in a workgroup or registered
+    by a registration authority, and starts it according to ``RECACHE_MODE``.
+
+    If a job for the same workgroup or authority is already waiting or running it is
+    restarted from the beginning, so repeated changes only cause one pass over the items.
+    """
+    from aristotle_mdr.models import RecacheJob
+    pending = RecacheJob.objects.filter(
+        workgroup=workgroup, registrationAuthority=registrationAuthority,
+        finished__isnull=True
+    )
+    changes = {'last_item':0, 'processed':0, 'restarts':F('restarts')+1}
+    if reindex_all:
+        changes['reindex_all'] = True
+    if not pending.update(**changes):
+        RecacheJob.objects.create(
+            workgroup=workgroup, registrationAuthority=registrationAuthority,
+            reindex_all=reindex_all
+        )
+    mode = recache_mode()
+    if mode == 'immediate':
+        process_recache_jobs()
+    elif mode == 'thread':
+        start_worker()
+
+def claimable_jobs():
+    """
+    The unfinished jobs that no worker is running, including those whose worker has stopped
+    renewing its claim.
+    """
+    from aristotle_mdr.models import RecacheJob
+    lapsed = timezone.now() - datetime.timedelta(seconds=RECACHE_CLAIM_SECONDS)
+    return RecacheJob.objects.filter(finished__isnull=True).filter(Q(claimed__isnull=True)|Q(claimed__lt=lapsed))
+
+def claim_job(worker):
+    """
+    Claims the oldest job no other worker is running for ``worker``, returning it, or
+    ``None`` if there are none. The claim is taken with a conditional update, so only
+    one worker can win a job.
+    """
+    while True:
+        job = claimable_jobs().order_by('created','pk').first()
+        if job is None:
+            return None
+        # Only matches if the job is still claimable, so losing a race just moves on to the next job.
+        if claimable_jobs().filter(pk=job.pk).update(claimed_by=worker,claimed=timezone.now()):
+            job.claimed_by = worker
+            return job
+
+def process_recache_jobs(chunk_size=None,progress=None):
+    """
+    Runs every unfinished ``RecacheJob`` that no other worker is running, in the order
+    they were queued. If ``progress`` is given, it is called with each job after every chunk.
+    """
+    from aristotle_mdr.models import RecacheJob
+    worker = uuid.uuid4().hex
+    while True:
+        job = claim_job(worker)
+        if job is None:
+            return
+        try:
+            run_job(job,chunk_size or RECACHE_CHUNK_SIZE,progress)
+        finally:
+            RecacheJob.objects.filter(pk=job.pk,claimed_by=worker).update(claimed_by="",claimed=None)
+
+def run_job(job,chunk_size,progress=None):
+    """
+    Runs a job claimed by ``job.claimed_by``, stopping early if another worker takes it over.
+    """
+    from aristotle_mdr.models import RecacheJob, _concept
+    from aristotle_mdr.signals import update_search_index
+    worker = job.claimed_by
+
+    if job.started is None:
+        job.started = timezone.now()
+        RecacheJob.objects.filter(pk=job.pk).update(started=job.started)
+    job.total = job.items().count()
+    RecacheJob.objects.filter(pk=job.pk).update(total=job.total)
+
+    while True:
+        ids = list(job.items().filter(pk__gt=job.last_item).values_list('pk',flat=True)[:chunk_size])
+        if not ids:
+            # Only finish if the job wasn't restarted after the last chunk.
+            if RecacheJob.objects.filter(pk=job.pk,restarts=job.restarts,claimed_by=worker).update(finished=timezone.now()):
+                logger.info("Recache job %s for %s items has finished" % (job.pk,job.total))
+                return
+            job = RecacheJob.objects.get(pk=job.pk)
+            if job.claimed_by != worker:
+                return
+            continue
+        with transaction.atomic():
+            changed = _concept.objects.filter(pk__in=ids).recache_states()
+        update_search_index(ids if job.reindex_all else changed)
+
+        # Only record progress if the job wasn't restarted while this chunk was running,
+        # otherwise the next chunk starts again from the beginning.
+        RecacheJob.objects.filter(pk=job.pk,restarts=job.restarts,claimed_by=worker).update(
+            last_item=ids[-1], processed=F('processed')+len(ids)
+        )
+        # Renew the claim, so other workers know this one is still running the job.
+        RecacheJob.objects.filter(pk=job.pk,claimed_by=worker).update(claimed=timezone.now())
+        job = RecacheJob.objects.get(pk=job.pk)
+        if job.claimed_by != worker:
+            logger.warning("Recache job %s was taken over by another worker" % job.pk)
+            return
+        if progress:
+            progress(job)
+
+def _work():
+    global _worker
+    try:
+        idle = 0
+        while True:
+            process_recache_jobs()
+            with _worker_lock:
+                # Keep checking for a while before stopping, so jobs queued inside a
+                # transaction that hadn't been committed yet aren't left waiting.
+                if claimable_jobs().exists():
+                    idle = 0
+                    continue
+                if idle >= WORKER_IDLE_SECONDS:
+                    _worker = None
+                    return
+            time.sleep(WORKER_POLL_SECONDS)
+            idle += WORKER_POLL_SECONDS
+    except Exception:
+        with _worker_lock:
+            _worker = None
+        logger.exception("Background recache of item states failed, unfinished jobs will resume next time")
+    finally:
+        connection.close()
+
+def start_worker():
+    """
+    Starts the background worker thread, unless it is already running. The worker stops
+    once there have been no jobs to run for ``WORKER_IDLE_SECONDS``.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            return
+        _worker = threading.Thread(target=_work,name="aristotle-recache")
+        _worker.daemon = True
+        _worker.start()
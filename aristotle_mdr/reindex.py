@@ -0,0 +1,211 @@
+"""
+Parallel search reindexing
+==========================
+
+Used by the ``reindex_search`` management command. Each indexed model is split into
+ranges of ids, and the search documents for each range are prepared in a pool of
+worker processes. As some backends, such as Whoosh, only allow one writer at a time,
+the prepared documents are sent back and written to the index by the calling process,
+in order of id.
+
+Progress is recorded in ``SearchIndexState`` after each range is written, so if a
+reindex is interrupted, the next run carries on from the last range that was written.
+
+Once a model has been fully indexed, ``update_model`` can be used to catch up on
+changes instead. Each ``SearchIndexState`` holds the time up to which every change is
+in the index, and only objects modified since then, items whose statuses changed since
+then, and items deleted since then (recorded as ``SearchIndexRemoval`` rows) are updated.
+"""
+import itertools
+import time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from aristotle_mdr import search_cache
+
+REINDEX_BATCH_SIZE = 500
+
+class PreparedIndex(object):
+    """
+    Stands in for a search index when writing documents that were prepared in a worker,
+    so they can be passed to any backend's ``update`` by their identifiers.
+    """
+    def __init__(self,index,documents):
+        self.index = index
+        self.documents = documents
+
+    def full_prepare(self,identifier):
+        return self.documents[identifier]
+
+    def __getattr__(self,name):
+        return getattr(self.index,name)
+
+def indexed_models(using):
+    from haystack import connections
+    return sorted(
+        connections[using].get_unified_index().get_indexed_models(),
+        key=lambda model: (model._meta.app_label,model._meta.model_name)
+    )
+
+def get_index(model,using):
+    from haystack import connections
+    return connections[using].get_unified_index().get_index(model)
+
+def id_ranges(model,using,after=0,batch_size=None):
+    """
+    Returns the ``(first id, last id)`` of each range of up to ``batch_size`` objects
+    in the index queryset of the model, starting after the id ``after``.
+    """
+    ids = list(
+        get_index(model,using).index_queryset(using=using)
+        .filter(pk__gt=after).order_by('pk').values_list('pk',flat=True)
+    )
+    batch_size = batch_size or REINDEX_BATCH_SIZE
+    return [(ids[i],ids[min(i+batch_size,len(ids))-1]) for i in range(0,len(ids),batch_size)]
+
+def prepare_range(task):
+    """
+    Prepares the search documents for the objects in a range of ids, returning them
+    keyed by their identifiers. This runs in the worker processes.
+    """
+    app_label,model_name,using,first,last = task
+    model = apps.get_model(app_label,model_name)
+    index = get_index(model,using)
+    return prepare_objects(index,index.index_queryset(using=using).filter(pk__gte=first,pk__lte=last))
+
+def prepare_objects(index,queryset):
+    from haystack.exceptions import SkipDocument
+    documents = {}
+    for obj in queryset:
+        try:
+            document = index.full_prepare(obj)
+        except SkipDocument:
+            continue
+        documents[document['id']] = document
+    return documents
+
+def reindex_model(model,using,batch_size=None,pool=None,restart=False,clear=False,progress=None):
+    """
+    Reindexes every object of ``model`` in the search connection ``using``, carrying on
+    from an interrupted run unless ``restart`` is set. If ``pool`` is given, documents
+    are prepared by its workers. If ``clear`` is set, the model is removed from the
+    index before a fresh run starts. ``progress`` is called with the number of objects
+    written so far after each range.
+
+    Returns the number of objects written and the time taken.
+    """
+    from haystack import connections
+    from aristotle_mdr.models import SearchIndexState
+
+    state,created = SearchIndexState.objects.get_or_create(
+        using=using,content_type=ContentType.objects.get_for_model(model)
+    )
+    if restart or state.rebuild_started is None or state.rebuild_finished is not None:
+        state.rebuild_started = timezone.now()
+        state.rebuild_finished = None
+        state.rebuild_last_pk = 0
+        state.save()
+        if clear:
+            connections[using].get_backend().clear(models=[model])
+
+    index = get_index(model,using)
+    backend = connections[using].get_backend()
+    ranges = id_ranges(model,using,after=state.rebuild_last_pk,batch_size=batch_size)
+    tasks = [(model._meta.app_label,model._meta.model_name,using,first,last) for first,last in ranges]
+    prepared = pool.imap(prepare_range,tasks) if pool else (prepare_range(task) for task in tasks)
+
+    started = time.time()
+    written = 0
+    for (first,last),documents in itertools.izip(ranges,prepared):
+        if documents:
+            backend.update(PreparedIndex(index,documents),list(documents.keys()))
+        written += len(documents)
+        state.rebuild_last_pk = last
+        SearchIndexState.objects.filter(pk=state.pk).update(rebuild_last_pk=last)
+        if progress:
+            progress(written)
+    state.rebuild_finished = timezone.now()
+    finished = {'rebuild_finished':state.rebuild_finished}
+    if clear or state.indexed_until is None:
+        # Everything changed before the rebuild started is now in the index. Otherwise the
+        # old mark is kept, as items deleted since then may still need removing.
+        finished['indexed_until'] = state.rebuild_started
+    SearchIndexState.objects.filter(pk=state.pk).update(**finished)
+    prune_removals(state.content_type_id)
+    search_cache.index_changed()
+    return written,time.time()-started
+
+def update_model(model,using,batch_size=None,progress=None):
+    """
+    Updates the index for ``model`` in the search connection ``using`` with the changes
+    made since it was last updated, in batches of ``batch_size`` objects. Models that
+    have never been fully indexed, or whose index has no updated field, are reindexed
+    with ``reindex_model`` instead. ``progress`` is called as for ``reindex_model``.
+
+    Returns the number of objects written, the number removed and the time taken.
+    """
+    from haystack import connections
+    from aristotle_mdr.models import SearchIndexRemoval, SearchIndexState, _batches, _concept
+
+    content_type = ContentType.objects.get_for_model(model)
+    state,created = SearchIndexState.objects.get_or_create(using=using,content_type=content_type)
+    index = get_index(model,using)
+    updated_field = index.get_updated_field()
+    if state.indexed_until is None or updated_field is None:
+        written,taken = reindex_model(model,using,batch_size=batch_size,progress=progress)
+        return written,0,taken
+
+    started = time.time()
+    # Taken before looking for changes, so anything changed during the update is caught next time.
+    indexed_until = timezone.now()
+    since = state.indexed_until
+    backend = connections[using].get_backend()
+    queryset = index.index_queryset(using=using)
+
+    ids = set(queryset.filter(**{'%s__gte'%updated_field:since}).values_list('pk',flat=True))
+    if issubclass(model,_concept):
+        ids.update(queryset.filter(statuses__modified__gte=since).values_list('pk',flat=True))
+    written = 0
+    for batch in _batches(sorted(ids),batch_size or REINDEX_BATCH_SIZE):
+        documents = prepare_objects(index,queryset.filter(pk__in=batch))
+        if documents:
+            backend.update(PreparedIndex(index,documents),list(documents.keys()))
+        written += len(documents)
+        if progress:
+            progress(written)
+
+    removed = set(
+        SearchIndexRemoval.objects.filter(content_type=content_type,removed__gte=since)
+        .values_list('object_id',flat=True)
+    )
+    for pk in sorted(removed):
+        backend.remove("%s.%s.%s" % (content_type.app_label,content_type.model,pk))
+
+    SearchIndexState.objects.filter(pk=state.pk).update(indexed_until=indexed_until)
+    prune_removals(content_type.pk)
+    if written or removed:
+        search_cache.index_changed()
+    return written,len(removed),time.time()-started
+
+def prune_removals(content_type_id):
+    """
+    Deletes the ``SearchIndexRemoval`` rows for a model that every search connection
+    has already caught up past.
+    """
+    from aristotle_mdr.models import SearchIndexRemoval, SearchIndexState
+    marks = list(SearchIndexState.objects.filter(content_type=content_type_id).values_list('indexed_until',flat=True))
+    if marks and None not in marks:
+        SearchIndexRemoval.objects.filter(content_type=content_type_id,removed__lt=min(marks)).delete()
+
+def make_pool(workers):
+    """
+    Starts a pool of worker processes for ``reindex_model``. The database connections
+    are closed first, as connections inherited by the workers can't be shared with them.
+    """
+    import multiprocessing
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
+    return multiprocessing.Pool(workers)
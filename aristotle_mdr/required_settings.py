@@ -123,6 +123,8 @@ ARISTOTLE_SETTINGS = {
     'SITE_DESCRIPTION': 'About this site', # 'The main title for the site.'
     'CONTENT_EXTENSIONS' : [],
     'PDF_PAGE_SIZE': 'A4',
+    'RECACHE_MODE': 'thread', # How background recaches of item states are run, one of 'thread', 'immediate' or 'manual'.
+    'USE_VISIBILITY_TABLE': False, # Use the materialised ConceptVisibility table for visibility checks, run 'rebuild_visibility' after enabling.
     }
 ARISTOTLE_DOWNLOADS = [
     #(fileType,menu,font-awesome-icon,module)
@@ -148,7 +150,7 @@ HAYSTACK_SIGNAL_PROCESSOR = 'aristotle_mdr.signals.AristotleSignalProcessor'
 #HAYSTACK_SEARCH_RESULTS_PER_PAGE = 10
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        'ENGINE': 'aristotle_mdr.search_backends.whoosh_backend.FacetedWhooshEngine',
         'PATH': os.path.join(os.path.dirname(__file__), 'whoosh_index'),
         'INCLUDE_SPELLING':True,
     },
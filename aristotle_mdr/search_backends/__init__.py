@@ -0,0 +1,5 @@
+"""
+Haystack search backends provided by Aristotle. To use one, set the ``ENGINE`` of a
+connection in ``HAYSTACK_CONNECTIONS`` to its engine, for example
+``'aristotle_mdr.search_backends.whoosh_backend.FacetedWhooshEngine'``.
+"""
@@ -0,0 +1,597 @@
+"""
+SQLite full text search backend
+===============================
+
+A Haystack backend that keeps the search index in an SQLite database file and uses
+SQLite's FTS5 extension for full text search, so it needs no search service to be
+run alongside the registry. To use it, point a connection at a file::
+
+    HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'aristotle_mdr.search_backends.sqlite_fts.SQLiteFTSEngine',
+            'PATH': os.path.join(BASE_DIR, 'search_index.sqlite3'),
+            'INCLUDE_SPELLING': True,
+        },
+    }
+
+The file is opened in write-ahead logging mode, so searches aren't blocked while the
+index is written to, and writers from different processes only wait for each other
+for as long as it takes to write one batch.
+
+Each indexed object is a row in ``documents``, holding its prepared fields as JSON.
+The document field and any other single valued text fields are indexed in the FTS5
+table ``document_text``, with a row id of ``document row id * 64 + field number``.
+Every other field value is a row in ``document_terms``, which is used for filtering,
+sorting and counting facets. Queries are built as SQL expressions over these tables.
+
+Spelling suggestions come from ``vocabulary``, the words used in the document field
+along with the number of documents that use them, and an FTS5 trigram index of those
+words that is used to find indexed words that look like a misspelt one.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DEFAULT_ALIAS, DJANGO_CT, DJANGO_ID, ID
+from haystack.exceptions import SkipDocument
+from haystack.inputs import AutoQuery
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+from haystack.utils.app_loading import haystack_get_model
+
+# The number of text fields each document can have in ``document_text``.
+FIELD_SLOTS = 64
+TEXT_FIELD_TYPES = ('string', 'ngram', 'edge_ngram')
+# Words shorter than this aren't given spelling suggestions, as they share no trigrams.
+SPELLING_MIN_LENGTH = 3
+SPELLING_MAX_EDITS = 2
+SPELLING_CANDIDATES = 50
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE,
+        django_ct TEXT NOT NULL, django_id TEXT NOT NULL, data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS documents_django_ct ON documents (django_ct);
+    CREATE TABLE IF NOT EXISTS document_terms (doc INTEGER NOT NULL, field TEXT NOT NULL, value);
+    CREATE INDEX IF NOT EXISTS document_terms_value ON document_terms (field, value, doc);
+    CREATE INDEX IF NOT EXISTS document_terms_doc ON document_terms (doc);
+    CREATE TABLE IF NOT EXISTS text_fields (number INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5(body, tokenize='porter unicode61');
+    CREATE TABLE IF NOT EXISTS vocabulary (rowid INTEGER PRIMARY KEY, word TEXT NOT NULL UNIQUE, docs INTEGER NOT NULL);
+    CREATE VIRTUAL TABLE IF NOT EXISTS vocabulary_trigrams USING fts5(word, tokenize='trigram');
+"""
+
+def term_value(value):
+    """
+    Converts a prepared field value to how it is stored in ``document_terms``. Dates
+    and times are stored as ISO 8601 strings in UTC, so they sort and compare as text.
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, six.integer_types + (float,)):
+        return value
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value, timezone.utc)
+        return value.strftime('%Y-%m-%dT%H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    return force_text(value)
+
+def sql_literal(value):
+    if value is None:
+        return 'NULL'
+    value = term_value(value)
+    if isinstance(value, six.integer_types):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    return u"'%s'" % value.replace(u'\x00', u'').replace(u"'", u"''")
+
+def fts_phrase(text):
+    return u'"%s"' % force_text(text).replace(u'"', u'""')
+
+def spelling_words(text):
+    return set(
+        word.lower() for word in WORD_RE.findall(force_text(text or ''))
+        if len(word) >= SPELLING_MIN_LENGTH and not word.isdigit()
+    )
+
+def edit_distance(first, second):
+    """
+    The number of insertions, deletions, substitutions and swaps of neighbouring
+    letters needed to turn one word into the other.
+    """
+    previous, current = None, list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = 0 if first[i-1] == second[j-1] else 1
+            current[j] = min(previous[j] + 1, current[j-1] + 1, previous[j-1] + cost)
+            if i > 1 and j > 1 and first[i-1] == second[j-2] and first[i-2] == second[j-1]:
+                current[j] = min(current[j], before[j-2] + 1)
+    return current[len(second)]
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    def __init__(self, connection_alias, **connection_options):
+        super(SQLiteFTSSearchBackend, self).__init__(connection_alias, **connection_options)
+        if not connection_options.get('PATH'):
+            raise ImproperlyConfigured("You must specify a 'PATH' in your settings for connection '%s'." % connection_alias)
+        self.path = connection_options['PATH']
+        self.local = threading.local()
+        self.text_field_numbers = {}
+        self.log = logging.getLogger('haystack')
+
+    def connect(self):
+        """
+        Returns the connection to the index for the current thread, opening it if needed.
+        Connections aren't carried over into forked processes, such as reindexing workers.
+        """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    @contextmanager
+    def transaction(self, write=False):
+        """
+        Runs the block in a transaction, yielding a cursor. Writes take the write lock
+        straight away, so a batch is never left waiting on a lock part way through.
+        """
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            yield connection.cursor()
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def update(self, index, iterable, commit=True):
+        documents = []
+        for obj in iterable:
+            try:
+                documents.append(index.full_prepare(obj))
+            except SkipDocument:
+                self.log.debug(u"Indexing for object `%s` skipped", obj)
+        if not documents:
+            return
+
+        text_fields = [
+            field.index_fieldname for field in index.fields.values()
+            if field.document or (field.field_type in TEXT_FIELD_TYPES and not field.is_multivalued)
+        ]
+        try:
+            with self.transaction(write=True) as cursor:
+                numbers = self.get_text_field_numbers(cursor, text_fields)
+                words = self.delete_documents(cursor, [document[ID] for document in documents])
+                for document in documents:
+                    words.update(self.insert_document(cursor, document, numbers))
+                self.count_words(cursor, words)
+        except Exception as e:
+            if not self.silently_fail:
+                raise
+            self.log.error(u"Failed to add documents to the SQLite index: %s", e, exc_info=True)
+
+    def insert_document(self, cursor, document, numbers):
+        """
+        Writes a prepared document to the index, returning the words it adds to the vocabulary.
+        """
+        from haystack import connections
+        document_field = connections[self.connection_alias].get_unified_index().document_field
+        cursor.execute(
+            'INSERT INTO documents (id, django_ct, django_id, data) VALUES (?, ?, ?, ?)',
+            [document[ID], document[DJANGO_CT], force_text(document[DJANGO_ID]), json.dumps(document, default=term_value)]
+        )
+        doc = cursor.lastrowid
+        terms, text = [], []
+        for name, value in document.items():
+            if value is None or name in (ID, document_field):
+                continue
+            for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+                if item is not None:
+                    terms.append((doc, name, term_value(item)))
+        for name, number in numbers.items():
+            if document.get(name) is not None:
+                text.append((doc * FIELD_SLOTS + number, force_text(document[name])))
+        cursor.executemany('INSERT INTO document_terms (doc, field, value) VALUES (?, ?, ?)', terms)
+        cursor.executemany('INSERT INTO document_text (rowid, body) VALUES (?, ?)', text)
+        return spelling_words(document.get(document_field))
+
+    def delete_documents(self, cursor, identifiers):
+        """
+        Deletes documents from the index by their identifiers, returning a ``Counter``
+        of the words they take away from the vocabulary, as negative counts.
+        """
+        from haystack import connections
+        document_field = connections[self.connection_alias].get_unified_index().document_field
+        words = Counter()
+        identifiers = list(identifiers)
+        for start in range(0, len(identifiers), 500):
+            batch = identifiers[start:start+500]
+            rows = cursor.execute(
+                'SELECT rowid, data FROM documents WHERE id IN (%s)' % ','.join('?' * len(batch)), batch
+            ).fetchall()
+            for doc, data in rows:
+                words.subtract(spelling_words(json.loads(data).get(document_field)))
+                cursor.execute(
+                    'DELETE FROM document_text WHERE rowid BETWEEN ? AND ?',
+                    [doc * FIELD_SLOTS, doc * FIELD_SLOTS + FIELD_SLOTS - 1]
+                )
+            docs = [doc for doc, data in rows]
+            if docs:
+                placeholders = ','.join('?' * len(docs))
+                cursor.execute('DELETE FROM document_terms WHERE doc IN (%s)' % placeholders, docs)
+                cursor.execute('DELETE FROM documents WHERE rowid IN (%s)' % placeholders, docs)
+        return words
+
+    def count_words(self, cursor, words):
+        """
+        Adds the counts in ``words`` to the vocabulary, removing words no longer used.
+        """
+        words = dict((word, count) for word, count in words.items() if count)
+        if not words:
+            return
+        cursor.executemany('INSERT OR IGNORE INTO vocabulary (word, docs) VALUES (?, 0)', [(w,) for w in words])
+        cursor.executemany('UPDATE vocabulary SET docs = docs + ? WHERE word = ?', [(c, w) for w, c in words.items()])
+        # New words are added to the trigram index, and unused ones removed from it, by row id.
+        cursor.execute(
+            'INSERT INTO vocabulary_trigrams (rowid, word) SELECT rowid, word FROM vocabulary '
+            'WHERE docs > 0 AND rowid NOT IN (SELECT rowid FROM vocabulary_trigrams)'
+        )
+        cursor.execute('DELETE FROM vocabulary_trigrams WHERE rowid IN (SELECT rowid FROM vocabulary WHERE docs <= 0)')
+        cursor.execute('DELETE FROM vocabulary WHERE docs <= 0')
+
+    def get_text_field_numbers(self, cursor, names=None):
+        """
+        Returns the number of each text field in ``document_text``, numbering any of
+        ``names`` that haven't been indexed before.
+        """
+        if names is None or not set(names) <= set(self.text_field_numbers):
+            self.text_field_numbers = dict(cursor.execute('SELECT name, number FROM text_fields').fetchall())
+        if names is None:
+            return self.text_field_numbers
+        for name in names:
+            if name not in self.text_field_numbers:
+                number = len(self.text_field_numbers)
+                if number >= FIELD_SLOTS:
+                    raise ValueError("The SQLite index can't hold more than %s text fields." % FIELD_SLOTS)
+                cursor.execute('INSERT INTO text_fields (number, name) VALUES (?, ?)', [number, name])
+                self.text_field_numbers[name] = number
+        return dict((name, self.text_field_numbers[name]) for name in names)
+
+    def text_field_number(self, name):
+        if name not in self.text_field_numbers:
+            self.get_text_field_numbers(self.connect().cursor())
+        return self.text_field_numbers.get(name)
+
+    def remove(self, obj_or_string, commit=True):
+        identifier = get_identifier(obj_or_string)
+        try:
+            with self.transaction(write=True) as cursor:
+                self.count_words(cursor, self.delete_documents(cursor, [identifier]))
+        except Exception as e:
+            if not self.silently_fail:
+                raise
+            self.log.error(u"Failed to remove document '%s' from the SQLite index: %s", identifier, e, exc_info=True)
+
+    def clear(self, models=None, commit=True):
+        try:
+            with self.transaction(write=True) as cursor:
+                if not models:
+                    for table in ['documents', 'document_terms', 'document_text', 'vocabulary', 'vocabulary_trigrams']:
+                        cursor.execute('DELETE FROM %s' % table)
+                    return
+                for model in models:
+                    identifiers = [row[0] for row in cursor.execute(
+                        'SELECT id FROM documents WHERE django_ct = ?', [get_model_ct(model)]
+                    ).fetchall()]
+                    self.count_words(cursor, self.delete_documents(cursor, identifiers))
+        except Exception as e:
+            if not self.silently_fail:
+                raise
+            self.log.error(u"Failed to clear the SQLite index: %s", e, exc_info=True)
+
+    @log_query
+    def search(self, query_string, sort_by=None, start_offset=0, end_offset=None,
+               facets=None, narrow_queries=None, spelling_query=None, models=None,
+               limit_to_registered_models=None, result_class=None, text_matches=None, **kwargs):
+        """
+        Runs the search, counts the results and the facets, all in one read of the
+        index. ``text_matches`` are the FTS5 queries the results are ranked by.
+        """
+        if not query_string:
+            return {'results': [], 'hits': 0}
+
+        if limit_to_registered_models is None:
+            limit_to_registered_models = getattr(settings, 'HAYSTACK_LIMIT_TO_REGISTERED_MODELS', True)
+        if models:
+            model_choices = sorted(get_model_ct(model) for model in models)
+        elif limit_to_registered_models:
+            model_choices = self.build_models_list()
+        else:
+            model_choices = []
+
+        where = [u'(%s)' % query_string]
+        if model_choices:
+            where.append(u'd.django_ct IN (%s)' % u','.join(sql_literal(ct) for ct in model_choices))
+        for narrow_query in narrow_queries or []:
+            where.append(u'(%s)' % narrow_query)
+        where = u' AND '.join(where)
+
+        with self.transaction() as cursor:
+            hits = cursor.execute(u'SELECT count(*) FROM documents d WHERE %s' % where).fetchone()[0]
+            rows = []
+            if hits and (end_offset is None or end_offset > start_offset):
+                rows = self.fetch_results(cursor, where, sort_by, text_matches, start_offset, end_offset)
+            facet_counts = self.facet_counts(cursor, where, facets) if facets else {}
+
+        results = self.process_results(rows, result_class)
+        spelling_suggestion = None
+        if self.include_spelling:
+            spelling_suggestion = self.create_spelling_suggestion(
+                spelling_query or u' '.join(WORD_RE.findall(u' '.join(text_matches or [])))
+            )
+        return {
+            'results': results,
+            'hits': hits,
+            'facets': {'fields': facet_counts, 'dates': {}, 'queries': {}},
+            'spelling_suggestion': spelling_suggestion,
+        }
+
+    def fetch_results(self, cursor, where, sort_by, text_matches, start_offset, end_offset):
+        params = []
+        join, score = u'', u'0'
+        if text_matches:
+            # FTS5 ranks by bm25, which is negative with the best match lowest.
+            join = (
+                u'LEFT JOIN (SELECT rowid / %d AS doc, min(rank) AS rank FROM document_text '
+                u'WHERE document_text MATCH ? GROUP BY rowid / %d) r ON r.doc = d.rowid'
+            ) % (FIELD_SLOTS, FIELD_SLOTS)
+            params.append(u' OR '.join(u'(%s)' % match for match in text_matches))
+            score = u'coalesce(-r.rank, 0)'
+        order = []
+        for field in sort_by or []:
+            descending = field.startswith('-')
+            order.append(u'(SELECT %s(value) FROM document_terms WHERE doc = d.rowid AND field = %s) %s' % (
+                'max' if descending else 'min', sql_literal(field.lstrip('-')), 'DESC' if descending else 'ASC'
+            ))
+        order += [u'score DESC', u'd.rowid']
+        params += [-1 if end_offset is None else end_offset - start_offset, start_offset]
+        return cursor.execute(
+            u'SELECT d.django_ct, d.django_id, d.data, %s AS score FROM documents d %s WHERE %s ORDER BY %s LIMIT ? OFFSET ?'
+            % (score, join, where, u', '.join(order)),
+            params
+        ).fetchall()
+
+    def facet_counts(self, cursor, where, facets):
+        """
+        Returns a list of ``(value, count)`` for each field in ``facets``, most common first.
+        """
+        counts = dict((field, []) for field in facets)
+        rows = cursor.execute(
+            u'SELECT field, value, count(DISTINCT doc) FROM document_terms WHERE field IN (%s) '
+            u'AND doc IN (SELECT d.rowid FROM documents d WHERE %s) GROUP BY field, value'
+            % (u','.join(sql_literal(field) for field in facets), where)
+        )
+        for field, value, count in rows:
+            counts[field].append((value, count))
+        for field in counts:
+            counts[field].sort(key=lambda facet: (-facet[1], facet[0]))
+        return counts
+
+    def process_results(self, rows, result_class=None):
+        from haystack import connections
+        result_class = result_class or SearchResult
+        unified_index = connections[self.connection_alias].get_unified_index()
+        indexed_models = unified_index.get_indexed_models()
+        results = []
+        for django_ct, django_id, data, score in rows:
+            app_label, model_name = django_ct.split('.')
+            model = haystack_get_model(app_label, model_name)
+            if not model or model not in indexed_models:
+                continue
+            index = unified_index.get_index(model)
+            additional_fields = {}
+            for key, value in json.loads(data).items():
+                key = str(key)
+                if key in (DJANGO_CT, DJANGO_ID):
+                    continue
+                field = index.fields.get(key)
+                if field is not None and not field.is_multivalued and value is not None:
+                    value = field.convert(value)
+                additional_fields[key] = value
+            results.append(result_class(app_label, model_name, django_id, score, **additional_fields))
+        return results
+
+    def create_spelling_suggestion(self, query_string):
+        """
+        Suggests a spelling for each word of ``query_string``. Words that are already
+        in the index, or have no suggestion, are kept, so the suggestion has the same
+        number of words as the query.
+        """
+        if not query_string:
+            return None
+        words = force_text(query_string).split()
+        suggestions = self.spelling_suggestions(
+            [u''.join(WORD_RE.findall(word)) for word in words]
+        )
+        return u' '.join(
+            suggestions.get(u''.join(WORD_RE.findall(word)).lower(), word) for word in words
+        )
+
+    def spelling_suggestions(self, words):
+        """
+        Returns a dictionary of the closest indexed word to each of ``words`` that isn't
+        in the index. Candidates are the indexed words sharing the most trigrams with the
+        word, and the one needing the fewest edits is picked, then the most used one.
+        """
+        words = spelling_words(u' '.join(words))
+        suggestions = {}
+        if not words:
+            return suggestions
+        with self.transaction() as cursor:
+            known = set(row[0] for row in cursor.execute(
+                u'SELECT word FROM vocabulary WHERE word IN (%s)' % u','.join(u'?' * len(words)), list(words)
+            ))
+            for word in words - known:
+                trigrams = set(word[i:i+3] for i in range(len(word) - 2))
+                candidates = cursor.execute(
+                    u'SELECT v.word, v.docs FROM vocabulary_trigrams t JOIN vocabulary v ON v.rowid = t.rowid '
+                    u'WHERE vocabulary_trigrams MATCH ? ORDER BY t.rank LIMIT ?',
+                    [u' OR '.join(fts_phrase(trigram) for trigram in sorted(trigrams)), SPELLING_CANDIDATES]
+                ).fetchall()
+                best = None
+                for candidate, docs in candidates:
+                    distance = edit_distance(word, candidate)
+                    if distance <= SPELLING_MAX_EDITS and distance < len(word):
+                        best = min(best or (distance, -docs, candidate), (distance, -docs, candidate))
+                if best:
+                    suggestions[word] = best[2]
+        return suggestions
+
+
+class SQLiteFTSSearchQuery(BaseSearchQuery):
+    """
+    Builds queries as SQL conditions on the rows of ``documents``, aliased as ``d``.
+    """
+    def __init__(self, using=DEFAULT_ALIAS):
+        super(SQLiteFTSSearchQuery, self).__init__(using=using)
+        self.text_matches = []
+
+    def build_query(self):
+        self.text_matches = []
+        return super(SQLiteFTSSearchQuery, self).build_query()
+
+    def build_params(self, spelling_query=None):
+        kwargs = super(SQLiteFTSSearchQuery, self).build_params(spelling_query=spelling_query)
+        if self.text_matches:
+            kwargs['text_matches'] = self.text_matches
+        return kwargs
+
+    def matching_all_fragment(self):
+        return u'1'
+
+    def clean(self, query_fragment):
+        # Values are quoted as SQL literals or FTS5 phrases rather than escaped.
+        return query_fragment
+
+    def build_query_fragment(self, field, filter_type, value):
+        from haystack import connections
+        unified_index = connections[self._using].get_unified_index()
+        if field == 'content':
+            index_fieldname = unified_index.document_field
+        else:
+            index_fieldname = unified_index.get_index_fieldname(field)
+        search_field = unified_index.all_searchfields().get(index_fieldname)
+        is_text = search_field is not None and (
+            search_field.document or (search_field.field_type in TEXT_FIELD_TYPES and not search_field.is_multivalued)
+        )
+
+        if hasattr(value, 'input_type_name'):
+            if is_text and filter_type in ('contains', 'startswith'):
+                return self.build_text_fragment(index_fieldname, value, filter_type == 'startswith')
+            value = value.query_string
+        elif hasattr(value, 'values_list'):
+            value = list(value)
+        if is_text and filter_type in ('contains', 'startswith'):
+            return self.build_text_fragment(index_fieldname, value, filter_type == 'startswith')
+
+        convert = lambda v: self.convert_value(search_field, v)
+        if filter_type == 'in':
+            values = [convert(v) for v in value]
+            if not values:
+                # As with Haystack's other backends, filtering on nothing doesn't filter.
+                return u'1'
+            condition = u'value IN (%s)' % u','.join(sql_literal(v) for v in values)
+        elif filter_type == 'range':
+            start, end = value
+            condition = u'value BETWEEN %s AND %s' % (sql_literal(convert(start)), sql_literal(convert(end)))
+        elif filter_type in ('gt', 'gte', 'lt', 'lte'):
+            operator = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}[filter_type]
+            condition = u'value %s %s' % (operator, sql_literal(convert(value)))
+        elif filter_type == 'startswith':
+            prefix = force_text(term_value(value))
+            condition = u'substr(value, 1, %d) = %s' % (len(prefix), sql_literal(prefix))
+        else:
+            condition = u'value = %s' % sql_literal(convert(value))
+        return u'd.rowid IN (SELECT doc FROM document_terms WHERE field = %s AND %s)' % (
+            sql_literal(index_fieldname), condition
+        )
+
+    def build_text_fragment(self, index_fieldname, value, prefix=False):
+        """
+        Matches the words and quoted phrases in ``value`` in a text field, leaving out
+        anything with a leading ``-``, in the same way as Haystack's ``AutoQuery``.
+        """
+        text = force_text(getattr(value, 'query_string', value))
+        if getattr(value, 'input_type_name', 'auto_query') == 'auto_query':
+            phrases = AutoQuery.exact_match_re.findall(text)
+            words = AutoQuery.exact_match_re.sub(u' ', text).split()
+        else:
+            phrases, words = [text], []
+        wanted = [phrase for phrase in phrases if WORD_RE.search(phrase)]
+        unwanted = []
+        for word in words:
+            if word.startswith(u'-') and WORD_RE.search(word[1:]):
+                unwanted.append(word[1:])
+            elif WORD_RE.search(word):
+                wanted.append(word)
+
+        number = self.backend.text_field_number(index_fieldname)
+        if number is None or not (wanted or unwanted):
+            return u'0'
+        match = u'd.rowid %s (SELECT rowid / %d FROM document_text WHERE document_text MATCH %s AND rowid %% %d = %d)'
+        star = u'*' if prefix else u''
+        fragments = []
+        if wanted:
+            expression = u' AND '.join(fts_phrase(phrase) + star for phrase in wanted)
+            self.text_matches.append(expression)
+            fragments.append(match % (u'IN', FIELD_SLOTS, sql_literal(expression), FIELD_SLOTS, number))
+        for phrase in unwanted:
+            fragments.append(match % (u'NOT IN', FIELD_SLOTS, sql_literal(fts_phrase(phrase)), FIELD_SLOTS, number))
+        return u'(%s)' % u' AND '.join(fragments)
+
+    def convert_value(self, search_field, value):
+        """
+        Converts a value from a filter to the type the field is stored as, so the
+        string ids used by some filters match integer fields.
+        """
+        field_type = getattr(search_field, 'field_type', None)
+        try:
+            if field_type == 'integer':
+                return int(value)
+            if field_type == 'float':
+                return float(value)
+        except (TypeError, ValueError):
+            pass
+        if field_type == 'boolean' and isinstance(value, six.string_types):
+            return value.lower() in ('true', 't', '1', 'yes')
+        return value
+
+
+class SQLiteFTSEngine(BaseEngine):
+    backend = SQLiteFTSSearchBackend
+    query = SQLiteFTSSearchQuery
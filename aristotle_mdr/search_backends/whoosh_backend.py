@@ -0,0 +1,63 @@
+from haystack.backends.whoosh_backend import WhooshEngine, WhooshSearchBackend
+from haystack.constants import DJANGO_CT
+from haystack.utils import get_model_ct
+from django.utils.encoding import force_text
+
+class FacetedWhooshSearchBackend(WhooshSearchBackend):
+    """
+    Haystack's Whoosh backend with support for field facets, which are counted over
+    every result of a search as part of the same call to ``search``.
+    """
+    def search(self, query_string, facets=None, **kwargs):
+        results = super(FacetedWhooshSearchBackend,self).search(query_string, **kwargs)
+        if facets:
+            counts = {}
+            if results.get('hits'):
+                counts = self.facet_counts(
+                    query_string, facets,
+                    narrow_queries=kwargs.get('narrow_queries'), models=kwargs.get('models')
+                )
+            results['facets'] = {'fields': counts, 'dates': {}, 'queries': {}}
+        return results
+
+    def facet_counts(self, query_string, facets, narrow_queries=None, models=None):
+        """
+        Returns a list of ``(value, count)`` for each field in ``facets``, most common first.
+        """
+        from whoosh import query as whoosh_query, sorting
+
+        narrow_queries = set(narrow_queries or [])
+        if models:
+            narrow_queries.add(' OR '.join(['%s:%s' % (DJANGO_CT, get_model_ct(model)) for model in models]))
+        parsed_query = self.parser.parse(force_text(query_string))
+        if parsed_query is None:
+            return {}
+
+        searcher = self.index.searcher()
+        try:
+            search_kwargs = {
+                'limit': 1,
+                'groupedby': dict(
+                    (field, sorting.FieldFacet(field, allow_overlap=True))
+                    for field in facets
+                ),
+                'maptype': sorting.Count,
+            }
+            if narrow_queries:
+                search_kwargs['filter'] = whoosh_query.And([
+                    self.parser.parse(force_text(nq)) for nq in narrow_queries
+                ])
+            groups = searcher.search(parsed_query, **search_kwargs)
+            counts = {}
+            for field in facets:
+                values = groups.groups(field)
+                counts[field] = sorted(
+                    ((self._to_python(force_text(value)), count) for value, count in values.items() if value is not None),
+                    key=lambda facet: (-facet[1], facet[0])
+                )
+            return counts
+        finally:
+            searcher.close()
+
+class FacetedWhooshEngine(WhooshEngine):
+    backend = FacetedWhooshSearchBackend
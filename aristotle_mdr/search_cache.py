@@ -0,0 +1,128 @@
+"""
+Caching search results
+======================
+
+Paging through search results, or changing how they are sorted, runs the whole search
+again, and popular searches are run many times a day by different people. So the ids
+of the results of each search are cached, along with what the search form worked out
+along the way, such as spelling suggestions, and each page is loaded from those ids.
+
+Results are cached under the normalised query, the filters and sort order, and the
+permissions that were applied to the search. Anonymous users share the public results
+and everyone else shares results with users in the same workgroups and registration
+authorities. Every cached result is invalidated whenever the search index is updated
+through ``aristotle_mdr.signals``. As changes made to the index by other means, such
+as Haystack's ``rebuild_index`` command, aren't seen, results are only cached for
+``SEARCH_RESULT_CACHE_TIMEOUT`` seconds in ``ARISTOTLE_SETTINGS`` (ten minutes by
+default, ``0`` turns caching off).
+"""
+import hashlib
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from haystack.models import SearchResult
+
+from aristotle_mdr import perms
+
+SEARCH_RESULT_CACHE_TIMEOUT = 60*10
+# Only the ids of the first results are fetched and cached, pages further in are searched for again.
+SEARCH_RESULT_CACHE_SIZE = 200
+
+def result_cache_timeout():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SEARCH_RESULT_CACHE_TIMEOUT',SEARCH_RESULT_CACHE_TIMEOUT)
+
+def index_changed():
+    """
+    Invalidates every cached search result, for use after the search index is updated.
+    """
+    perms.bump_generation('search_index',0)
+
+def permission_fingerprint(user):
+    """
+    Describes everything ``PermissionSearchQuerySet.apply_permission_checks`` uses
+    to restrict what a user can find.
+    """
+    if user is None or user.is_anonymous():
+        return "public"
+    if user.is_superuser:
+        return "superuser"
+    principal = perms.get_principal(user)
+    return "wg:%s|ra:%s" % (
+        ",".join(str(pk) for pk in sorted(principal.workgroup_ids)),
+        ",".join(str(pk) for pk in sorted(principal.registrar_authority_ids)),
+    )
+
+def result_cache_key(query,filters,user):
+    """
+    Builds the cache key for a search. ``filters`` is a dictionary of the other
+    options for the search, with values that have a stable ``repr``.
+    """
+    generation = perms.get_generations([('search_index',0)])[('search_index',0)]
+    description = "|".join([
+        " ".join((query or "").split()),
+        repr(sorted(filters.items())),
+        permission_fingerprint(user),
+    ])
+    return 'aristotle_search|%s|%s' % (generation,hashlib.md5(description.encode('utf-8')).hexdigest())
+
+class CachedSearchResults(object):
+    """
+    Stands in for a ``SearchQuerySet`` when paginating the results of a search, which
+    may have come from the cache. ``results`` is a list of ``(app_label, model_name,
+    pk, score)`` for the first results and ``count`` is the total number found. Slices
+    past those results are taken from the queryset returned by ``search``, which is only
+    built if needed.
+    """
+    def __init__(self,results,count,search=None):
+        self.results = results
+        self._count = count
+        self._search = search
+        self._searched = None
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self[0:self._count])
+
+    def __getitem__(self,k):
+        if not isinstance(k,slice):
+            return self[k:k+1][0]
+        start,stop = k.start or 0,k.stop
+        if stop is None:
+            stop = self._count
+        if stop > len(self.results) and self._count > len(self.results):
+            if self._searched is None:
+                self._searched = self._search()
+            return self._searched[start:stop]
+        return self.load(self.results[start:stop])
+
+    def load(self,results):
+        """
+        Builds the ``SearchResult`` for each result, loading the objects of each model with one query.
+        """
+        by_model = {}
+        for app_label,model_name,pk,score in results:
+            by_model.setdefault((app_label,model_name),[]).append(pk)
+        objects = {}
+        for (app_label,model_name),pks in by_model.items():
+            model = apps.get_model(app_label,model_name)
+            for pk,obj in model._default_manager.in_bulk(pks).items():
+                objects[(app_label,model_name,str(pk))] = obj
+        loaded = []
+        for app_label,model_name,pk,score in results:
+            result = SearchResult(app_label,model_name,pk,score)
+            result._object = objects.get((app_label,model_name,str(pk)))
+            loaded.append(result)
+        return loaded
+
+def cache_results(key,results,count,state):
+    """
+    Caches the first results of a search and the number found, along with ``state``,
+    a dictionary describing how the search form got them.
+    """
+    cache.set(key,{'results':results,'count':count,'state':state},result_cache_timeout())
@@ -14,6 +14,9 @@ class baseObjectIndex(indexes.SearchIndex):
     def get_model(self):
         raise NotImplementedError #pragma: no cover -- This should always be overridden
 
+    def get_updated_field(self):
+        return 'modified'
+
     # From http://unfoldthat.com/2011/05/05/search-with-row-level-permissions.html
     def index_queryset(self, using=None):
         """Used when the entire index for model is updated."""
@@ -48,8 +51,19 @@ class conceptIndex(baseObjectIndex):
     is_public = indexes.BooleanField()
     version = indexes.CharField(model_attr="version")
 
+    # Related objects used by the text templates and prepare methods, which are fetched
+    # along with each batch of items so indexing doesn't query them for every item.
+    # Statuses aren't needed, as the cached registration summary is used instead.
+    index_select_related = ['workgroup']
+    index_prefetch_related = ['workgroup__registrationAuthorities']
+
+    def index_queryset(self, using=None):
+        return super(conceptIndex,self).index_queryset(using).select_related(
+            *self.index_select_related
+        ).prefetch_related(*self.index_prefetch_related)
+
     def prepare_registrationAuthorities (self, obj):
-        ras = [str(s.registrationAuthority.id) for s in obj.statuses.all()]
+        ras = [str(ra) for ra in obj.registration_authority_ids]
         if not ras and obj.readyToReview:
             # We fake a registration authority only if an item is "ready to review".
             # This allows registrars to search for flag items in their authority.
@@ -61,16 +75,18 @@ class conceptIndex(baseObjectIndex):
         return obj.is_public()
 
     def prepare_workgroup(self,obj):
-        return int(obj.workgroup.id)
+        return int(obj.workgroup_id)
 
     def prepare_statuses(self, obj):
         # We don't remove duplicates as it should mean the more standard it is the higher it will rank
-        states = [s.state_name for s in obj.statuses.all()]
+        states = [models.STATES[state] for ra,state in obj.registration_states]
         return states
 
     def prepare_highest_state(self, obj):
-        # Include -99, so "unregistered" items get a value
-        state = max([int(s.state) for s in obj.statuses.all()]+[-99])
+        # Use -99, so "unregistered" items get a value
+        state = obj._highest_state
+        if state is None:
+            state = -99
         """
         We don't want retired or superseded ranking higher than standards during search
         as these are no longer "fit for purpose" so we'll place them below other
@@ -85,8 +101,8 @@ class conceptIndex(baseObjectIndex):
 
     def prepare_ra_statuses(self, obj):
         # This allows us to check a registration authority and a state simultaneously
-        states = ["%s___%s"%(str(s.registrationAuthority.id),str(s.state))
-                    for s in obj.statuses.all()]
+        states = ["%s___%s"%(str(ra),str(state))
+                    for ra,state in obj.registration_states]
         return states
     """
     def get_model(self):
@@ -105,10 +121,14 @@ class PackageIndex(conceptIndex, indexes.Indexable):
         return models.Package
 
 class DataElementConceptIndex(conceptIndex, indexes.Indexable):
+    index_select_related = conceptIndex.index_select_related + ['objectClass','property']
     def get_model(self):
         return models.DataElementConcept
 
 class DataElementIndex(conceptIndex, indexes.Indexable):
+    index_select_related = conceptIndex.index_select_related + [
+        'dataElementConcept__objectClass','dataElementConcept__property','valueDomain'
+    ]
     def get_model(self):
         return models.DataElement
 
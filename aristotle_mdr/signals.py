@@ -1,5 +1,11 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
 from django.db.models.signals import post_save, post_delete, pre_delete
 import haystack.signals as signals #.RealtimeSignalProcessor as RealtimeSignalProcessor
+from aristotle_mdr import bulk, search_cache
 # Don't import aristotle_mdr.models directly, only pull in whats required,
 #  otherwise Haystack gets into a circular dependancy.
 
@@ -26,12 +32,28 @@ class AristotleSignalProcessor(signals.RealtimeSignalProcessor):
         pre_delete.disconnect(self.handle_concept_delete, sender=_concept)
         super(AristotleSignalProcessor,self).teardown()
 
+    def handle_save(self, sender, instance, **kwargs):
+        from aristotle_mdr.models import _concept
+        if isinstance(instance,_concept) and bulk.defer('reindex',instance.pk):
+            return
+        super(AristotleSignalProcessor,self).handle_save(sender, instance, **kwargs)
+        search_cache.index_changed()
+
+    def handle_delete(self, sender, instance, **kwargs):
+        super(AristotleSignalProcessor,self).handle_delete(sender, instance, **kwargs)
+        search_cache.index_changed()
+
     def handle_status_change(self, sender, instance, **kwargs):
         # When a status changes, force an update of the object
+        if bulk.defer('reindex',instance.concept_id):
+            return
         obj = instance.concept.item
         super(AristotleSignalProcessor,self).handle_save(obj.__class__,obj, **kwargs)
+        search_cache.index_changed()
 
     def handle_concept_save(self, sender, instance, **kwargs):
+        if bulk.defer('reindex',instance.pk):
+            return
         obj = instance.item
         self.handle_save(obj.__class__,obj, **kwargs)
 
@@ -39,3 +61,188 @@ class AristotleSignalProcessor(signals.RealtimeSignalProcessor):
         # Delete index *before* the object, as we need to query it to check the actual subclass.
         obj = instance.item
         self.handle_delete(obj.__class__,obj, **kwargs)
+
+def update_search_index(concept_ids, batch_size=500):
+    """
+    Reindexes the concepts with the given ids in batches, sending each search backend
+    one update per batch and item type instead of one per item. Use this after bulk
+    changes that don't send ``post_save``, such as ``ConceptQuerySet.recache_states``.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from aristotle_mdr.models import _concept, resolve_subclasses
+
+    concept_ids = list(concept_ids)
+    for start in range(0,len(concept_ids),batch_size):
+        batch = _concept.objects.filter(pk__in=concept_ids[start:start+batch_size])
+        by_model = {}
+        untyped = []
+        for pk,type_id in batch.values_list('pk','_type'):
+            model = type_id and ContentType.objects.get_for_id(type_id).model_class()
+            if model and model is not _concept:
+                by_model.setdefault(model,[]).append(pk)
+            else:
+                untyped.append(pk)
+        if untyped:
+            for obj in resolve_subclasses(_concept.objects.filter(pk__in=untyped)):
+                by_model.setdefault(obj.__class__,[]).append(obj.pk)
+        _update_backends(by_model)
+
+def _update_backends(by_model):
+    """
+    Reindexes objects given as a dictionary of model to ids. The objects are loaded
+    with each index's ``index_queryset``, so any related objects it fetches are shared
+    by the whole batch.
+    """
+    from haystack import connections, connection_router
+    from haystack.exceptions import NotHandled
+    for using in connection_router.for_write():
+        backend = connections[using].get_backend()
+        unified_index = connections[using].get_unified_index()
+        for model,ids in by_model.items():
+            try:
+                index = unified_index.get_index(model)
+            except NotHandled:
+                continue
+            objs = list(index.index_queryset(using=using).filter(pk__in=ids))
+            if objs:
+                backend.update(index,objs)
+    search_cache.index_changed()
+
+class QueuedSignalProcessor(AristotleSignalProcessor):
+    """
+    Queues changed objects in ``SearchQueueEntry`` instead of reindexing them while they
+    are being saved, so an object changed many times in a request, such as an item and
+    its statuses during a cascading registration, is only indexed once.
+
+    The queue is flushed in batches when a request finishes, once the oldest entry
+    queued by the current thread is ``SEARCH_QUEUE_MAX_LAG`` seconds old, and by the
+    ``flush_search_queue`` management command. To use it, set ``HAYSTACK_SIGNAL_PROCESSOR``
+    to ``'aristotle_mdr.signals.QueuedSignalProcessor'``.
+    """
+    def setup(self):
+        request_finished.connect(self.handle_request_finished)
+        super(QueuedSignalProcessor,self).setup()
+
+    def teardown(self):
+        request_finished.disconnect(self.handle_request_finished)
+        super(QueuedSignalProcessor,self).teardown()
+
+    def is_indexed(self, model):
+        for using in self.connection_router.for_write():
+            if model in self.connections[using].get_unified_index().get_indexed_models():
+                return True
+        return False
+
+    def handle_save(self, sender, instance, **kwargs):
+        from aristotle_mdr.models import _concept
+        if isinstance(instance,_concept):
+            self.handle_concept_save(sender, instance, **kwargs)
+        elif self.is_indexed(sender):
+            queue_search_update(sender,instance.pk)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            queue_search_update(sender,instance.pk,remove=True)
+
+    def handle_status_change(self, sender, instance, **kwargs):
+        from aristotle_mdr.models import _concept
+        if not bulk.defer('reindex',instance.concept_id):
+            queue_search_update(_concept,instance.concept_id)
+
+    def handle_concept_save(self, sender, instance, **kwargs):
+        from aristotle_mdr.models import _concept
+        if not bulk.defer('reindex',instance.pk):
+            queue_search_update(_concept,instance.pk)
+
+    def handle_concept_delete(self, sender, instance, **kwargs):
+        obj = instance.item
+        self.handle_delete(obj.__class__,obj, **kwargs)
+
+    def handle_request_finished(self, **kwargs):
+        if getattr(_search_queue,'oldest',None) is not None:
+            flush_search_queue()
+
+SEARCH_QUEUE_MAX_LAG = 60
+SEARCH_QUEUE_BATCH_SIZE = 500
+
+_search_queue = threading.local()
+
+def search_queue_max_lag():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SEARCH_QUEUE_MAX_LAG',SEARCH_QUEUE_MAX_LAG)
+
+def queue_search_update(model,pk,remove=False):
+    """
+    Queues an object to be reindexed, or removed from the index if ``remove`` is set,
+    the next time the search queue is flushed.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import IntegrityError, transaction
+    from django.utils import timezone
+    from aristotle_mdr.models import SearchQueueEntry
+
+    content_type = ContentType.objects.get_for_model(model)
+    now = timezone.now()
+    entries = SearchQueueEntry.objects.filter(content_type=content_type,object_id=pk)
+    if not entries.update(remove=remove,queued=now):
+        try:
+            with transaction.atomic():
+                SearchQueueEntry.objects.create(content_type=content_type,object_id=pk,remove=remove,queued=now)
+        except IntegrityError:
+            # Queued by someone else at the same time.
+            entries.update(remove=remove,queued=now)
+
+    oldest = getattr(_search_queue,'oldest',None)
+    if oldest is None:
+        _search_queue.oldest = time.time()
+    elif time.time() - oldest > search_queue_max_lag():
+        flush_search_queue()
+
+def flush_search_queue(batch_size=None,progress=None):
+    """
+    Reindexes or removes everything in the search queue, in batches of ``batch_size``
+    entries, and returns how many entries were processed. If ``progress`` is given,
+    it is called with the running total after each batch.
+
+    Entries queued again while the flush is running are left for the next flush.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from django.utils import timezone
+    from haystack import connections, connection_router
+    from aristotle_mdr.models import SearchQueueEntry, _concept
+
+    _search_queue.oldest = None
+    started = timezone.now()
+    concept_type = ContentType.objects.get_for_model(_concept)
+    last = 0
+    total = 0
+    while True:
+        entries = list(
+            SearchQueueEntry.objects.filter(pk__gt=last,queued__lte=started)
+            .order_by('pk')[:batch_size or SEARCH_QUEUE_BATCH_SIZE]
+        )
+        if not entries:
+            return total
+        last = entries[-1].pk
+
+        updates = {}
+        for entry in entries:
+            if not entry.remove:
+                updates.setdefault(entry.content_type_id,[]).append(entry.object_id)
+        for type_id,ids in updates.items():
+            if type_id == concept_type.pk:
+                update_search_index(ids)
+            else:
+                model = ContentType.objects.get_for_id(type_id).model_class()
+                _update_backends({model:ids})
+        for entry in entries:
+            if entry.remove:
+                content_type = ContentType.objects.get_for_id(entry.content_type_id)
+                identifier = "%s.%s.%s" % (content_type.app_label,content_type.model,entry.object_id)
+                for using in connection_router.for_write():
+                    connections[using].get_backend().remove(identifier)
+                search_cache.index_changed()
+
+        SearchQueueEntry.objects.filter(pk__in=[e.pk for e in entries],queued__lte=started).delete()
+        total += len(entries)
+        if progress:
+            progress(total)
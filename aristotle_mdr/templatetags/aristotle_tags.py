@@ -77,6 +77,27 @@ def can_edit(item,user):
     except:  #pragma: no cover -- passing a bad item or user is the template authors fault
         return None
 
+@register.filter
+def registration_statuses(item):
+    """
+    Returns the registration authority and state name of each status of an item, using
+    its cached registration summary so the statuses themselves don't need to be queried.
+
+    For example::
+
+      {% for s in item|registration_statuses %}
+        [{{ s.registrationAuthority }}: {{ s.state_name }}]
+      {% endfor %}
+    """
+    states = item.registration_states
+    if not states:
+        return []
+    names = MDR.registration_authority_names()
+    return [
+        {'registrationAuthority':names.get(ra,""),'state_name':MDR.STATES[state]}
+        for ra,state in states
+    ]
+
 @register.filter
 def can_view_iter(qs,user):
     """
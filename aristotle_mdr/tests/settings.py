@@ -40,7 +40,7 @@ INSTALLED_APPS = (
 
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        'ENGINE': 'aristotle_mdr.search_backends.whoosh_backend.FacetedWhooshEngine',
         'PATH': os.path.join(os.path.dirname(__file__), 'aristotle_mdr/tests/whoosh_index'),
         'INCLUDE_SPELLING':True,
     },
@@ -53,6 +53,9 @@ PASSWORD_HASHERS = (
 )
 
 ARISTOTLE_SETTINGS['SEPARATORS']['DataElementConcept'] = '--'
+# Tests use an in-memory database, which can't be seen from a background thread.
+ARISTOTLE_SETTINGS['RECACHE_MODE'] = 'immediate'
+ARISTOTLE_SETTINGS['NOTIFICATION_MODE'] = 'immediate'
 ARISTOTLE_SETTINGS['CONTENT_EXTENSIONS'] = ARISTOTLE_SETTINGS['CONTENT_EXTENSIONS'] +['extension_test']
 ARISTOTLE_DOWNLOADS = ARISTOTLE_DOWNLOADS +[
     ('txt','Text','fa-file-pdf-o','text_download_test'),
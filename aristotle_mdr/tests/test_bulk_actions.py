@@ -1,5 +1,7 @@
 from django.test import TestCase
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import aristotle_mdr.models as models
 import aristotle_mdr.perms as perms
 import aristotle_mdr.tests.utils as utils
@@ -61,6 +63,8 @@ class BulkWorkgroupActionsPage(utils.LoggedInViewPages,TestCase):
                     'confirmed':'confirmed',
                 }
             )
+        self.item1 = models._concept.objects.get(pk=self.item1.pk) # Stupid cache
+        self.item2 = models._concept.objects.get(pk=self.item2.pk) # Stupid cache
         self.assertTrue(self.item1.is_registered)
         self.assertTrue(self.item2.is_registered)
 
@@ -85,6 +89,137 @@ class BulkWorkgroupActionsPage(utils.LoggedInViewPages,TestCase):
                     'confirmed':'confirmed',
                 }
             )
+        self.item1 = models._concept.objects.get(pk=self.item1.pk) # Stupid cache
         self.assertTrue(self.item1.is_registered)
         self.assertFalse(self.item2.is_registered)
         self.assertFalse(self.item4.is_registered)
+
+class BulkRegistration(utils.LoggedInViewPages,TestCase):
+    def setUp(self):
+        super(BulkRegistration, self).setUp()
+        self.ra2 = models.RegistrationAuthority.objects.create(name="Test RA 2")
+        self.oc = models.ObjectClass.objects.create(name="OC",workgroup=self.wg1,readyToReview=True)
+        self.pr = models.Property.objects.create(name="Prop",workgroup=self.wg1,readyToReview=True)
+        self.dec = models.DataElementConcept.objects.create(name="DEC",workgroup=self.wg1,
+            readyToReview=True,objectClass=self.oc,property=self.pr)
+        self.des = [
+            models.DataElement.objects.create(name="DE %s"%i,workgroup=self.wg1,readyToReview=True,dataElementConcept=self.dec)
+            for i in range(3)
+        ]
+        self.forbidden = models.ObjectClass.objects.create(name="Forbidden",workgroup=self.wg2,readyToReview=True)
+
+    def test_register_many_matches_register(self):
+        state = models.STATES.standard
+        results = self.ra.register_many(self.des+[self.forbidden],state,self.registrar,cascade=True)
+        by_item = dict((r.item.pk,r) for r in results)
+
+        self.assertFalse(by_item[self.forbidden.pk].permitted)
+        self.assertEqual(self.forbidden.statuses.count(),0)
+        for item in self.des+[self.dec,self.oc,self.pr]:
+            result = by_item[item.pk]
+            self.assertTrue(result.permitted)
+            self.assertEqual(result.created,[self.ra])
+            self.assertEqual(item.statuses.get().state,state)
+            item = models._concept.objects.get(pk=item.pk) # Stupid cache
+            self.assertTrue(item.is_public())
+            self.assertTrue(item.is_locked())
+        # The DEC and its parts are reached by cascading from the data elements, but only once.
+        self.assertEqual(len(results),len(set(by_item.keys())))
+        self.assertTrue(by_item[self.dec.pk].cascaded)
+        self.assertFalse(by_item[self.des[0].pk].cascaded)
+
+        results = self.ra.register_many(self.des,models.STATES.candidate,self.registrar)
+        self.assertEqual([r.updated for r in results],[[self.ra]]*3)
+        for item in self.des:
+            self.assertEqual(item.statuses.get().state,models.STATES.candidate)
+            item = models._concept.objects.get(pk=item.pk) # Stupid cache
+            self.assertFalse(item.is_public())
+        self.assertEqual(self.dec.statuses.get().state,models.STATES.standard)
+
+    def test_register_items_in_many_authorities(self):
+        su = models.User.objects.get(pk=self.su.pk)
+        results = models.register_items([self.ra,self.ra2],self.des,models.STATES.candidate,su)
+        self.assertEqual(len(results),3)
+        # The instances passed in are brought up to date
+        for item in self.des:
+            self.assertTrue(item.is_registered)
+            self.assertEqual(sorted(item.registration_states),sorted([
+                (self.ra.pk,models.STATES.candidate),(self.ra2.pk,models.STATES.candidate)
+            ]))
+        for item in self.des:
+            self.assertEqual(
+                sorted(item.statuses.values_list('registrationAuthority',flat=True)),
+                sorted([self.ra.pk,self.ra2.pk])
+            )
+
+    def test_register_items_notifies_watchers(self):
+        self.editor.profile.favourites.add(self.des[0])
+        self.viewer.notifications.all().delete()
+        self.editor.notifications.all().delete()
+        models.register_items([self.ra],self.des,models.STATES.candidate,self.registrar)
+        self.assertEqual(
+            set(n.actor_object_id for n in self.viewer.notifications.filter(verb="motified item in workgroup")),
+            set(str(item.pk) for item in self.des)
+        )
+        self.assertEqual(self.editor.notifications.filter(verb="changed a favourited item").count(),1)
+        self.assertFalse(models.ConceptChange.objects.exists())
+
+    def test_change_status_page_keeps_history(self):
+        self.login_registrar()
+        response = self.client.post(reverse('aristotle:changeStatus',args=[self.oc.id]),
+                {   'registrationAuthorities': [str(self.ra.id)],
+                    'state': self.ra.public_state,
+                    'changeDetails': "testing",
+                    'cascadeRegistration': 0,
+                }
+            )
+        self.assertEqual(response.status_code,302)
+        self.assertEqual(self.oc.statuses.count(),1)
+        response = self.client.get(reverse('aristotle:registrationHistory',args=[self.oc.id]))
+        self.assertEqual(response.status_code,200)
+        status,history = response.context['history'][0]
+        self.assertEqual(len(history),1)
+
+    def test_cascade_closure_visits_shared_items_once(self):
+        registrar = models.User.objects.get(pk=self.registrar.pk)
+        perms.get_principal(registrar).registrar_authority_ids
+        with CaptureQueriesContext(connection) as queries:
+            plan = models.registration_plan([self.ra],self.des,registrar,cascade=True)
+        # One level each for the data elements, the DEC and its object class and property,
+        # rather than a fetch and permission check for every related item.
+        self.assertTrue(len(queries) <= 12)
+        self.assertEqual(
+            sorted(r.item.pk for r in plan),
+            sorted([i.pk for i in self.des]+[self.dec.pk,self.oc.pk,self.pr.pk])
+        )
+        self.assertEqual([r.cascaded for r in plan if r.item.pk == self.oc.pk],[True])
+        self.assertEqual(models.Status.objects.filter(concept__in=[r.item.pk for r in plan]).count(),0)
+
+        self.ra.register(self.des[0],models.STATES.standard,self.registrar,cascade=True)
+        for item in [self.des[0],self.dec,self.oc,self.pr]:
+            self.assertEqual(item.statuses.get().state,models.STATES.standard)
+        self.assertEqual(self.des[1].statuses.count(),0)
+
+    def test_bulk_change_status_preview(self):
+        self.login_registrar()
+        self.ra.register(self.oc,models.STATES.candidate,self.registrar)
+        response = self.client.post(reverse('aristotle:bulk_action'),
+                {   'bulkaction': 'change_state',
+                    'state'     : models.STATES.standard,
+                    'items'     : [self.dec.id,self.forbidden.id],
+                    'registrationDate'   : "2014-10-27",
+                    'cascadeRegistration': 1,
+                    'registrationAuthorities'   : [self.ra.id],
+                    'preview':'preview',
+                }
+            )
+        self.assertEqual(response.status_code,200)
+        preview = dict((r.item.pk,r) for r in response.context['preview'])
+        self.assertEqual(sorted(preview.keys()),sorted([self.dec.pk,self.oc.pk,self.pr.pk,self.forbidden.pk]))
+        self.assertFalse(preview[self.forbidden.pk].permitted)
+        self.assertEqual(preview[self.oc.pk].updated,[self.ra])
+        self.assertEqual(preview[self.dec.pk].created,[self.ra])
+        self.assertContains(response,"(cascaded)")
+        # Nothing is changed by a preview
+        self.assertEqual(self.dec.statuses.count(),0)
+        self.assertEqual(self.oc.statuses.get().state,models.STATES.candidate)
@@ -67,6 +67,405 @@ class CachingForRawPermissions(TestCase):
         self.assertTrue(perms.user_can_view(self.submitter,self.item))
         self.assertTrue(perms.user_can_view(self.viewer,self.item))
 
+class PermissionGenerationCaching(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        self.wg = models.Workgroup.objects.create(name="Test WG 1")
+        self.wg.registrationAuthorities=[self.ra]
+        self.wg.save()
+        self.viewer = User.objects.create_user('vicky','','viewer')
+        self.item = models.ObjectClass.objects.create(name="Test OC1",workgroup=self.wg)
+
+    def fresh_viewer(self):
+        # A new user object is a new request, with a new principal.
+        return User.objects.get(pk=self.viewer.pk)
+
+    def test_decisions_are_served_from_cache(self):
+        viewer = self.fresh_viewer()
+        self.assertFalse(perms.user_can_view(viewer,self.item))
+        with self.assertNumQueries(0):
+            self.assertFalse(perms.user_can_view(viewer,self.item))
+
+    def test_workgroup_role_change_invalidates_decision(self):
+        self.assertFalse(perms.user_can_view(self.fresh_viewer(),self.item))
+        self.wg.viewers.add(self.viewer)
+        self.assertTrue(perms.user_can_view(self.fresh_viewer(),self.item))
+        self.wg.viewers.remove(self.viewer)
+        self.assertFalse(perms.user_can_view(self.fresh_viewer(),self.item))
+        self.viewer.viewer_in.add(self.wg)
+        self.assertTrue(perms.user_can_view(self.fresh_viewer(),self.item))
+        self.viewer.viewer_in.clear()
+        self.assertFalse(perms.user_can_view(self.fresh_viewer(),self.item))
+
+    def test_registrar_change_invalidates_decision(self):
+        self.item.readyToReview = True
+        self.item.save()
+        self.assertFalse(perms.user_can_view(self.fresh_viewer(),self.item))
+        self.ra.registrars.add(self.viewer)
+        self.assertTrue(perms.user_can_view(self.fresh_viewer(),self.item))
+        self.ra.registrars.remove(self.viewer)
+        self.assertFalse(perms.user_can_view(self.fresh_viewer(),self.item))
+
+    def test_decision_key_length_is_fixed(self):
+        key = perms._decision_key('view',self.fresh_viewer(),self.item)
+        for i in range(20):
+            ra = models.RegistrationAuthority.objects.create(name="Other RA %s"%i)
+            ra.registrars.add(self.viewer)
+        self.assertEqual(len(perms._decision_key('view',self.fresh_viewer(),self.item)),len(key))
+        self.assertTrue(len(key) < 250)
+
+    def test_anonymous_decisions_are_cached_and_invalidated(self):
+        from django.contrib.auth.models import AnonymousUser
+        anon = AnonymousUser()
+        self.assertFalse(perms.user_can_view(anon,self.item))
+        with self.assertNumQueries(0):
+            self.assertFalse(perms.user_can_view(anon,self.item))
+        models.Status.objects.create(
+            concept=self.item,
+            registrationAuthority=self.ra,
+            registrationDate = datetime.date(2009,04,28),
+            state = self.ra.public_state
+            )
+        self.item = models.ObjectClass.objects.get(pk=self.item.pk)
+        self.assertTrue(perms.user_can_view(anon,self.item))
+
+class BulkRecacheStates(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA",
+            public_state=models.STATES.standard,locked_state=models.STATES.candidate)
+        self.other_ra = models.RegistrationAuthority.objects.create(name="Other RA",
+            public_state=models.STATES.candidate,locked_state=models.STATES.candidate)
+        self.wg = models.Workgroup.objects.create(name="Authority WG")
+        self.registry_wg = models.Workgroup.objects.create(name="Registry WG",ownership=models.WORKGROUP_OWNERSHIP.registry)
+        self.wg.registrationAuthorities.add(self.ra)
+        self.registry_wg.registrationAuthorities.add(self.ra)
+        self.items = []
+        for wg in [self.wg,self.registry_wg]:
+            for ra in [self.ra,self.other_ra]:
+                for state in [models.STATES.incomplete,models.STATES.candidate,models.STATES.standard]:
+                    item = models.ObjectClass.objects.create(name="OC",workgroup=wg)
+                    models.Status.objects.create(
+                        concept=item,registrationAuthority=ra,
+                        registrationDate=datetime.date(2000,1,1),state=state
+                        )
+                    self.items.append(item)
+
+    def states(self):
+        return dict((i.pk,(i._is_public,i._is_locked)) for i in models._concept.objects.filter(pk__in=[i.pk for i in self.items]))
+
+    def test_bulk_recache_matches_item_recache(self):
+        # Move the goalposts without saving any items, so the cached states are stale.
+        models.RegistrationAuthority.objects.filter(pk=self.ra.pk).update(public_state=models.STATES.candidate,locked_state=models.STATES.incomplete)
+        models.RegistrationAuthority.objects.filter(pk=self.other_ra.pk).update(public_state=models.STATES.standard)
+        stale = self.states()
+
+        expected = {}
+        for item in models._concept.objects.filter(pk__in=[i.pk for i in self.items]):
+            expected[item.pk] = (item.check_is_public(),item.check_is_locked())
+
+        items = models._concept.objects.filter(pk__in=[i.pk for i in self.items])
+        changed = items.recache_states()
+        self.assertEqual(self.states(),expected)
+        self.assertEqual(changed,set(pk for pk in expected if expected[pk] != stale[pk]))
+        self.assertTrue(len(changed) > 0)
+        self.assertEqual(items.recache_states(),set())
+
+    def test_bulk_recache_sends_no_signals(self):
+        from django.db.models.signals import post_save
+        saves = []
+        def saved(sender, **kwargs):
+            saves.append(sender)
+        post_save.connect(saved)
+        try:
+            models.RegistrationAuthority.objects.filter(pk=self.ra.pk).update(public_state=models.STATES.incomplete)
+            self.assertTrue(len(models._concept.objects.filter(workgroup=self.wg).recache_states()) > 0)
+        finally:
+            post_save.disconnect(saved)
+        self.assertEqual(saves,[])
+
+class ConcreteItemTypes(TestCase):
+    def setUp(self):
+        self.wg = models.Workgroup.objects.create(name="Type WG")
+        self.oc = models.ObjectClass.objects.create(name="OC",workgroup=self.wg)
+        self.de = models.DataElement.objects.create(name="DE",workgroup=self.wg)
+        self.vd = models.ValueDomain.objects.create(name="VD",workgroup=self.wg)
+
+    def test_item_type_is_stored_and_used(self):
+        from django.contrib.contenttypes.models import ContentType
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.assertEqual(models._concept.objects.get(pk=self.de.pk)._type,ContentType.objects.get_for_model(models.DataElement))
+
+        item = models._concept.objects.get(pk=self.de.pk)
+        ContentType.objects.get_for_id(item._type_id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(type(item.item),models.DataElement)
+            self.assertEqual(item.item.pk,self.de.pk)
+            self.assertTrue(item.item is item.item)
+        self.assertEqual(len(queries),1)
+
+        # Items without a stored type still work
+        models._concept.objects.filter(pk=self.oc.pk).update(_type=None)
+        self.assertEqual(type(models._concept.objects.get(pk=self.oc.pk).item),models.ObjectClass)
+        # Saving the base item doesn't change its type
+        item = models._concept.objects.get(pk=self.de.pk)
+        item.save()
+        self.assertEqual(type(models._concept.objects.get(pk=self.de.pk).item),models.DataElement)
+
+    def test_resolve_subclasses(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        models._concept.objects.filter(pk=self.oc.pk).update(_type=None)
+        ids = [self.vd.pk,self.oc.pk,self.de.pk]
+        items = list(models._concept.objects.filter(pk__in=ids).order_by('-pk'))
+        with CaptureQueriesContext(connection) as queries:
+            resolved = models.resolve_subclasses(items)
+        self.assertEqual([i.pk for i in resolved],[i.pk for i in items])
+        self.assertEqual(
+            dict((i.pk,type(i)) for i in resolved),
+            {self.vd.pk:models.ValueDomain,self.oc.pk:models.ObjectClass,self.de.pk:models.DataElement}
+        )
+        # One query for each type, plus content type lookups the first time each is seen.
+        self.assertTrue(len(queries) <= 6)
+        self.assertTrue(items[0].item is resolved[0])
+
+class RegistrationSummary(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        self.ra2 = models.RegistrationAuthority.objects.create(name="Other RA")
+        self.wg = models.Workgroup.objects.create(name="Summary WG")
+        self.item = models.ObjectClass.objects.create(name="OC",workgroup=self.wg)
+
+    def fresh(self):
+        return models.ObjectClass.objects.get(pk=self.item.pk)
+
+    def test_summary_follows_statuses(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        item = self.fresh()
+        self.assertFalse(item.is_registered)
+        self.assertEqual(item._highest_state,None)
+
+        s1 = models.Status.objects.create(concept=self.item,registrationAuthority=self.ra,
+            registrationDate=datetime.date(2000,1,1),state=models.STATES.retired)
+        item = self.fresh()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(item.is_registered)
+            self.assertTrue(item.is_retired)
+            self.assertEqual(item.registration_authority_ids,[self.ra.pk])
+        self.assertEqual(len(queries),0)
+
+        s2 = models.Status.objects.create(concept=self.item,registrationAuthority=self.ra2,
+            registrationDate=datetime.date(2000,1,1),state=models.STATES.candidate)
+        item = self.fresh()
+        self.assertFalse(item.is_retired)
+        self.assertEqual(item._highest_state,models.STATES.retired)
+        self.assertEqual(sorted(item.registration_states),sorted([
+            (self.ra.pk,models.STATES.retired),(self.ra2.pk,models.STATES.candidate)
+        ]))
+
+        s1.delete()
+        item = self.fresh()
+        self.assertEqual(item.registration_states,[(self.ra2.pk,models.STATES.candidate)])
+        self.assertEqual(item._highest_state,models.STATES.candidate)
+        s2.delete()
+        item = self.fresh()
+        self.assertFalse(item.is_registered)
+        self.assertEqual(item._registration_states,"")
+
+    def test_bulk_recache_matches_item_summary(self):
+        models.Status.objects.create(concept=self.item,registrationAuthority=self.ra,
+            registrationDate=datetime.date(2000,1,1),state=models.STATES.standard)
+        expected = models._concept.objects.filter(pk=self.item.pk).values_list('_is_registered','_highest_state','_registration_states')[0]
+        models._concept.objects.filter(pk=self.item.pk).update(_is_registered=False,_highest_state=None,_registration_states="")
+        items = models._concept.objects.filter(pk=self.item.pk)
+        self.assertEqual(items.recache_registration_summary(),set([self.item.pk]))
+        self.assertEqual(items.values_list('_is_registered','_highest_state','_registration_states')[0],expected)
+        self.assertEqual(items.recache_registration_summary(),set())
+
+    def test_search_index_uses_summary(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from aristotle_mdr.search_indexes import ObjectClassIndex
+        models.Status.objects.create(concept=self.item,registrationAuthority=self.ra,
+            registrationDate=datetime.date(2000,1,1),state=models.STATES.standard)
+        item = self.fresh()
+        index = ObjectClassIndex()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(index.prepare_highest_state(item),models.STATES.standard)
+            self.assertEqual(index.prepare_statuses(item),[models.STATES[models.STATES.standard]])
+            self.assertEqual(index.prepare_ra_statuses(item),["%s___%s"%(self.ra.pk,models.STATES.standard)])
+            self.assertEqual(index.prepare_registrationAuthorities(item),[str(self.ra.pk)])
+        self.assertEqual(len(queries),0)
+
+class BackgroundRecacheJobs(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA",public_state=models.STATES.standard)
+        self.wg = models.Workgroup.objects.create(name="Test WG")
+        self.wg.registrationAuthorities.add(self.ra)
+        self.items = []
+        for i in range(5):
+            item = models.ObjectClass.objects.create(name="OC %s"%i,workgroup=self.wg)
+            models.Status.objects.create(
+                concept=item,registrationAuthority=self.ra,
+                registrationDate=datetime.date(2000,1,1),state=models.STATES.candidate
+                )
+            self.items.append(item)
+
+    def public_items(self):
+        return models._concept.objects.filter(pk__in=[i.pk for i in self.items],_is_public=True).count()
+
+    def test_ra_change_is_propagated(self):
+        self.assertEqual(self.public_items(),0)
+        self.ra.public_state = models.STATES.candidate
+        self.ra.save()
+        self.assertEqual(self.public_items(),5)
+        job = models.RecacheJob.objects.get(registrationAuthority=self.ra)
+        self.assertTrue(job.finished is not None)
+        self.assertEqual(job.processed,5)
+
+    def test_repeated_changes_are_coalesced(self):
+        from django.core.management import call_command
+        from django.conf import settings
+        from django.test.utils import override_settings
+        from django.utils.six import StringIO
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,RECACHE_MODE='manual')):
+            self.ra.public_state = models.STATES.candidate
+            self.ra.save()
+            self.ra.locked_state = models.STATES.standard
+            self.ra.save()
+        self.assertEqual(self.public_items(),0)
+        job = models.RecacheJob.objects.get(registrationAuthority=self.ra)
+        self.assertEqual(job.restarts,1)
+        self.assertTrue(job.finished is None)
+
+        call_command('process_recache_jobs',chunk_size=2,stdout=StringIO())
+        self.assertEqual(self.public_items(),5)
+        job = models.RecacheJob.objects.get(pk=job.pk)
+        self.assertTrue(job.finished is not None)
+        self.assertEqual((job.processed,job.total),(5,5))
+
+    def test_interrupted_job_resumes(self):
+        from django.conf import settings
+        from django.test.utils import override_settings
+        from aristotle_mdr import recache
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,RECACHE_MODE='manual')):
+            self.ra.public_state = models.STATES.candidate
+            self.ra.save()
+
+        class Interrupted(Exception):
+            pass
+        def interrupt(job):
+            raise Interrupted
+        with self.assertRaises(Interrupted):
+            recache.process_recache_jobs(chunk_size=2,progress=interrupt)
+        job = models.RecacheJob.objects.get(registrationAuthority=self.ra)
+        self.assertTrue(job.finished is None)
+        self.assertEqual(job.processed,2)
+        self.assertEqual(self.public_items(),2)
+
+        progress = []
+        recache.process_recache_jobs(chunk_size=2,progress=progress.append)
+        self.assertEqual([j.processed for j in progress],[4,5])
+        self.assertEqual(self.public_items(),5)
+        job = models.RecacheJob.objects.get(pk=job.pk)
+        self.assertEqual((job.claimed_by,job.claimed),("",None))
+
+    def test_claimed_jobs_are_skipped(self):
+        import datetime
+        from django.conf import settings
+        from django.test.utils import override_settings
+        from django.utils import timezone
+        from aristotle_mdr import recache
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,RECACHE_MODE='manual')):
+            self.ra.public_state = models.STATES.candidate
+            self.ra.save()
+        jobs = models.RecacheJob.objects.filter(registrationAuthority=self.ra)
+
+        # Another worker is running the job
+        jobs.update(claimed_by="other",claimed=timezone.now())
+        self.assertEqual(recache.claim_job("mine"),None)
+        recache.process_recache_jobs()
+        self.assertEqual(self.public_items(),0)
+        self.assertTrue(jobs.get().finished is None)
+
+        # The other worker stopped renewing its claim, so the job is taken over
+        lapsed = timezone.now() - datetime.timedelta(seconds=recache.RECACHE_CLAIM_SECONDS+1)
+        jobs.update(claimed=lapsed)
+        recache.process_recache_jobs()
+        self.assertEqual(self.public_items(),5)
+        self.assertTrue(jobs.get().finished is not None)
+
+class BulkMode(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA",public_state=models.STATES.recorded)
+        self.wg = models.Workgroup.objects.create(name="Test WG 1")
+        self.wg.registrationAuthorities.add(self.ra)
+        self.registrar = User.objects.create_user('reggie','','registrar')
+        self.ra.giveRoleToUser('registrar',self.registrar)
+        self.viewer = User.objects.create_user('vicky','','viewer')
+        self.wg.giveRoleToUser('viewer',self.viewer)
+
+    def tearDown(self):
+        from django.core.management import call_command
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def test_handlers_run_once_at_the_end(self):
+        import aristotle_mdr
+        from haystack.query import SearchQuerySet
+        with aristotle_mdr.bulk_mode():
+            items = [models.ObjectClass.objects.create(name="Bulk item %s"%i,description="",workgroup=self.wg,readyToReview=True) for i in range(3)]
+            for item in items:
+                item.save()
+                self.ra.register(item,models.STATES.standard,self.registrar)
+            # Nothing has happened yet
+            self.assertFalse(models._concept.objects.filter(pk__in=[i.pk for i in items],_is_public=True).exists())
+            self.assertFalse(self.viewer.notifications.exists())
+            self.assertFalse(models.ConceptChange.objects.exists())
+        for item in items:
+            item = models._concept.objects.get(pk=item.pk) # Stupid cache
+            self.assertTrue(item._is_public)
+            self.assertTrue(item.is_registered)
+            self.assertEqual(item.registration_states,[(self.ra.pk,models.STATES.standard)])
+        # One notification per item, even though each item was saved twice
+        self.assertEqual(self.viewer.notifications.filter(verb="new item in workgroup").count(),3)
+        self.assertFalse(self.viewer.notifications.filter(verb="motified item in workgroup").exists())
+        self.assertFalse(models.ConceptChange.objects.exists())
+        self.assertEqual(SearchQuerySet().filter(name="Bulk").count(),3)
+
+    def test_exception_discards_everything(self):
+        import aristotle_mdr
+        try:
+            with aristotle_mdr.bulk_mode():
+                models.ObjectClass.objects.create(name="Rolled back",description="",workgroup=self.wg)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(models.ObjectClass.objects.filter(name="Rolled back").exists())
+        self.assertFalse(self.viewer.notifications.exists())
+        # Saves afterwards are handled as normal
+        models.ObjectClass.objects.create(name="Not rolled back",description="",workgroup=self.wg)
+        self.assertEqual(self.viewer.notifications.count(),1)
+
+    def test_decorator_and_nesting(self):
+        import aristotle_mdr
+        from aristotle_mdr import bulk
+
+        @aristotle_mdr.bulk_mode()
+        def make(name):
+            self.assertTrue(bulk.active())
+            return models.ObjectClass.objects.create(name=name,description="",workgroup=self.wg)
+
+        with aristotle_mdr.bulk_mode():
+            make("Inner 1")
+            make("Inner 2")
+            # The inner blocks are merged into this one
+            self.assertFalse(self.viewer.notifications.exists())
+        self.assertFalse(bulk.active())
+        self.assertEqual(self.viewer.notifications.count(),2)
+        make("Outer")
+        self.assertEqual(self.viewer.notifications.count(),3)
+
 """
 class TestPageViewCaches(utils.LoggedInViewPages,TestCase):
     def setUp(self):
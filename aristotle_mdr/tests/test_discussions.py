@@ -399,3 +399,171 @@ class ViewDiscussionPostPage(utils.LoggedInViewPages,TestCase):
         self.wg1.removeRoleFromUser('viewer',self.viewer)
         response = self.client.get(reverse('aristotle:discussionsPost',args=[post.id]))
         self.assertEqual(response.status_code,403)
+
+class ItemChangeNotifications(TestCase):
+    def setUp(self):
+        self.wg = models.Workgroup.objects.create(name="Test WG 1")
+        self.viewer = User.objects.create_user('vicky','','viewer')
+        self.wg.giveRoleToUser('viewer',self.viewer)
+        self.item = models.ObjectClass.objects.create(name="Test item",description="",workgroup=self.wg)
+
+    def add_viewers(self,count):
+        start = User.objects.count()
+        for i in range(start,start+count):
+            self.wg.giveRoleToUser('viewer',User.objects.create_user('viewer%s'%i,'','viewer'))
+
+    def test_viewers_and_favourites_are_notified(self):
+        fan = User.objects.create_user('fan','','fan')
+        fan.profile.favourites.add(self.item)
+        self.assertEqual(self.viewer.notifications.filter(verb="new item in workgroup").count(),1)
+        self.item.save()
+        notification = self.viewer.notifications.get(verb="motified item in workgroup")
+        self.assertEqual(notification.actor,self.item)
+        self.assertEqual(notification.target,self.wg)
+        self.assertEqual(fan.notifications.filter(verb="changed a favourited item").count(),1)
+        self.assertFalse(models.ConceptChange.objects.exists())
+
+    def test_related_discussions_get_a_comment(self):
+        User.objects.get_or_create(username="aristotle")
+        post = models.DiscussionPost.objects.create(author=self.viewer,workgroup=self.wg,title="test",body="test")
+        post.relatedItems.add(self.item)
+        self.item.save()
+        self.assertEqual(post.comments.count(),1)
+        self.assertTrue('Test item' in post.comments.first().body)
+
+    def test_save_cost_does_not_grow_with_the_workgroup(self):
+        from django.conf import settings
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext, override_settings
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,NOTIFICATION_COALESCE_SECONDS=0)):
+            self.add_viewers(2)
+            with CaptureQueriesContext(connection) as small:
+                models.ObjectClass.objects.get(pk=self.item.pk).save()
+            self.add_viewers(20)
+            with CaptureQueriesContext(connection) as large:
+                models.ObjectClass.objects.get(pk=self.item.pk).save()
+        self.assertEqual(len(small),len(large))
+        self.assertEqual(models.Workgroup.objects.get(pk=self.wg.pk).viewers.count(),23)
+        from notifications.models import Notification
+        self.assertEqual(Notification.objects.filter(verb="motified item in workgroup").count(),3+23)
+
+    def test_manual_mode_waits_for_the_command(self):
+        from django.conf import settings
+        from django.core.management import call_command
+        from django.test.utils import override_settings
+        from django.utils.six import StringIO
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,NOTIFICATION_MODE='manual')):
+            self.item.save()
+            self.assertEqual(models.ConceptChange.objects.count(),1)
+            self.assertFalse(self.viewer.notifications.filter(verb="motified item in workgroup").exists())
+            call_command('process_notifications',stdout=StringIO())
+        self.assertFalse(models.ConceptChange.objects.exists())
+        self.assertEqual(self.viewer.notifications.filter(verb="motified item in workgroup").count(),1)
+
+    def test_repeated_saves_are_coalesced(self):
+        from django.conf import settings
+        from django.test.utils import override_settings
+        for i in range(3):
+            self.item.save()
+        notices = self.viewer.notifications.filter(verb="motified item in workgroup")
+        self.assertEqual(notices.count(),1)
+        first = notices.get()
+        first.mark_as_read()
+        self.item.save()
+        self.assertEqual(notices.count(),2)
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,NOTIFICATION_COALESCE_SECONDS=0)):
+            self.item.save()
+        self.assertEqual(notices.count(),3)
+
+    def test_digest_mode_merges_items_in_a_workgroup(self):
+        from django.conf import settings
+        from django.core.management import call_command
+        from django.test.utils import override_settings
+        from django.utils.six import StringIO
+        from aristotle_mdr import fanout
+        self.viewer.notifications.all().delete()
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,NOTIFICATION_MODE='digest')):
+            other = models.Property.objects.create(name="Other item",description="",workgroup=self.wg)
+            self.item.save()
+            self.item.save()
+            self.assertEqual(models.ConceptChange.objects.count(),3)
+            call_command('process_notifications',stdout=StringIO())
+            digest = self.viewer.notifications.get()
+            self.assertEqual(digest.verb,fanout.DIGEST_VERB)
+            self.assertEqual(digest.actor,self.wg)
+            self.assertTrue('Test item' in digest.description)
+            self.assertTrue('Other item' in digest.description)
+
+            # A later digest about the same workgroup is merged into the unread one
+            third = models.DataType.objects.create(name="Third item",description="",workgroup=self.wg)
+            other.save()
+            call_command('process_notifications',stdout=StringIO())
+            digest = self.viewer.notifications.get()
+            self.assertTrue('Third item' in digest.description)
+            self.assertTrue('Test item' in digest.description)
+
+    def test_claimed_changes_are_skipped(self):
+        import datetime
+        from django.conf import settings
+        from django.test.utils import override_settings
+        from django.utils import timezone
+        from aristotle_mdr import fanout
+        self.viewer.notifications.all().delete()
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,NOTIFICATION_MODE='manual')):
+            self.item.save()
+        changes = models.ConceptChange.objects.all()
+        notices = self.viewer.notifications.filter(verb="motified item in workgroup")
+
+        # Another worker is sending the change
+        changes.update(claimed_by="other",claimed=timezone.now())
+        self.assertEqual(fanout.claim_changes("mine",10),[])
+        fanout.process_concept_changes()
+        self.assertEqual(changes.count(),1)
+        self.assertFalse(notices.exists())
+
+        # The other worker stopped without finishing, so the change is taken over
+        lapsed = timezone.now() - datetime.timedelta(seconds=fanout.NOTIFICATION_CLAIM_SECONDS+1)
+        changes.update(claimed=lapsed)
+        fanout.process_concept_changes()
+        self.assertFalse(changes.exists())
+        self.assertEqual(notices.count(),1)
+
+    def test_changes_are_only_sent_once_by_overlapping_workers(self):
+        from django.conf import settings
+        from django.test.utils import override_settings
+        from aristotle_mdr import fanout
+        self.viewer.notifications.all().delete()
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,
+                NOTIFICATION_MODE='manual',NOTIFICATION_COALESCE_SECONDS=0)):
+            self.item.save()
+            # Another worker starts while the first is sending its batch
+            notify = fanout.notify_concept_changes
+            def notify_with_another_worker(changes,digest=False):
+                fanout.notify_concept_changes = notify
+                fanout.process_concept_changes()
+                notify(changes,digest)
+            fanout.notify_concept_changes = notify_with_another_worker
+            try:
+                fanout.process_concept_changes()
+            finally:
+                fanout.notify_concept_changes = notify
+        self.assertFalse(models.ConceptChange.objects.exists())
+        self.assertEqual(self.viewer.notifications.filter(verb="motified item in workgroup").count(),1)
+
+    def test_failed_changes_are_released(self):
+        from django.conf import settings
+        from django.test.utils import override_settings
+        from aristotle_mdr import fanout
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,NOTIFICATION_MODE='manual')):
+            self.item.save()
+            notify = fanout.notify_concept_changes
+            def fail(changes,digest=False):
+                raise ValueError("failed")
+            fanout.notify_concept_changes = fail
+            try:
+                with self.assertRaises(ValueError):
+                    fanout.process_concept_changes()
+            finally:
+                fanout.notify_concept_changes = notify
+        change = models.ConceptChange.objects.get()
+        self.assertEqual((change.claimed_by,change.claimed),("",None))
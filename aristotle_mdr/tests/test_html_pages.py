@@ -40,7 +40,63 @@ class AnonymousUserViewingThePages(TestCase):
         home = self.client.get(url_slugify_concept(item))
         self.assertEqual(home.status_code,200)
 
-class LoggedInViewConceptPages(utils.LoggedInViewPages):
+# Queries every logged in page takes: the session, the user, the recently modified check,
+# the user's registration authorities and workgroups, their profile, whether the item is a
+# favourite, its latest version, three compiled stylesheet lookups, the favourites count and
+# the unread notifications count and list.
+REQUEST_QUERIES = 14
+# Queries every item page takes after the item is loaded: the packages it is in and the
+# count and visible list of items it supersedes.
+ITEM_PAGE_QUERIES = 3
+
+def page_queries(itemType,listed=0):
+    """
+    The queries the page for an item of the given type takes, see ``models.load_concept_page``.
+    The type and item are two queries and each prefetch is one more, except
+    ``statuses__registrationAuthority`` which is two. ``listed`` is the number of related
+    lists the template filters with ``can_view_iter``, each of which is one more query.
+    """
+    return REQUEST_QUERIES + 2 + len(itemType.page_prefetch_related) + 1 + ITEM_PAGE_QUERIES + listed
+
+class PageQueryBudget(object):
+    # The most queries the page for item1 may take, see ``page_queries``.
+    # Types differ by how many related sets they prefetch and how many related lists their
+    # templates filter by visibility even when empty, so each sets its own budget.
+    # Without a budget the test only checks the page doesn't take more queries for more statuses.
+    page_query_budget = None
+    def make_page_related_items(self):
+        pass
+
+    def test_page_query_budget(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.make_page_related_items()
+        ras = [self.ra]+[models.RegistrationAuthority.objects.create(name="Budget RA %s"%i) for i in range(3)]
+        def register(ra):
+            models.Status.objects.create(concept=self.item1,registrationAuthority=ra,
+                registrationDate=datetime.date(2000,1,1),state=models.STATES.candidate)
+        register(ras[0])
+
+        self.login_viewer()
+        self.client.get(self.get_page(self.item1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.get_page(self.item1))
+        self.assertEqual(response.status_code,200)
+        if self.page_query_budget is not None:
+            self.assertTrue(len(queries) <= self.page_query_budget,
+                "%s page took %s queries, over its budget of %s"%(self.itemType.__name__,len(queries),self.page_query_budget))
+
+        # More statuses don't mean more queries
+        for ra in ras[1:]:
+            register(ra)
+        self.client.get(self.get_page(self.item1))
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(self.get_page(self.item1))
+        for ra in ras:
+            self.assertContains(response,ra.name)
+        self.assertEqual(len(more_queries),len(queries))
+
+class LoggedInViewConceptPages(PageQueryBudget,utils.LoggedInViewPages):
     defaults = {}
     def setUp(self):
         super(LoggedInViewConceptPages, self).setUp()
@@ -297,6 +353,8 @@ class LoggedInViewConceptPages(utils.LoggedInViewPages):
 class ObjectClassViewPage(LoggedInViewConceptPages,TestCase):
     url_name='objectClass'
     itemType=models.ObjectClass
+    # Lists its data element concepts
+    page_query_budget = page_queries(models.ObjectClass,listed=1)
     def test_browse(self):
         self.logout()
         response = self.client.get(reverse('aristotle:browse'))
@@ -308,12 +366,16 @@ class ObjectClassViewPage(LoggedInViewConceptPages,TestCase):
 class PropertyViewPage(LoggedInViewConceptPages,TestCase):
     url_name='property'
     itemType=models.Property
+    # Only lists its data element concepts if it has any
+    page_query_budget = page_queries(models.Property)
 class UnitOfMeasureViewPage(LoggedInViewConceptPages,TestCase):
     url_name='unitOfMeasure'
     itemType=models.UnitOfMeasure
+    page_query_budget = page_queries(models.UnitOfMeasure)
 class ValueDomainViewPage(LoggedInViewConceptPages,TestCase):
     url_name='valueDomain'
     itemType=models.ValueDomain
+    page_query_budget = page_queries(models.ValueDomain)
     def setUp(self):
         super(ValueDomainViewPage, self).setUp()
 
@@ -413,15 +475,51 @@ class ValueDomainViewPage(LoggedInViewConceptPages,TestCase):
         for sv in self.item1.supplementaryvalue_set.all():
             self.assertContains(response,sv.meaning,1)
 
+class DataTypePageQueryBudget(PageQueryBudget,utils.LoggedInViewPages,TestCase):
+    itemType=models.DataType
+    page_query_budget = page_queries(models.DataType)
+    def setUp(self):
+        super(DataTypePageQueryBudget, self).setUp()
+        self.item1 = self.itemType.objects.create(name="Test Item 1 (visible to tested viewers)",description=" ",workgroup=self.wg1)
+class PackagePageQueryBudget(PageQueryBudget,utils.LoggedInViewPages,TestCase):
+    itemType=models.Package
+    # Counts its items, then lists them with their subclasses as they aren't prefetched
+    page_query_budget = page_queries(models.Package,listed=2)
+    def setUp(self):
+        super(PackagePageQueryBudget, self).setUp()
+        self.item1 = self.itemType.objects.create(name="Test Item 1 (visible to tested viewers)",description=" ",workgroup=self.wg1)
+    def make_page_related_items(self):
+        for i in range(3):
+            self.item1.items.add(models.ObjectClass.objects.create(name="OC %s"%i,description="",workgroup=self.wg1))
 class ConceptualDomainViewPage(LoggedInViewConceptPages,TestCase):
     url_name='conceptualDomain'
     itemType=models.ConceptualDomain
+    # Lists its data element concepts and value domains
+    page_query_budget = page_queries(models.ConceptualDomain,listed=2)
 class DataElementConceptViewPage(LoggedInViewConceptPages,TestCase):
     url_name='dataElementConcept'
     itemType=models.DataElementConcept
+    # Lists its data elements
+    page_query_budget = page_queries(models.DataElementConcept,listed=1)
 class DataElementViewPage(LoggedInViewConceptPages,TestCase):
     url_name='dataElement'
     itemType=models.DataElement
+    # The extension_test app lists the questions collecting it
+    page_query_budget = page_queries(models.DataElement,listed=1)
+    def make_page_related_items(self):
+        oc = models.ObjectClass.objects.create(name="OC",description="",workgroup=self.wg1)
+        pr = models.Property.objects.create(name="Prop",description="",workgroup=self.wg1)
+        self.item1.dataElementConcept = models.DataElementConcept.objects.create(
+            name="DEC",description="",workgroup=self.wg1,objectClass=oc,property=pr)
+        self.item1.valueDomain = models.ValueDomain.objects.create(name="VD",description="",workgroup=self.wg1)
+        self.item1.save()
+        for i in range(4):
+            models.PermissibleValue.objects.create(
+                value=i,meaning="test permissible meaning %d"%i,order=i,valueDomain=self.item1.valueDomain
+                )
+        for item in [oc,pr,self.item1.dataElementConcept]:
+            models.Status.objects.create(concept=item,registrationAuthority=self.ra,
+                registrationDate=datetime.date(2000,1,1),state=models.STATES.candidate)
 
 class DataElementDerivationViewPage(LoggedInViewConceptPages,TestCase):
     url_name='dataelementderivation'
@@ -429,6 +527,7 @@ class DataElementDerivationViewPage(LoggedInViewConceptPages,TestCase):
     def defaults(self):
         return {'derives':models.DataElement.objects.create(name='derivedDE',description="",workgroup=self.wg1)}
     itemType=models.DataElementDerivation
+    page_query_budget = page_queries(models.DataElementDerivation)
 
 class LoggedInViewUnmanagedPages(utils.LoggedInViewPages):
     defaults = {}
@@ -1,8 +1,11 @@
 from __future__ import print_function
+import datetime
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.test import TestCase
-from django.test.utils import setup_test_environment
+from django.test.utils import override_settings, setup_test_environment
+from django.utils.six import StringIO
 from django.utils.translation import ugettext_lazy as _
 
 from model_utils import Choices
@@ -161,6 +164,107 @@ class RegistryGroupPermissions(TestCase):
         user = User.objects.get(pk=user.pk)
         self.assertFalse(perms.user_is_registrar(user,ra))
 
+class UserPrincipalTests(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        self.wg1 = models.Workgroup.objects.create(name="Test WG 1")
+        self.wg2 = models.Workgroup.objects.create(name="Test WG 2")
+        self.wg2.registrationAuthorities.add(self.ra)
+        self.user = User.objects.create_user('user','','user')
+        self.wg1.giveRoleToUser('submitter',self.user)
+        self.wg2.giveRoleToUser('viewer',self.user)
+        self.wg2.giveRoleToUser('manager',self.user)
+        self.ra.giveRoleToUser('registrar',self.user)
+        self.user = User.objects.get(pk=self.user.pk)
+
+    def test_principal_contents(self):
+        principal = perms.get_principal(self.user)
+        self.assertEqual(principal.workgroup_ids,set([self.wg1.pk,self.wg2.pk]))
+        self.assertEqual(principal.submitter_workgroup_ids,set([self.wg1.pk]))
+        self.assertEqual(principal.viewer_workgroup_ids,set([self.wg2.pk]))
+        self.assertEqual(principal.manager_workgroup_ids,set([self.wg2.pk]))
+        self.assertEqual(principal.steward_workgroup_ids,set())
+        self.assertEqual(principal.editor_workgroup_ids,set([self.wg1.pk]))
+        self.assertEqual(principal.registrar_authority_ids,set([self.ra.pk]))
+
+    def test_principal_is_built_once(self):
+        with self.assertNumQueries(2):
+            self.assertTrue(perms.user_is_editor(self.user))
+            self.assertTrue(perms.user_is_editor(self.user,self.wg1))
+            self.assertFalse(perms.user_is_editor(self.user,self.wg2))
+            self.assertTrue(perms.user_is_registrar(self.user))
+            self.assertTrue(perms.user_is_registrar(self.user,self.ra))
+            self.assertTrue(perms.user_is_workgroup_manager(self.user,self.wg2))
+            self.assertFalse(perms.user_is_workgroup_manager(self.user,self.wg1))
+            self.assertTrue(perms.user_in_workgroup(self.user,self.wg1))
+            self.assertTrue(self.wg2.can_view(self.user))
+        self.assertTrue(perms.get_principal(self.user) is perms.get_principal(self.user))
+
+    def test_role_changes_clear_principal(self):
+        wg3 = models.Workgroup.objects.create(name="Test WG 3")
+        self.assertFalse(perms.user_in_workgroup(self.user,wg3))
+        wg3.giveRoleToUser('steward',self.user)
+        self.assertTrue(perms.user_in_workgroup(self.user,wg3))
+        self.assertTrue(perms.user_is_editor(self.user,wg3))
+        wg3.removeRoleFromUser('steward',self.user)
+        self.assertFalse(perms.user_in_workgroup(self.user,wg3))
+
+    def test_anonymous_principal(self):
+        from django.contrib.auth.models import AnonymousUser
+        principal = perms.get_principal(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertEqual(principal.workgroup_ids,set())
+            self.assertEqual(principal.registrar_authority_ids,set())
+
+class BatchPermissionTests(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        self.wg1 = models.Workgroup.objects.create(name="Test WG 1")
+        self.wg2 = models.Workgroup.objects.create(name="Test WG 2")
+        self.wg1.registrationAuthorities.add(self.ra)
+        self.submitter = User.objects.create_user('suzie','','submitter')
+        self.wg1.giveRoleToUser('submitter',self.submitter)
+        self.submitter = User.objects.get(pk=self.submitter.pk)
+        self.items = [models.ObjectClass.objects.create(name="OC %s"%i,workgroup=self.wg1) for i in range(5)]
+        self.items += [models.ObjectClass.objects.create(name="OC %s"%i,workgroup=self.wg2) for i in range(5)]
+        models.Status.objects.create(
+            concept=self.items[0],
+            registrationAuthority=self.ra,
+            registrationDate=datetime.date(2000,1,1),
+            state=self.ra.locked_state
+            )
+
+    def test_many_matches_single_checks(self):
+        items = list(models._concept.objects.filter(pk__in=[i.pk for i in self.items]))
+        self.assertEqual(
+            perms.user_can_view_many(self.submitter,items),
+            set(i.pk for i in items if perms.user_can_view(self.submitter,i))
+        )
+        self.assertEqual(
+            perms.user_can_edit_many(self.submitter,items),
+            set(i.pk for i in items if perms.user_can_edit(self.submitter,i))
+        )
+        self.assertEqual(perms.user_can_view_many(self.submitter,items),set(i.pk for i in self.items[:5]))
+        self.assertEqual(perms.user_can_edit_many(self.submitter,items),set(i.pk for i in self.items[1:5]))
+
+    def test_many_takes_one_query(self):
+        qs = models.ObjectClass.objects.all()
+        # Don't count building the principal
+        principal = perms.get_principal(self.submitter)
+        principal.workgroup_roles, principal.registrar_authority_ids
+        with self.assertNumQueries(1):
+            perms.user_can_view_many(self.submitter,self.items)
+        with self.assertNumQueries(1):
+            perms.user_can_edit_many(self.submitter,qs)
+
+    def test_anonymous_and_superuser(self):
+        from django.contrib.auth.models import AnonymousUser
+        su = User.objects.create_superuser('super','','user')
+        self.assertEqual(perms.user_can_view_many(AnonymousUser(),self.items),set())
+        self.assertEqual(perms.user_can_edit_many(AnonymousUser(),self.items),set())
+        with self.assertNumQueries(0):
+            self.assertEqual(perms.user_can_edit_many(su,self.items),set(i.pk for i in self.items))
+
 class UserEditTesting(TestCase):
     def test_canViewProfile(self):
         u1 = User.objects.create_user('user1','','user1')
@@ -345,6 +449,130 @@ class CustomConceptQuerySetTest_RegistrationOwned_Slow(CustomConceptQuerySetTest
 class CustomConceptQuerySetTest_RegistryOwned_Slow(CustomConceptQuerySetTest_Slow,TestCase):
     workgroup_owner_type = models.WORKGROUP_OWNERSHIP.authority
 
+class VisibleQuerySetTests(TestCase):
+    def setUp(self):
+        self.ras = [models.RegistrationAuthority.objects.create(name="Test RA %s"%i) for i in range(3)]
+        self.wg = models.Workgroup.objects.create(name="Test WG")
+        self.other_wg = models.Workgroup.objects.create(name="Other WG")
+        self.wg.registrationAuthorities.add(*self.ras)
+        self.registrar = User.objects.create_user('reggie','','registrar')
+        for ra in self.ras:
+            ra.registrars.add(self.registrar)
+        self.registered = models.ObjectClass.objects.create(name="Registered",workgroup=self.wg)
+        self.ready = models.ObjectClass.objects.create(name="Ready",workgroup=self.wg,readyToReview=True)
+        self.hidden = models.ObjectClass.objects.create(name="Hidden",workgroup=self.wg)
+        self.elsewhere = models.ObjectClass.objects.create(name="Elsewhere",workgroup=self.other_wg,readyToReview=True)
+        for ra in self.ras:
+            models.Status.objects.create(
+                concept=self.registered,registrationAuthority=ra,
+                registrationDate=datetime.date(2000,1,1),state=models.STATES.incomplete
+                )
+            models.Status.objects.create(
+                concept=self.elsewhere,registrationAuthority=ra,
+                registrationDate=datetime.date(2000,1,1),state=models.STATES.incomplete
+                )
+
+    def test_visible_has_no_duplicates_and_matches_joins(self):
+        from aristotle_mdr.management.commands.benchmark_visibility import visible_with_joins
+        items = models.ObjectClass.objects.filter(name__in=["Registered","Ready","Hidden","Elsewhere"])
+        visible = list(items.visible(self.registrar).values_list('pk',flat=True))
+        self.assertEqual(sorted(visible),sorted([self.registered.pk,self.ready.pk]))
+        joined = list(visible_with_joins(items,self.registrar).values_list('pk',flat=True))
+        self.assertEqual(set(visible),set(joined))
+        self.assertTrue(len(joined) > len(visible))
+
+@override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,USE_VISIBILITY_TABLE=True))
+class VisibilityTableTests(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        self.wg1 = models.Workgroup.objects.create(name="Test WG 1")
+        self.wg2 = models.Workgroup.objects.create(name="Test WG 2")
+        self.wg1.registrationAuthorities.add(self.ra)
+        self.viewer = User.objects.create_user('vicky','','viewer')
+        self.registrar = User.objects.create_user('reggie','','registrar')
+        self.wg1.giveRoleToUser('viewer',self.viewer)
+        self.ra.giveRoleToUser('registrar',self.registrar)
+        self.oc1 = models.ObjectClass.objects.create(name="Test OC1",workgroup=self.wg1)
+        self.oc2 = models.ObjectClass.objects.create(name="Test OC2",workgroup=self.wg2)
+
+    def visible(self,user):
+        # Other tests leave public items behind, so only look at the ones made here.
+        items = models.ObjectClass.objects.filter(pk__in=[self.oc1.pk,self.oc2.pk])
+        return set(items.visible(user).values_list('pk',flat=True))
+
+    def assertMatchesJoins(self,user):
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,USE_VISIBILITY_TABLE=False)):
+            legacy = self.visible(user)
+        self.assertEqual(self.visible(user),legacy)
+
+    def test_table_follows_changes(self):
+        self.assertEqual(self.visible(self.viewer),set([self.oc1.pk]))
+        self.assertEqual(self.visible(self.registrar),set())
+
+        self.oc1.readyToReview = True
+        self.oc1.save()
+        self.assertEqual(self.visible(self.registrar),set([self.oc1.pk]))
+
+        self.oc2.workgroup = self.wg1
+        self.oc2.save()
+        self.assertEqual(self.visible(self.viewer),set([self.oc1.pk,self.oc2.pk]))
+
+        models.Status.objects.create(
+            concept=self.oc2,
+            registrationAuthority=self.ra,
+            registrationDate=datetime.date(2000,1,1),
+            state=models.STATES.incomplete
+            )
+        self.assertEqual(self.visible(self.registrar),set([self.oc1.pk,self.oc2.pk]))
+
+        self.wg1.registrationAuthorities.remove(self.ra)
+        self.assertEqual(self.visible(self.registrar),set())
+        self.ra.workgroups.add(self.wg1)
+        self.assertEqual(self.visible(self.registrar),set([self.oc1.pk,self.oc2.pk]))
+        self.ra.workgroups.clear()
+        self.assertEqual(self.visible(self.registrar),set())
+
+        for user in [self.viewer,self.registrar]:
+            self.assertMatchesJoins(user)
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        self.oc2.readyToReview = True
+        self.oc2.save()
+        self.wg2.registrationAuthorities.add(self.ra)
+        grants = models.ConceptVisibility.objects.filter(concept__in=[self.oc1,self.oc2])
+        expected = set(grants.values_list('concept','workgroup','registrationAuthority'))
+        self.assertTrue((self.oc2.pk,None,self.ra.pk) in expected)
+
+        models.ConceptVisibility.objects.all().delete()
+        self.assertEqual(self.visible(self.viewer),set())
+        call_command('rebuild_visibility',batch_size=1,stdout=StringIO())
+        self.assertEqual(set(grants.values_list('concept','workgroup','registrationAuthority')),expected)
+        for user in [self.viewer,self.registrar]:
+            self.assertMatchesJoins(user)
+
+    def test_failed_rebuild_keeps_table(self):
+        from django.core.management import call_command
+        from aristotle_mdr.management.commands import rebuild_visibility
+        expected = set(models.ConceptVisibility.objects.values_list('concept','workgroup','registrationAuthority'))
+        self.assertTrue(expected)
+
+        class Interrupted(Exception):
+            pass
+        rebuilt = []
+        def rebuild(concepts):
+            if rebuilt:
+                raise Interrupted
+            rebuilt.append(concepts)
+            models.rebuild_concept_visibility(concepts)
+        rebuild_visibility.rebuild_concept_visibility = rebuild
+        try:
+            with self.assertRaises(Interrupted):
+                call_command('rebuild_visibility',batch_size=1,stdout=StringIO())
+        finally:
+            rebuild_visibility.rebuild_concept_visibility = models.rebuild_concept_visibility
+        self.assertEqual(set(models.ConceptVisibility.objects.values_list('concept','workgroup','registrationAuthority')),expected)
+
 class RegistryCascadeTest(TestCase):
     def test_superuser_DataElementConceptCascade(self):
         user = User.objects.create_superuser('super','','user')
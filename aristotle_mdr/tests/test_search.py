@@ -7,6 +7,7 @@ from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.test.utils import override_settings
+from django.utils import timezone
 
 from django.test.utils import setup_test_environment
 setup_test_environment()
@@ -257,3 +258,506 @@ class TestTokenSearch(TestCase):
         objs = response.context['page'].object_list
         self.assertEqual(len(objs),1)
         self.assertTrue(objs[0].object.name,"Power")
+
+    def test_token_type_lookup(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from aristotle_mdr.concept_types import get_concept_types
+        from aristotle_mdr.forms.search import PermissionSearchForm
+
+        types = get_concept_types()
+        self.assertEqual(types.find('dec'),(models.DataElementConcept,))
+        self.assertEqual(types.find('data_element'),(models.DataElement,))
+        self.assertEqual(types.find('Object-Class'),(models.ObjectClass,))
+        self.assertEqual(types.find('workgroup'),())
+        self.assertEqual(types.get('aristotle_mdr.property'),models.Property)
+        self.assertTrue(models.Workgroup in types.models)
+        self.assertFalse(models.Workgroup in types.concepts)
+
+        form = PermissionSearchForm({'q':'power type:property type:oc','models':['aristotle_mdr.property']})
+        self.assertTrue(form.is_valid())
+        with CaptureQueriesContext(connection) as queries:
+            form.prepare_tokens()
+        self.assertFalse(any('django_content_type' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(form.models,[models.Property,models.ObjectClass])
+        self.assertEqual(form.query_text,"power")
+        self.assertEqual(form.get_models(),[models.Property])
+
+class QueuedSearchIndexing(TestCase):
+    def setUp(self):
+        import haystack
+        from aristotle_mdr.signals import QueuedSignalProcessor, flush_search_queue
+        haystack.connections.reload('default')
+        haystack.signal_processor.teardown()
+        self.processor = QueuedSignalProcessor(haystack.connections,haystack.connection_router)
+        flush_search_queue() # Start with an empty queue
+
+        self.ra = models.RegistrationAuthority.objects.create(name="Kelly Act")
+        self.registrar = User.objects.create_user('stryker','','mutantsMustDie')
+        self.ra.giveRoleToUser('registrar',self.registrar)
+        self.wg = models.Workgroup.objects.create(name="X Men")
+        self.wg.registrationAuthorities.add(self.ra)
+
+    def tearDown(self):
+        import haystack
+        self.processor.teardown()
+        haystack.signal_processor.setup()
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def search(self,name):
+        from haystack.query import SearchQuerySet
+        return SearchQuerySet().filter(name=name)
+
+    def test_changes_are_queued_once_and_flushed(self):
+        from django.utils.six import StringIO
+        oc = models.ObjectClass.objects.create(name="mutant",workgroup=self.wg,readyToReview=True)
+        pr = models.Property.objects.create(name="power",workgroup=self.wg,readyToReview=True)
+        dec = models.DataElementConcept.objects.create(name="mutant power",workgroup=self.wg,
+                objectClass=oc,property=pr,readyToReview=True)
+        self.ra.register(dec,models.STATES.standard,self.registrar,cascade=True)
+        dec.save()
+
+        # Each item is only queued once, however often it changed
+        self.assertEqual(models.SearchQueueEntry.objects.count(),3)
+        self.assertEqual(self.search("mutant").count(),0)
+
+        call_command('flush_search_queue',stdout=StringIO())
+        self.assertFalse(models.SearchQueueEntry.objects.exists())
+        self.assertEqual(self.search("mutant").count(),2)
+        self.assertEqual(self.search("mutant power")[0].is_public,True)
+
+        dec.delete()
+        self.assertEqual(models.SearchQueueEntry.objects.filter(remove=True).count(),1)
+        call_command('flush_search_queue',stdout=StringIO())
+        self.assertEqual(self.search("mutant").count(),1)
+
+    def test_request_finished_flushes_the_queue(self):
+        from django.core.signals import request_finished
+        models.ObjectClass.objects.create(name="cyclops",workgroup=self.wg)
+        self.assertEqual(self.search("cyclops").count(),0)
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(self.search("cyclops").count(),1)
+        self.assertFalse(models.SearchQueueEntry.objects.exists())
+
+    def test_queue_is_flushed_after_the_max_lag(self):
+        from django.conf import settings
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,SEARCH_QUEUE_MAX_LAG=-1)):
+            models.ObjectClass.objects.create(name="storm",workgroup=self.wg)
+            self.assertEqual(self.search("storm").count(),0)
+            models.ObjectClass.objects.create(name="iceman",workgroup=self.wg)
+        self.assertEqual(self.search("storm").count(),1)
+        self.assertFalse(models.SearchQueueEntry.objects.exists())
+
+class IndexQueries(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Kelly Act")
+        self.wg = models.Workgroup.objects.create(name="X Men")
+        self.wg.registrationAuthorities.add(self.ra)
+        self.count = 0
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def make_items(self,count):
+        for i in range(count):
+            self.count += 1
+            oc = models.ObjectClass.objects.create(name="oc %s"%self.count,workgroup=self.wg,readyToReview=True)
+            pr = models.Property.objects.create(name="pr %s"%self.count,workgroup=self.wg)
+            vd = models.ValueDomain.objects.create(name="vd %s"%self.count,workgroup=self.wg)
+            dec = models.DataElementConcept.objects.create(name="dec %s"%self.count,workgroup=self.wg,objectClass=oc,property=pr)
+            de = models.DataElement.objects.create(name="de %s"%self.count,workgroup=self.wg,dataElementConcept=dec,valueDomain=vd)
+            self.ra._register(de,models.STATES.standard,timezone.now(),"")
+            self.ra._register(oc,models.STATES.candidate,timezone.now(),"")
+        models._concept.objects.all().recache_states()
+        models._concept.objects.all().recache_registration_summary()
+
+    def prepare_all(self,index):
+        return [index.full_prepare(obj) for obj in index.index_queryset()]
+
+    def test_index_queryset_is_not_n_plus_one(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from aristotle_mdr.search_indexes import DataElementIndex, DataElementConceptIndex, ObjectClassIndex
+        self.make_items(2)
+        for index_class in [DataElementIndex, DataElementConceptIndex, ObjectClassIndex]:
+            index = index_class()
+            self.prepare_all(index) # Fill the caches
+            with CaptureQueriesContext(connection) as few:
+                self.prepare_all(index)
+            self.make_items(3)
+            with CaptureQueriesContext(connection) as many:
+                prepared = self.prepare_all(index)
+            self.assertEqual(len(few),len(many),index_class)
+
+        oc = [p for p in self.prepare_all(ObjectClassIndex()) if p['name'] == 'oc 1'][0]
+        self.assertEqual(oc['registrationAuthorities'],[str(self.ra.pk)])
+        self.assertEqual(oc['workgroup'],self.wg.pk)
+        self.assertTrue('Candidate' in oc['text'])
+
+    def test_update_search_index_is_not_n_plus_one(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from aristotle_mdr.signals import update_search_index
+        self.make_items(2)
+        update_search_index(models._concept.objects.values_list('pk',flat=True)) # Fill the caches
+        with CaptureQueriesContext(connection) as few:
+            update_search_index(models._concept.objects.values_list('pk',flat=True))
+        self.make_items(3)
+        with CaptureQueriesContext(connection) as many:
+            update_search_index(models._concept.objects.values_list('pk',flat=True))
+        self.assertEqual(len(few),len(many))
+
+class ReindexCommand(TestCase):
+    def setUp(self):
+        import haystack
+        haystack.connections.reload('default')
+        self.wg = models.Workgroup.objects.create(name="X Men")
+        self.items = [
+            models.ObjectClass.objects.create(name="xman %s"%i,workgroup=self.wg)
+            for i in range(7)
+        ]
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def search(self):
+        from haystack.query import SearchQuerySet
+        return SearchQuerySet().filter(name="xman")
+
+    def reindex(self,**kwargs):
+        from django.utils.six import StringIO
+        out = StringIO()
+        call_command('reindex_search',stdout=out,batch_size=3,**kwargs)
+        return out.getvalue()
+
+    def test_reindex_all_models(self):
+        self.assertEqual(self.search().count(),0)
+        output = self.reindex()
+        self.assertEqual(self.search().count(),7)
+        self.assertTrue('aristotle_mdr.ObjectClass: 7 items' in output)
+        state = models.SearchIndexState.objects.get(content_type__model='objectclass')
+        self.assertEqual(state.rebuild_last_pk,self.items[-1].pk)
+        self.assertTrue(state.rebuild_finished is not None)
+
+    def test_interrupted_reindex_resumes(self):
+        from django.contrib.contenttypes.models import ContentType
+        models.SearchIndexState.objects.create(
+            using='default',content_type=ContentType.objects.get_for_model(models.ObjectClass),
+            rebuild_started=timezone.now(),rebuild_last_pk=self.items[2].pk
+        )
+        output = self.reindex()
+        self.assertTrue('aristotle_mdr.ObjectClass: 4 items' in output)
+        self.assertEqual(self.search().count(),4)
+
+        # A finished run starts again from the beginning
+        output = self.reindex()
+        self.assertTrue('aristotle_mdr.ObjectClass: 7 items' in output)
+        self.assertEqual(self.search().count(),7)
+
+    def test_clear_removes_deleted_items(self):
+        import haystack
+        self.reindex()
+        # Delete an item without the index being told, so its document is left behind.
+        haystack.signal_processor.teardown()
+        try:
+            self.items[0].delete()
+        finally:
+            haystack.signal_processor.setup()
+        self.assertEqual(self.search().count(),7)
+        self.reindex(clear=True)
+        self.assertEqual(self.search().count(),6)
+
+    def test_incremental_update(self):
+        import haystack
+        import aristotle_mdr
+        self.reindex()
+        ra = models.RegistrationAuthority.objects.create(name="X Registry")
+        # Make changes without the index being told, so only the catch-up run sees them.
+        haystack.signal_processor.teardown()
+        try:
+            self.items[0].name = "xman renamed"
+            self.items[0].save()
+            deleted = self.items[1].pk
+            self.items[1].delete()
+            models.ObjectClass.objects.create(name="xman new",workgroup=self.wg)
+            with aristotle_mdr.bulk_mode():
+                models.Status.objects.create(
+                    concept=self.items[2],registrationAuthority=ra,
+                    registrationDate=timezone.now().date(),state=ra.public_state
+                )
+        finally:
+            haystack.signal_processor.setup()
+        self.assertEqual(self.search().filter(name="renamed").count(),0)
+
+        output = self.reindex(incremental=True)
+        self.assertTrue('aristotle_mdr.ObjectClass: 3 items updated and 1 removed' in output)
+        self.assertEqual(self.search().count(),7)
+        self.assertEqual(self.search().filter(name="renamed").count(),1)
+        self.assertEqual(self.search().filter(statuses=models.STATES[ra.public_state]).count(),1)
+        # Removals are only kept until every connection has caught up.
+        self.assertFalse(models.SearchIndexRemoval.objects.filter(object_id=deleted).exists())
+
+        output = self.reindex(incremental=True)
+        self.assertTrue('aristotle_mdr.ObjectClass: 0 items updated and 0 removed' in output)
+
+    def test_removals_are_only_recorded_once_indexed(self):
+        # Without a reindex_search run nothing would ever prune them.
+        self.items[0].delete()
+        self.assertFalse(models.SearchIndexRemoval.objects.exists())
+        self.reindex()
+        deleted = self.items[1].pk
+        self.items[1].delete()
+        self.assertEqual(
+            list(models.SearchIndexRemoval.objects.values_list('object_id',flat=True)),
+            [deleted]
+        )
+
+
+class SearchBackendQueries(utils.LoggedInViewPages):
+    def setUp(self):
+        super(SearchBackendQueries, self).setUp()
+        import haystack
+        haystack.connections.reload('default')
+        self.ra = models.RegistrationAuthority.objects.create(name="Kelly Act")
+        self.registrar = User.objects.create_user('stryker','william.styker@weaponx.mil','mutantsMustDie')
+        self.ra.giveRoleToUser('registrar',self.registrar)
+        self.xmen_wg = models.Workgroup.objects.create(name="X Men")
+        self.xmen_wg.registrationAuthorities.add(self.ra)
+        self.item_xmen = [
+            models.ObjectClass.objects.create(name=t,description="known xman",workgroup=self.xmen_wg,readyToReview=True)
+            for t in "professorX cyclops iceman angel beast".split()
+        ]
+        for item in self.item_xmen:
+            self.ra.register(item,models.STATES.standard,self.registrar)
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def count_backend_searches(self,*queries):
+        from haystack import connections
+        backend = connections['default'].get_backend()
+        searches = []
+        def search(*args,**kwargs):
+            searches.append(args)
+            return search.original(*args,**kwargs)
+        search.original = backend.search
+        backend.search = search
+        try:
+            responses = [self.client.get(reverse('aristotle:search'),query) for query in queries]
+        finally:
+            del backend.search
+        return len(searches),responses
+
+class SearchResultCache(SearchBackendQueries,TestCase):
+    def test_repeated_search_uses_cache(self):
+        self.logout()
+        searches,responses = self.count_backend_searches({'q':'xman'})
+        self.assertTrue(searches > 0)
+        self.assertEqual(len(responses[0].context['page'].object_list),5)
+
+        searches,responses = self.count_backend_searches({'q':'xman'},{'q':'  xman ','page':1})
+        self.assertEqual(searches,0)
+        for response in responses:
+            self.assertEqual(
+                sorted(r.object.pk for r in response.context['page'].object_list),
+                sorted(i.pk for i in self.item_xmen)
+            )
+
+        # A different sort order is a different search
+        searches,responses = self.count_backend_searches({'q':'xman','sort':'aa'})
+        self.assertTrue(searches > 0)
+
+    def test_index_updates_invalidate_cache(self):
+        self.logout()
+        self.count_backend_searches({'q':'xman'})
+        cable = models.ObjectClass.objects.create(name="cable",description="known xman",workgroup=self.xmen_wg,readyToReview=True)
+        self.ra.register(cable,models.STATES.standard,self.registrar)
+        searches,responses = self.count_backend_searches({'q':'xman'})
+        self.assertTrue(searches > 0)
+        self.assertTrue(cable.pk in [r.object.pk for r in responses[0].context['page'].object_list])
+
+    def test_cache_is_per_permissions(self):
+        dp = models.ObjectClass.objects.create(name="deadpool",description="not really an xman",workgroup=self.xmen_wg,readyToReview=True)
+        self.logout()
+        searches,responses = self.count_backend_searches({'q':'deadpool'})
+        self.assertEqual(len(responses[0].context['page'].object_list),0)
+
+        self.client.post(reverse('django.contrib.auth.views.login'),{'username': 'stryker', 'password': 'mutantsMustDie'})
+        searches,responses = self.count_backend_searches({'q':'deadpool'})
+        self.assertTrue(searches > 0)
+        self.assertEqual([r.object.pk for r in responses[0].context['page'].object_list],[dp.pk])
+
+    def test_cache_can_be_turned_off(self):
+        from django.conf import settings
+        self.logout()
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,SEARCH_RESULT_CACHE_TIMEOUT=0)):
+            self.count_backend_searches({'q':'xman'})
+            searches,responses = self.count_backend_searches({'q':'xman'})
+        self.assertTrue(searches > 0)
+
+class SearchPipeline(SearchBackendQueries,TestCase):
+    def setUp(self):
+        from django.conf import settings
+        super(SearchPipeline, self).setUp()
+        self.no_cache = override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,SEARCH_RESULT_CACHE_TIMEOUT=0))
+        self.no_cache.enable()
+        self.logout()
+
+    def tearDown(self):
+        self.no_cache.disable()
+        super(SearchPipeline, self).tearDown()
+
+    def test_search_runs_once(self):
+        searches,responses = self.count_backend_searches({'q':'xman'})
+        self.assertEqual(searches,1)
+        self.assertEqual(responses[0].context['page'].paginator.count,5)
+        self.assertEqual(
+            list(responses[0].context['form'].search_timings.keys()),
+            ['build','execute','spelling']
+        )
+
+    def test_auto_correct_runs_one_more_search(self):
+        searches,responses = self.count_backend_searches({'q':'cyclopz'})
+        self.assertEqual(searches,2)
+        form = responses[0].context['form']
+        self.assertTrue(form.auto_correct_spell_search)
+        self.assertEqual(form.spelling_suggestions,[('cyclopz','cyclops')])
+        self.assertTrue('correct' in form.search_timings)
+        self.assertEqual(
+            [r.object.pk for r in responses[0].context['page'].object_list],
+            [self.item_xmen[1].pk]
+        )
+
+    def test_auto_broaden_runs_one_more_search(self):
+        searches,responses = self.count_backend_searches({'q':'cyclops','state':models.STATES.retired})
+        self.assertEqual(searches,2)
+        form = responses[0].context['form']
+        self.assertTrue(form.auto_broaden_search)
+        self.assertEqual(
+            [r.object.pk for r in responses[0].context['page'].object_list],
+            [self.item_xmen[1].pk]
+        )
+
+    def test_no_results_without_suggestions_runs_once(self):
+        searches,responses = self.count_backend_searches({'q':'qqqqqqqqqqqq'})
+        self.assertEqual(searches,1)
+        self.assertEqual(len(responses[0].context['page'].object_list),0)
+
+
+    def test_facet_counts_come_with_results(self):
+        models.ObjectClass.objects.create(name="deadpool",description="not really an xman",workgroup=self.xmen_wg)
+        searches,responses = self.count_backend_searches({'q':'xman'})
+        self.assertEqual(searches,1)
+        form = responses[0].context['form']
+        # The unregistered item can't be seen, so isn't counted.
+        self.assertEqual(form.facets['django_ct'],[('aristotle_mdr.objectclass',5)])
+        self.assertEqual(form.facets['statuses'],[('Standard',5)])
+        self.assertEqual([(str(wg),n) for wg,n in form.facets['workgroup']],[(str(self.xmen_wg.pk),5)])
+        self.assertTrue((self.ra.pk,"Kelly Act (5)") in form.fields['ra'].choices)
+        self.assertTrue(('aristotle_mdr.objectclass','Object Classes (5)') in form.fields['models'].choices)
+
+class SQLiteFTSBackend(SearchBackendQueries,TestCase):
+    def setUp(self):
+        import shutil, tempfile
+        import haystack
+        from django.conf import settings
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree,self.directory)
+        self.whoosh = haystack.connections.connections_info['default']
+        haystack.connections.connections_info['default'] = {
+            'ENGINE': 'aristotle_mdr.search_backends.sqlite_fts.SQLiteFTSEngine',
+            'PATH': self.directory+'/index.sqlite3',
+            'INCLUDE_SPELLING': True,
+            'SILENTLY_FAIL': False,
+        }
+        self.no_cache = override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS,SEARCH_RESULT_CACHE_TIMEOUT=0))
+        self.no_cache.enable()
+        super(SQLiteFTSBackend, self).setUp()
+
+    def tearDown(self):
+        import haystack
+        super(SQLiteFTSBackend, self).tearDown()
+        self.no_cache.disable()
+        haystack.connections.connections_info['default'] = self.whoosh
+        haystack.connections.reload('default')
+
+    def search(self,user=None):
+        from aristotle_mdr.forms.search import PermissionSearchQuerySet
+        return PermissionSearchQuerySet().apply_permission_checks(user)
+
+    def test_search_with_facets(self):
+        self.logout()
+        models.ObjectClass.objects.create(name="deadpool",description="not really an xman",workgroup=self.xmen_wg)
+        searches,responses = self.count_backend_searches({'q':'xman'})
+        self.assertEqual(searches,1)
+        self.assertEqual(
+            sorted(r.object.pk for r in responses[0].context['page'].object_list),
+            sorted(i.pk for i in self.item_xmen)
+        )
+        form = responses[0].context['form']
+        self.assertEqual(form.facets['django_ct'],[('aristotle_mdr.objectclass',5)])
+        self.assertEqual(form.facets['statuses'],[('Standard',5)])
+        self.assertEqual(form.facets['workgroup'],[(self.xmen_wg.pk,5)])
+        self.assertTrue((self.ra.pk,"Kelly Act (5)") in form.fields['ra'].choices)
+
+    def test_permission_checks(self):
+        deadpool = models.ObjectClass.objects.create(name="deadpool",description="not really an xman",workgroup=self.xmen_wg,readyToReview=True)
+        viewer = User.objects.create_user('viewer','','viewer')
+        self.xmen_wg.giveRoleToUser('viewer',viewer)
+        outsider = User.objects.create_user('outsider','','outsider')
+
+        self.assertEqual(len(self.search().auto_query('deadpool')),0)
+        self.assertEqual(len(self.search(outsider).auto_query('deadpool')),0)
+        for user in [viewer,self.registrar]:
+            self.assertEqual([r.pk for r in self.search(user).auto_query('deadpool')],[str(deadpool.pk)])
+        self.assertEqual(len(self.search(viewer).auto_query('xman -deadpool')),5)
+        self.assertEqual(len(self.search(viewer).auto_query('"really an xman"')),1)
+
+    def test_filters_and_sorting(self):
+        from aristotle_mdr.forms.search import PermissionSearchQuerySet
+        beast = self.item_xmen[4]
+        self.ra.register(beast,models.STATES.retired,self.registrar)
+        sqs = PermissionSearchQuerySet()
+        self.assertEqual([r.pk for r in sqs.filter(statuses__in=['Retired'])],[str(beast.pk)])
+        self.assertEqual([r.pk for r in sqs.filter(ra_statuses="%s___%s"%(self.ra.pk,models.STATES.retired))],[str(beast.pk)])
+        self.assertEqual(len(sqs.filter(highest_state__gte=models.STATES.standard)),4)
+        self.assertEqual(len(sqs.filter(created__gte=timezone.now().date())),5)
+        self.assertEqual(len(sqs.filter(created__lt=timezone.now().date())),0)
+        self.assertEqual(
+            [r.name for r in sqs.auto_query('xman').order_by('name')],
+            sorted(i.name for i in self.item_xmen)
+        )
+        self.assertEqual(len(sqs.models(models.Property).auto_query('xman')),0)
+        result = sqs.auto_query('cyclops')[0]
+        self.assertEqual(result.workgroup,self.xmen_wg.pk)
+        self.assertEqual(result.statuses,['Standard'])
+
+    def test_spelling(self):
+        from haystack import connections
+        self.logout()
+        backend = connections['default'].get_backend()
+        self.assertEqual(backend.create_spelling_suggestion('cyclopz xman'),'cyclops xman')
+        self.assertEqual(backend.create_spelling_suggestion('qqqqqqqqqqqq'),'qqqqqqqqqqqq')
+
+        searches,responses = self.count_backend_searches({'q':'cyclopz'})
+        self.assertEqual(searches,2)
+        form = responses[0].context['form']
+        self.assertTrue(form.auto_correct_spell_search)
+        self.assertEqual(
+            [r.object.pk for r in responses[0].context['page'].object_list],
+            [self.item_xmen[1].pk]
+        )
+
+    def test_remove_and_clear(self):
+        from haystack import connections
+        backend = connections['default'].get_backend()
+        angel = self.item_xmen[3]
+        angel.delete()
+        self.assertEqual(len(self.search(self.su).auto_query('angel')),0)
+        self.assertEqual(backend.create_spelling_suggestion('angle'),'angle')
+        self.assertEqual(len(self.search(self.su).auto_query('xman')),4)
+
+        backend.clear(models=[models.ObjectClass])
+        self.assertEqual(len(self.search(self.su).auto_query('xman')),0)
+        self.assertEqual(backend.spelling_suggestions(['cyclopz']),{})
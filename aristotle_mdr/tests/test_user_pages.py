@@ -88,6 +88,22 @@ class UserHomePages(utils.LoggedInViewPages,TestCase):
         self.assertEqual(response.status_code,200)
         self.logout()
 
+    def test_workgroup_member_counts(self):
+        archived = models.Workgroup.objects.create(name="Old WG",archived=True)
+        archived.viewers.add(self.viewer)
+        archived.submitters.add(self.editor)
+        self.login_viewer()
+
+        response = self.client.get(reverse('aristotle:userWorkgroups',))
+        self.assertEqual(response.status_code,200)
+        counts = dict((wg.pk,wg.num_members) for wg in response.context['workgroups'])
+        self.assertEqual(counts,{self.wg1.pk:3})
+
+        response = self.client.get(reverse('aristotle:user_workgroups_archives',))
+        self.assertEqual(response.status_code,200)
+        counts = dict((wg.pk,wg.num_members) for wg in response.context['workgroups'])
+        self.assertEqual(counts,{archived.pk:2})
+
 class UserDashRecentItems(utils.LoggedInViewPages,TestCase):
     def setUp(self):
         super(UserDashRecentItems, self).setUp()
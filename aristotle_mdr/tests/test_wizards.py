@@ -89,6 +89,14 @@ class ConceptWizardPage(utils.LoggedInViewPages):
         response = self.client.get(self.wizard_url)
         self.assertEqual(response.status_code,200)
 
+    def test_registration_summary_is_not_editable(self):
+        from aristotle_mdr.forms import wizards
+        summary = ['_is_public','_is_locked','_is_registered','_is_retired','_highest_state','_registration_states']
+        for form_class in [wizards.subclassed_modelform(self.model),wizards.subclassed_wizard_2_Results(self.model)]:
+            form = form_class(user=self.editor)
+            for field in summary:
+                self.assertFalse(field in form.fields)
+
     def test_editor_can_make_object(self):
         self.login_editor()
         step_1_data = {
@@ -153,6 +161,7 @@ class ValueDomainWizardPage(ConceptWizardPage,TestCase):
 #    model=models.DataElement
 
 class DataElementConceptWizardPage(ConceptWizardPage,TestCase):
+    model=models.DataElementConcept
     wizard_url_name="createDataElementConcept"
     wizard_form_name="data_element_concept_wizard"
     @property
@@ -365,6 +374,7 @@ class DataElementConceptWizardPage(ConceptWizardPage,TestCase):
 
 
 class DataElementWizardPage(ConceptWizardPage,TestCase):
+    model=models.DataElement
     wizard_url_name="createDataElement"
     wizard_form_name="data_element_wizard"
     @property
@@ -53,6 +53,70 @@ class WorkgroupMembership(TestCase):
         self.assertFalse(perms.user_can_edit(user1,wg))
         self.assertFalse(perms.user_can_edit(user2,wg))
 
+class WorkgroupMembershipTable(TestCase):
+    def setUp(self):
+        self.wg = models.Workgroup.objects.create(name="Test WG 1")
+        self.user = User.objects.create_user('editor1','','editor1')
+
+    def roles(self,wg=None):
+        membership = models.WorkgroupMembership.objects.filter(workgroup=wg or self.wg,user=self.user).first()
+        return membership.role_names if membership else []
+
+    def test_roles_follow_the_role_relations(self):
+        self.wg.viewers.add(self.user)
+        self.wg.stewards.add(self.user)
+        self.assertEqual(self.roles(),['viewer','steward'])
+        self.wg.viewers.remove(self.user)
+        self.assertEqual(self.roles(),['steward'])
+        self.wg.stewards.clear()
+        self.assertEqual(self.roles(),[])
+        self.assertFalse(self.user.workgroup_memberships.exists())
+
+    def test_roles_follow_changes_from_the_user(self):
+        wg2 = models.Workgroup.objects.create(name="Test WG 2")
+        self.user.submitter_in.add(self.wg,wg2)
+        self.user.workgroup_manager_in.add(wg2)
+        self.assertEqual(self.roles(),['submitter'])
+        self.assertEqual(self.roles(wg2),['submitter','manager'])
+        self.user.submitter_in.clear()
+        self.assertEqual(self.roles(),[])
+        self.assertEqual(self.roles(wg2),['manager'])
+        self.wg.giveRoleToUser('viewer',self.user)
+        self.wg.removeUser(self.user)
+        wg2.removeUser(self.user)
+        self.assertFalse(self.user.workgroup_memberships.exists())
+
+    def test_members_and_workgroups_are_single_queries(self):
+        wg2 = models.Workgroup.objects.create(name="Test WG 2")
+        other = User.objects.create_user('editor2','','editor2')
+        for role in ['viewer','submitter','steward','manager']:
+            self.wg.giveRoleToUser(role,self.user)
+        self.wg.giveRoleToUser('viewer',other)
+        wg2.giveRoleToUser('steward',self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(u.pk for u in self.wg.members),sorted([self.user.pk,other.pk]))
+        self.assertEqual(self.wg.members.count(),2)
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(wg.pk for wg in self.user.profile.workgroups),sorted([self.wg.pk,wg2.pk]))
+
+    def test_principal_reads_the_membership_table(self):
+        self.wg.giveRoleToUser('submitter',self.user)
+        self.wg.giveRoleToUser('manager',self.user)
+        user = User.objects.get(pk=self.user.pk)
+        principal = perms.get_principal(user)
+        with self.assertNumQueries(1):
+            self.assertEqual(principal.workgroup_ids,frozenset([self.wg.pk]))
+        self.assertEqual(principal.editor_workgroup_ids,frozenset([self.wg.pk]))
+        self.assertEqual(principal.manager_workgroup_ids,frozenset([self.wg.pk]))
+        self.assertEqual(principal.viewer_workgroup_ids,frozenset())
+
+    def test_rebuild_workgroup_memberships(self):
+        self.wg.giveRoleToUser('viewer',self.user)
+        self.wg.giveRoleToUser('steward',self.user)
+        models.WorkgroupMembership.objects.all().delete()
+        models.rebuild_workgroup_memberships()
+        self.assertEqual(self.roles(),['viewer','steward'])
+
 class WorkgroupAnonTests(utils.LoggedInViewPages,TestCase):
     def setUp(self):
         super(WorkgroupAnonTests, self).setUp()
@@ -1,13 +1,13 @@
 import datetime
-from django.apps import apps
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
+from django.db.models import Count
 from django.shortcuts import render, redirect
 
 from aristotle_mdr import forms as MDRForms
+from aristotle_mdr.concept_types import get_concept_types
 from aristotle_mdr import models as MDR
 from aristotle_mdr.views.utils import paginated_list, paginated_reversion_list
 
@@ -47,26 +47,20 @@ def admin_tools(request):
     if not request.user.is_superuser:
         raise PermissionDenied
 
-    aristotle_apps = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('CONTENT_EXTENSIONS',[])
-    aristotle_apps += ["aristotle_mdr"]
-
-    from django.contrib.contenttypes.models import ContentType
-    models = ContentType.objects.filter(app_label__in=aristotle_apps).all()
+    concept_types = get_concept_types()
     model_stats = {}
 
-    for m in models:
-        if issubclass(m.model_class(),MDR._concept) and not m.model.startswith("_"):
-            # Only output subclasses of 11179 concept
-            app_models = model_stats.get(m.app_label,{'app':None,'models':[]})
-            if app_models['app'] is None:
-                app_models['app'] = getattr(apps.get_app_config(m.app_label),'verbose_name')
-            app_models['models'].append(
-                    (m.model_class(),
-                     get_cached_object_count(m),
-                     reverse("admin:%s_%s_changelist" % (m.app_label, m.model))
-                    )
-                )
-            model_stats[m.app_label] = app_models
+    for app_label,models in concept_types.by_app():
+        # Only output subclasses of 11179 concept
+        model_stats[app_label] = {
+            'app': concept_types.app_name(app_label),
+            'models': [
+                (model,
+                 get_cached_object_count(model),
+                 reverse("admin:%s_%s_changelist" % (model._meta.app_label, model._meta.model_name))
+                ) for model in models
+            ]
+        }
 
     page = render(request,"aristotle_mdr/user/userAdminTools.html",
             {"item":request.user,"models":model_stats})
@@ -77,11 +71,7 @@ def admin_stats(request):
     if not request.user.is_superuser:
         raise PermissionDenied
 
-    aristotle_apps = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('CONTENT_EXTENSIONS',[])
-    aristotle_apps += ["aristotle_mdr"]
-
-    from django.contrib.contenttypes.models import ContentType
-    models = ContentType.objects.filter(app_label__in=aristotle_apps).all()
+    concept_types = get_concept_types()
     model_stats = {}
 
     # Get datetime objects for '7 days ago' and '30 days ago'
@@ -90,44 +80,42 @@ def admin_stats(request):
     mod_counts = [] # used to get the maximum count
 
     use_cache = True # We still cache but its much, much shorter
-    for m in models:
-        if issubclass(m.model_class(),MDR._concept) and not m.model.startswith("_"):
-            # Only output subclasses of 11179 concept
-            app_models = model_stats.get(m.app_label,{'app':None,'models':[]})
-            if app_models['app'] is None:
-                app_models['app'] = getattr(apps.get_app_config(m.app_label),'verbose_name')
+    for app_label,models in concept_types.by_app():
+        # Only output subclasses of 11179 concept
+        app_models = {'app':concept_types.app_name(app_label),'models':[]}
+        for model in models:
             if use_cache:
                 total   = get_cached_query_count(
-                        qs=m.model_class().objects,
-                        key=model_to_cache_key(m)+"__all_time",
+                        qs=model.objects,
+                        key=model_to_cache_key(model)+"__all_time",
                         ttl=60
                         )
                 t7_val  = get_cached_query_count(
-                        qs=m.model_class().objects.filter(created__gte=t7),
-                        key=model_to_cache_key(m)+"__t7",
+                        qs=model.objects.filter(created__gte=t7),
+                        key=model_to_cache_key(model)+"__t7",
                         ttl=60
                         )
                 t30_val = get_cached_query_count(
-                        qs=m.model_class().objects.filter(created__gte=t30),
-                        key=model_to_cache_key(m)+"__t30",
+                        qs=model.objects.filter(created__gte=t30),
+                        key=model_to_cache_key(model)+"__t30",
                         ttl=60
                         )
             else:
-                total   = m.model_class().objects.count()
-                t7_val  = m.model_class().objects.filter(created__gte=t7).count()
-                t30_val = m.model_class().objects.filter(created__gte=t30).count()
+                total   = model.objects.count()
+                t7_val  = model.objects.filter(created__gte=t7).count()
+                t30_val = model.objects.filter(created__gte=t30).count()
 
             mod_counts.append(total)
             app_models['models'].append(
-                    (m.model_class(),
+                    (model,
                      {  'all_time': total,
                         't7':t7_val,
                         't30':t30_val
                      },
-                     reverse("admin:%s_%s_changelist" % (m.app_label, m.model))
+                     reverse("admin:%s_%s_changelist" % (model._meta.app_label, model._meta.model_name))
                     )
                 )
-            model_stats[m.app_label] = app_models
+        model_stats[app_label] = app_models
 
     page = render(request,"aristotle_mdr/user/userAdminStats.html",
             {"item":request.user,"model_stats":model_stats,'model_max':max(mod_counts)})
@@ -140,12 +128,12 @@ def get_cached_query_count(qs,key,ttl):
         cache.set(key, count, ttl)
     return count
 
-def model_to_cache_key(model_type):
-    return 'aristotle_adminpage_object_count_%s_%s'%(model_type.app_label, model_type.model)
+def model_to_cache_key(model):
+    return 'aristotle_adminpage_object_count_%s_%s'%(model._meta.app_label, model._meta.model_name)
 
-def get_cached_object_count(model_type):
-    CACHE_KEY = model_to_cache_key(model_type)
-    query = model_type.model_class().objects
+def get_cached_object_count(model):
+    CACHE_KEY = model_to_cache_key(model)
+    query = model.objects
     return get_cached_query_count(query,CACHE_KEY, 60*60*12) # Cache for 12 hours
 
 
@@ -196,12 +184,19 @@ def review_list(request):
     context={}
     return paginated_list(request,items,"aristotle_mdr/user/userReadyForReview.html",context)
 
+def with_member_counts(workgroups):
+    # The user's workgroups are filtered on their own membership, so the members
+    # are counted on a fresh queryset rather than the filtered join.
+    return MDR.Workgroup.objects.filter(pk__in=workgroups.values('pk')).annotate(num_members=Count('memberships'))
+
 @login_required
 def workgroups(request):
-    page = render(request,"aristotle_mdr/user/userWorkgroups.html")
+    workgroups = with_member_counts(request.user.profile.myWorkgroups)
+    page = render(request,"aristotle_mdr/user/userWorkgroups.html",{'workgroups':workgroups})
     return page
 
 @login_required
 def workgroup_archives(request):
-    page = render(request,"aristotle_mdr/user/userWorkgroupArchives.html")
+    workgroups = with_member_counts(request.user.profile.workgroups.filter(archived=True))
+    page = render(request,"aristotle_mdr/user/userWorkgroupArchives.html",{'workgroups':workgroups})
     return page
@@ -18,8 +18,9 @@ import datetime
 import reversion
 from reversion.revisions import default_revision_manager
 
-from aristotle_mdr.perms import user_can_view, user_can_edit, user_can_change_status
+from aristotle_mdr.perms import user_can_view, user_can_edit, user_can_edit_many, user_can_change_status
 from aristotle_mdr import perms
+from aristotle_mdr.concept_types import get_concept_types
 from aristotle_mdr.utils import cache_per_item_user, concept_to_dict, construct_change_message, url_slugify_concept
 from aristotle_mdr import forms as MDRForms
 from aristotle_mdr import models as MDR
@@ -130,7 +131,9 @@ def concept(*args,**kwargs):
 
 @cache_per_item_user(ttl=300, cache_post=False)
 def render_if_condition_met(request,condition,objtype,iid,model_slug=None,name_slug=None,subpage=None):
-    item = get_object_or_404(objtype,pk=iid).item
+    item = MDR.load_concept_page(iid,objtype)
+    if item is None:
+        raise Http404
     if item._meta.model_name != model_slug or not slugify(item.name).startswith(str(name_slug)):
         return redirect(url_slugify_concept(item))
     if not condition(request.user, item):
@@ -145,7 +148,7 @@ def render_if_condition_met(request,condition,objtype,iid,model_slug=None,name_s
     last_edit = default_revision_manager.get_for_object_reference(
             item.__class__,
             item.pk,
-        ).first()
+        ).select_related('revision__user').first()
 
     default_template = "%s/concepts/%s.html"%(item.__class__._meta.app_label,item.__class__._meta.model_name)
     template = select_template([default_template,item.template])
@@ -256,24 +259,14 @@ def create_list(request):
     if not perms.user_is_editor(request.user):
         raise PermissionDenied
 
-    aristotle_apps = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('CONTENT_EXTENSIONS',[])
-    aristotle_apps += ["aristotle_mdr"]
-
-    from django.contrib.contenttypes.models import ContentType
-    models = ContentType.objects.filter(app_label__in=aristotle_apps).all()
+    concept_types = get_concept_types()
     out = {}
-
-    for m in models:
-        if issubclass(m.model_class(),MDR._concept) and not m.model.startswith("_"):
-            # Only output subclasses of 11179 concept
-            app_models = out.get(m.app_label,{'app':None,'models':[]})
-            if app_models['app'] is None:
-                try:
-                    app_models['app'] = getattr(apps.get_app_config(m.app_label),'verbose_name')
-                except:
-                    app_models['app'] = "No name" # Where no name is configured in the app_config, set a dummy so we don't keep trying
-            app_models['models'].append((m,m.model_class()))
-            out[m.app_label] = app_models
+    for app_label,models in concept_types.by_app():
+        # Only output subclasses of 11179 concept
+        out[app_label] = {
+            'app': concept_types.app_name(app_label),
+            'models': [(model._meta,model) for model in models],
+        }
 
     return render(request,"aristotle_mdr/create/create_list.html",
         {'models':out,}
@@ -311,18 +304,7 @@ def allRegistrationAuthorities(request):
         )
 
 def about_all_items(request):
-
-    aristotle_apps = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('CONTENT_EXTENSIONS',[])
-    aristotle_apps += ["aristotle_mdr"]
-
-    from django.contrib.contenttypes.models import ContentType
-    models = ContentType.objects.filter(app_label__in=aristotle_apps).all()
-    out = {}
-    for m in models:
-        if not m.model.startswith("_"):
-            app_models = out.get(m.app_label,[])
-            app_models.append(m.model_class())
-            out[m.app_label] = app_models
+    out = dict(get_concept_types().by_app(concepts_only=False))
 
     return render(request,"aristotle_mdr/static/all_items.html",{'models':out,})
 
@@ -368,8 +350,7 @@ def changeStatus(request, iid):
             changeDetails = form.cleaned_data['changeDetails']
             if regDate is None:
                 regDate = timezone.now().date()
-            for ra in ras:
-                ra.register(item,state,request.user,regDate,cascade,changeDetails)
+            MDR.register_items(ras,[item],state,request.user,regDate,cascade,changeDetails)
             return HttpResponseRedirect(url_slugify_concept(item))
     else:
         form = MDRForms.ChangeStatusForm(user=request.user)
@@ -417,11 +398,13 @@ def deprecate(request, iid):
             #  Everything that was in the returned set, but isn't already superseded
             #  Everything left over can stay the same, as its already superseded
             #    or wasn't superseded and is staying that way.
-            for i in item.supersedes.all():
-                if i not in form.cleaned_data['olderItems'] and user_can_edit(request.user,i):
+            superseded = list(item.supersedes.all())
+            editable = user_can_edit_many(request.user,superseded+list(form.cleaned_data['olderItems']))
+            for i in superseded:
+                if i not in form.cleaned_data['olderItems'] and i.pk in editable:
                     item.supersedes.remove(i)
             for i in form.cleaned_data['olderItems']:
-                if user_can_edit(request.user,i): #Would check item.supersedes but its a set
+                if i.pk in editable: #Would check item.supersedes but its a set
                     item.supersedes.add(i)
             return HttpResponseRedirect(url_slugify_concept(item))
     else:
@@ -590,9 +573,14 @@ def bulk_action(request):
             else:
                 # we need a confirmation, render the next form
                 form = actions[action](request.POST,user=request.user,items=items)
+            preview = None
+            if request.POST.get("preview",None) and hasattr(form,'preview_changes') and form.is_valid():
+                # Show what would be changed, without changing anything.
+                preview = form.preview_changes()
             return render(request,actions[action].confirm_page,
                     {"items":items,
                      "form":form,
+                     "preview":preview,
                      "next":url
                         }
                     )